@@ -0,0 +1,397 @@
+"""Read-only JSON API over the twin analysis dataset.
+
+Serves the same data the dashboard shows, so other tools don't have to scrape
+the Streamlit UI:
+
+    GET /pairs?query=&twin=&grade=&min_score=&max_score=&offset=0&limit=50
+    GET /analyses/<analysis_id>
+    GET /profiles/<patient_id>
+    GET /profiles/<patient_id>/samples/<sample_id>/variants
+    GET /profiles/<patient_id>/timeline?type=&start=&stop=
+    GET /profiles/<patient_id>/timeline?type=progression&during=treatment&line=2&label=
+    GET /search?q=&limit=20
+
+Every response carries an ETag and honours If-None-Match, and bodies are
+gzip-compressed when the client accepts it. A gzipped body's ETag ends in
+-gz, so caches never confuse it with the identity one.
+
+Usage:
+    python api_server.py --port 8502
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from utils.data_loader import load_twin_analyses, load_patient_profiles, analysis_id, build_pair_summary
+from utils.profile_store import get_sample, get_clinical_profile
+from utils.normalize import normalize_profile
+from utils.timeline import EVENT_SOURCES
+from utils.validation import validate_directory
+from utils.pairs import dedupe_analyses
+from utils.search import load_search_index, highlight_snippet
+from utils.memory import GOVERNOR
+
+MAX_PAGE_SIZE = 500
+GZIP_MIN_BYTES = 1024
+# Rendered bodies are cached up to this many bytes in total; larger bodies only keep their ETag
+RENDER_CACHE_MB = 64
+MAX_CACHED_BODY = 1024 * 1024
+
+
+class Dataset:
+    """Loaded analyses and profiles plus the lookup indexes the API needs."""
+
+    def __init__(self, analyses, patient_profiles, search_key):
+        analyses, self.pair_index = dedupe_analyses(analyses)
+        self.analyses = {analysis_id(a): a for a in analyses}
+        self.search_index = load_search_index(analyses, search_key)
+        self.patient_profiles = patient_profiles
+        self.summary = build_pair_summary(analyses).sort_values(
+            ['query_patient_id', 'rank'], kind='stable').reset_index(drop=True)
+
+
+class NotFound(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _param(params, name, cast=str, default=None):
+    values = params.get(name)
+    if not values or values[0] == '':
+        return default
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise BadRequest(f"Invalid value for '{name}': {values[0]}")
+
+
+def list_pairs(dataset, params):
+    df = dataset.summary
+    query = _param(params, 'query')
+    twin = _param(params, 'twin')
+    grade = _param(params, 'grade')
+    min_score = _param(params, 'min_score', float)
+    max_score = _param(params, 'max_score', float)
+    offset = max(_param(params, 'offset', int, 0), 0)
+    limit = min(max(_param(params, 'limit', int, 50), 1), MAX_PAGE_SIZE)
+
+    mask = None
+    for condition in (
+        df['query_patient_id'] == query if query else None,
+        df['twin_id'] == twin if twin else None,
+        df['grade'] == grade if grade else None,
+        df['similarity_score'] >= min_score if min_score is not None else None,
+        df['similarity_score'] <= max_score if max_score is not None else None,
+    ):
+        if condition is not None:
+            mask = condition if mask is None else mask & condition
+    if mask is not None:
+        df = df[mask]
+
+    page = df.iloc[offset:offset + limit]
+    return {
+        'total': len(df),
+        'offset': offset,
+        'limit': limit,
+        # to_json turns NaN into null, which json.dumps would not
+        'items': json.loads(page.to_json(orient='records')),
+    }
+
+
+def search_analyses(dataset, params):
+    q = _param(params, 'q')
+    if not q:
+        raise BadRequest("Missing search text 'q'")
+    limit = min(max(_param(params, 'limit', int, 20), 1), MAX_PAGE_SIZE)
+    items = []
+    for key, score in dataset.search_index.search(q, limit=limit):
+        a = dataset.analyses[key]
+        field, snippet = highlight_snippet(a, q)
+        items.append({
+            'analysis_id': key,
+            'query_patient_id': a.get('query_patient_id'),
+            'twin_id': a.get('twin_id'),
+            'score': round(score, 4),
+            'field': field,
+            'snippet': snippet,
+        })
+    return {'q': q, 'items': items}
+
+
+def get_analysis(dataset, key):
+    if key not in dataset.analyses:
+        raise NotFound(f"Unknown analysis: {key}")
+    return dict(dataset.analyses[key])
+
+
+def get_profile(dataset, patient_id):
+    if patient_id not in dataset.patient_profiles:
+        raise NotFound(f"Unknown patient: {patient_id}")
+    return dataset.patient_profiles[patient_id]
+
+
+def get_sample_variants(dataset, patient_id, sample_id):
+    if patient_id not in dataset.patient_profiles:
+        raise NotFound(f"Unknown patient: {patient_id}")
+    # Reads just this sample when profiles are loaded lazily
+    sample = get_sample(dataset.patient_profiles, patient_id, sample_id)
+    if sample is None:
+        raise NotFound(f"Unknown sample for {patient_id}: {sample_id}")
+    return {
+        'patient_id': patient_id,
+        'sample_id': sample_id,
+        'mutations': sample.get('mutations', []),
+        'copy_number_alterations': sample.get('copy_number_alterations', []),
+        'structural_variants': sample.get('structural_variants', []),
+    }
+
+
+def get_timeline(dataset, patient_id, params):
+    """A patient's dated events, optionally those overlapping a day range or another kind of event."""
+    if patient_id not in dataset.patient_profiles:
+        raise NotFound(f"Unknown patient: {patient_id}")
+    event_type = _param(params, 'type')
+    during = _param(params, 'during')
+    for name, value in (('type', event_type), ('during', during)):
+        if value is not None and value not in EVENT_SOURCES:
+            raise BadRequest(f"Invalid value for '{name}': {value}")
+    start = _param(params, 'start', float)
+    stop = _param(params, 'stop', float)
+    timeline = normalize_profile(get_clinical_profile(dataset.patient_profiles, patient_id))['events']
+    if during is not None:
+        if event_type is None:
+            raise BadRequest("'during' needs an event 'type'")
+        where = {}
+        if _param(params, 'line') is not None:
+            where['line_number'] = _param(params, 'line', float)
+        if _param(params, 'label') is not None:
+            where['label'] = _param(params, 'label')
+        events = timeline.concurrent(event_type, during, **where)
+    elif start is not None or stop is not None:
+        events = timeline.overlapping(start if start is not None else stop, stop, event_type=event_type)
+    else:
+        events = timeline.events[timeline.select(event_type)]
+    return {
+        'patient_id': patient_id,
+        'events': json.loads(events.astype({'event_type': str}).to_json(orient='records')),
+    }
+
+
+def route(dataset, path, params):
+    parts = [unquote(p) for p in path.strip('/').split('/') if p]
+    if parts == ['pairs']:
+        return list_pairs(dataset, params)
+    if parts == ['search']:
+        return search_analyses(dataset, params)
+    if len(parts) == 2 and parts[0] == 'analyses':
+        return get_analysis(dataset, parts[1])
+    if len(parts) == 2 and parts[0] == 'profiles':
+        return get_profile(dataset, parts[1])
+    if len(parts) == 3 and parts[0] == 'profiles' and parts[2] == 'timeline':
+        return get_timeline(dataset, parts[1], params)
+    if len(parts) == 5 and parts[0] == 'profiles' and parts[2] == 'samples' and parts[4] == 'variants':
+        return get_sample_variants(dataset, parts[1], parts[3])
+    raise NotFound(f"Unknown endpoint: {path}")
+
+
+class RenderCache:
+    """Rendered responses per URL, bounded by bytes and accounted with the memory governor.
+
+    Bodies over `max_body` bytes (full profiles can be hundreds of MB) keep
+    only their ETag, which is still enough to answer If-None-Match.
+    """
+
+    def __init__(self, max_bytes, max_body=MAX_CACHED_BODY):
+        self.max_bytes = max_bytes
+        self.max_body = max_body
+        self._data = OrderedDict()  # url -> ((body, gzipped, etag), nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._memory = GOVERNOR.register("api responses", self._evict)
+
+    def get(self, url):
+        with self._lock:
+            if url not in self._data:
+                return None
+            self._data.move_to_end(url)
+            GOVERNOR.touch(self._memory, url)
+            return self._data[url][0]
+
+    def put(self, url, body, gzipped, etag):
+        if len(body) > self.max_body:
+            body = gzipped = None
+        nbytes = len(url) + len(etag) + len(body or b'') + len(gzipped or b'')
+        dropped = []
+        with self._lock:
+            self._drop(url)
+            self._data[url] = ((body, gzipped, etag), nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._data) > 1:
+                old_url = next(iter(self._data))
+                self._drop(old_url)
+                dropped.append(old_url)
+        for old_url in dropped:
+            GOVERNOR.release(self._memory, old_url)
+        # Outside the lock: the governor may call _evict right away
+        GOVERNOR.account(self._memory, url, nbytes=nbytes)
+
+    def _drop(self, url):
+        entry = self._data.pop(url, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _evict(self, url):
+        with self._lock:
+            self._drop(url)
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip, honouring q-values ('gzip;q=0' refuses it)."""
+    gzip_q = wildcard_q = None
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ('gzip', 'x-gzip'):
+            gzip_q = q
+        elif coding == '*':
+            wildcard_q = q
+    q = gzip_q if gzip_q is not None else wildcard_q
+    return q is not None and q > 0
+
+
+def gzip_etag(etag):
+    """ETag of the gzipped body whose identity body has `etag`: a different representation needs its own."""
+    return etag[:-1] + '-gz"'
+
+
+def make_handler(dataset, cache_mb=RENDER_CACHE_MB):
+    """Builds a request handler bound to `dataset`.
+
+    The dataset is read-only, so serialized bodies and their ETags are cached
+    per URL and repeated requests cost a dictionary lookup.
+    """
+    cache = RenderCache(int(cache_mb * 2 ** 20))
+
+    def render(url):
+        cached = cache.get(url)
+        if cached is not None and cached[0] is not None:
+            return cached
+        parts = urlsplit(url)
+        payload = route(dataset, parts.path, parse_qs(parts.query))
+        body = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        cache.put(url, body, gzipped, etag)
+        return body, gzipped, etag
+
+    def cached_etag(url, accept_gzip):
+        cached = cache.get(url)
+        if cached is None:
+            return None
+        body, gzipped, etag = cached
+        # Bodies too large to keep are well over GZIP_MIN_BYTES, so they were gzipped too
+        return gzip_etag(etag) if accept_gzip and (gzipped is not None or body is None) else etag
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "TwinAnalysisAPI/1.0"
+
+        def do_GET(self):
+            if_none_match = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+            accept_gzip = accepts_gzip(self.headers.get('Accept-Encoding', ''))
+            # A known ETag answers a revalidation without rendering the body again
+            etag = cached_etag(self.path, accept_gzip)
+            if etag is not None and etag in if_none_match:
+                return self._send_not_modified(etag)
+            try:
+                body, gzipped, etag = render(self.path)
+            except NotFound as e:
+                return self._send_error(404, str(e))
+            except BadRequest as e:
+                return self._send_error(400, str(e))
+            except Exception as e:
+                self.log_error("Error serving %s: %r", self.path, e)
+                return self._send_error(500, "Internal server error")
+
+            use_gzip = gzipped is not None and accept_gzip
+            if use_gzip:
+                etag = gzip_etag(etag)
+            if etag in if_none_match:
+                return self._send_not_modified(etag)
+
+            payload = gzipped if use_gzip else body
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_not_modified(self, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+
+        def _send_error(self, status, message):
+            body = json.dumps({'error': message}).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the twin analysis dataset as a read-only JSON API.")
+    parser.add_argument('--analyses-dir', default="final_twin_analysis_2")
+    parser.add_argument('--profiles-dir', default="patient_profiles_2")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    analyses_report = validate_directory(args.analyses_dir, "analysis")
+    profiles_report = validate_directory(args.profiles_dir, "profile")
+    for report in (analyses_report, profiles_report):
+        if report.rejected:
+            print(f"Skipping {len(report.rejected)} invalid {report.kind} file(s), see {report.report_path}")
+    dataset = Dataset(load_twin_analyses(args.analyses_dir, exclude=analyses_report.rejected),
+                      load_patient_profiles(args.profiles_dir, lazy=True, exclude=profiles_report.rejected),
+                      os.path.abspath(args.analyses_dir))
+    print(f"Loaded {len(dataset.analyses)} analyses and {len(dataset.patient_profiles)} profiles")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(dataset))
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,187 +1,193 @@
+import os
 import streamlit as st
-from views import analysis_detail, deep_dive, genomics_deep_dive
+from views import (analysis_detail, leaderboard, deep_dive, genomics_deep_dive, treatment_patterns,
+                   cna_landscape, memory_usage)
+from views.styles import apply_styles
 from utils.data_loader import load_twin_analyses, load_patient_profiles
+from utils.validation import validate_directory
+from utils.partitions import PartitionedDataset, is_partitioned_root
+from utils.pairs import dedupe_analyses
+from utils.search import load_search_index
+from utils.cohort import build_treatment_matrices
+from utils.memory import GOVERNOR
+from utils.shared_dataset import SharedDataset
+from utils.snapshot import directory_fingerprints, load_snapshot, save_snapshot
+from utils.ingest import DeltaIngestor, JOURNAL_FILENAME, DEFAULT_POLL_SECONDS, journal_size
+from utils.cna_matrix import load_cna_matrix
+from utils.profile_builder import is_raw_directory, load_raw_profiles
+from utils.disk_cache import combine_digests
+from utils.profile_store import get_content_digest
 
 st.set_page_config(page_title="Twin Analysis Dashboard", layout="wide")
 
-st.markdown("""
-    <style>
-        /* Global Settings */
-        .block-container {
-            padding-top: 1rem;
-            padding-bottom: 1rem;
-            padding-left: 2rem;
-            padding-right: 2rem;
-        }
-        
-        /* Typography */
-        h1, h2, h3 {
-            color: #0F172A;
-            font-family: 'Inter', sans-serif;
-        }
-        p, div, span {
-            color: #334155;
-            font-family: 'Inter', sans-serif;
-        }
-
-        /* Card Styling */
-        .stCard {
-            background-color: white;
-            padding: 1.5rem;
-            border-radius: 12px;
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-            margin-bottom: 1rem;
-            border: 1px solid #E2E8F0;
-        }
-
-        /* Blue Banner */
-        .blue-banner {
-            background-color: #EFF6FF;
-            padding: 1rem 1.5rem;
-            border-radius: 8px;
-            border: 1px solid #DBEAFE;
-            margin-bottom: 1.5rem;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        .blue-banner-text {
-            color: #1E40AF;
-            font-weight: bold;
-            font-size: 0.95rem;
-        }
-        .blue-banner-label {
-            color: #60A5FA;
-            font-weight: bold;
-            font-size: 0.85rem;
-            margin-right: 0.25rem;
-        }
-
-        /* Metric Cards */
-        .metric-card {
-            border-radius: 10px;
-            padding: 1.5rem;
-            text-align: center;
-            height: 100%;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-        }
-        .metric-value {
-            font-size: 1.8rem;
-            font-weight: 700;
-            margin-bottom: 0.25rem;
-        }
-        .metric-label {
-            font-size: 0.85rem;
-            font-weight: 500;
-        }
-        
-        /* Green Metric */
-        .bg-green-50 { background-color: #F0FDF4; }
-        .text-green-600 { color: #16A34A; }
-        
-        /* Blue Metric */
-        .bg-blue-50 { background-color: #EFF6FF; }
-        .text-blue-600 { color: #2563EB; }
-        
-        /* Purple Metric */
-        .bg-purple-50 { background-color: #FAF5FF; }
-        .text-purple-600 { color: #9333EA; }
-        
-        /* Orange Metric */
-        .bg-orange-50 { background-color: #FFF7ED; }
-        .text-orange-600 { color: #EA580C; }
-
-        /* Pills */
-        .pill-container {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 0.75rem;
-            margin-top: 0.5rem;
-            margin-bottom: 1rem;
-        }
-        .pill {
-            padding: 0.5rem 1rem;
-            border-radius: 6px;
-            font-size: 0.9rem;
-            font-weight: 500;
-        }
-        .pill-green {
-            background-color: #F0FDF4;
-            color: #166534;
-            border: 1px solid #DCFCE7;
-        }
-        .pill-purple {
-            background-color: #FAF5FF;
-            color: #6B21A8;
-            border: 1px solid #F3E8FF;
-        }
-
-        /* Checklist */
-        .checklist-item {
-            display: flex;
-            align-items: start;
-            margin-bottom: 0.5rem;
-            font-size: 0.95rem;
-            color: #475569;
-        }
-        .check-icon {
-            color: #3B82F6;
-            margin-right: 0.75rem;
-            margin-top: 0.1rem;
-        }
-
-        /* Section Headers */
-        .section-header {
-            display: flex;
-            align-items: center;
-            font-size: 1.1rem;
-            font-weight: 600;
-            color: #1E293B;
-            margin-bottom: 1rem;
-        }
-        .section-icon {
-            margin-right: 0.5rem;
-            font-size: 1.2rem;
-        }
-        
-        /* Sidebar */
-        [data-testid="stSidebar"] {
-            background-color: #F8FAFC;
-            border-right: 1px solid #E2E8F0;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# Load Data
-@st.cache_data
-def get_data():
-    analyses = load_twin_analyses("final_twin_analysis_2")
-    patient_profiles = load_patient_profiles("patient_profiles_2")
-    return analyses, patient_profiles
-
-try:
-    analyses, patient_profiles = get_data()
-except FileNotFoundError as e:
-    st.error(f"Error loading data: {e}")
-    st.stop()
+# Linked rather than inlined, so reruns don't resend the CSS
+apply_styles()
 
 # Sidebar Navigation
 st.sidebar.title("Navigation")
 if "navigation" not in st.session_state:
     st.session_state.navigation = "Analysis Detail"
 
-# Ensure valid page selection if state was previously Overview
-if st.session_state.navigation == "Overview":
+pages = ["Analysis Detail", "Twin Leaderboard", "Clinical Deep Dive", "Genomics Deep Dive", "Treatment Patterns",
+         "CNA Landscape"]
+# Debug pages are listed when the app is opened with ?debug=1
+if st.query_params.get("debug") == "1":
+    pages.append("Memory Usage")
+
+# Ensure valid page selection if state was previously Overview (or a debug page)
+if st.session_state.navigation not in pages:
     st.session_state.navigation = "Analysis Detail"
 
-page = st.sidebar.radio("Go to", ["Analysis Detail", "Clinical Deep Dive", "Genomics Deep Dive"], key="navigation")
+page = st.sidebar.radio("Go to", pages, key="navigation")
+
+# Load Data
+# Either a root holding the two data directories, or a partitioned root with a catalog.json
+DATA_ROOT = os.environ.get("TWIN_DATA_ROOT", ".")
+# Raw clinical and genomics tables to build profiles from, instead of the profile JSON files
+RAW_DATA = os.environ.get("TWIN_RAW_DATA")
+
+def load_data(analyses_dir, profiles_dir):
+    # Validated once per file version; rejected files never reach the views
+    reports = [validate_directory(analyses_dir, "analysis")]
+    # A_vs_B and B_vs_A share one payload when their content matches
+    analyses, pair_index = dedupe_analyses(load_twin_analyses(analyses_dir, exclude=reports[0].rejected))
+    # Persisted between runs; only new or edited narratives are re-indexed
+    search_index = load_search_index(analyses, os.path.abspath(analyses_dir))
+    if is_raw_directory(profiles_dir):
+        # Grouped by patient and sample once; profiles are assembled from the raw tables when read
+        patient_profiles = load_raw_profiles(profiles_dir)
+    else:
+        profile_rejects = {}
+        if os.path.exists(profiles_dir):
+            reports.append(validate_directory(profiles_dir, "profile"))
+            profile_rejects = reports[-1].rejected
+        # Profiles are indexed up front and parsed on demand, one part at a time
+        patient_profiles = load_patient_profiles(profiles_dir, lazy=True, exclude=profile_rejects)
+    # One pass over every profile's treatment lines; the Treatment Patterns page only slices it
+    treatment_matrices = build_treatment_matrices(patient_profiles, analyses)
+    return analyses, patient_profiles, reports, pair_index, search_index, treatment_matrices
+
+# cache_resource shares one copy across sessions instead of unpickling the
+# dataset on every rerun; views treat it as read-only
+@st.cache_resource
+def get_data(root, raw_dir=None):
+    analyses_dir = os.path.join(root, "final_twin_analysis_2")
+    profiles_dir = raw_dir or os.path.join(root, "patient_profiles_2")
+    journal_path = os.path.join(root, JOURNAL_FILENAME)
+    # Before the fingerprints, so files journaled while loading are ingested rather than skipped
+    journal_offset = journal_size(journal_path)
+    # After a restart, reuse the last loaded state if no file was added, removed or changed since
+    fingerprints = directory_fingerprints([analyses_dir, profiles_dir])
+    data = load_snapshot(os.path.abspath(root), fingerprints)
+    if data is None:
+        data = load_data(analyses_dir, profiles_dir)
+        save_snapshot(os.path.abspath(root), fingerprints, data)
+    analyses, patient_profiles, reports, pair_index, search_index, treatment_matrices = data
+    # Always resident, but counted so the profile caches only get what is left of the budget
+    resident = [analyses, pair_index, search_index, treatment_matrices]
+    if raw_dir:
+        # So are the grouped raw tables profiles are built from
+        resident.append(patient_profiles)
+    GOVERNOR.account(GOVERNOR.register("dataset"), root, resident, pinned=True)
+    # Files written since the fingerprints were taken are added to the loaded data in place
+    ingestor = DeltaIngestor(analyses_dir, profiles_dir, analyses, pair_index, search_index, patient_profiles,
+                             treatment_matrices, fingerprints, journal_path=journal_path, journal_offset=journal_offset,
+                             poll_seconds=float(os.environ.get("TWIN_INGEST_POLL_SECONDS", DEFAULT_POLL_SECONDS)))
+    # The profiles as loaded (the raw tables when raw_dir is set), from the fingerprints taken above;
+    # with the ingestor's profile_version it keys results derived from every profile
+    profiles_key = combine_digests((name, fingerprint) for name, fingerprint in
+                                   (fingerprints[profiles_dir] or {}).items())
+    return data + (ingestor.start(), profiles_key)
+
+@st.cache_resource
+def get_shared_data(directory):
+    # Built by build_shared_dataset.py; every worker maps the same files read-only
+    return SharedDataset(directory)
+
+@st.cache_resource
+def get_partitioned_data(root):
+    # Only the catalog is read here; partitions load on first use
+    return PartitionedDataset(root)
+
+@st.cache_resource(max_entries=2)
+def get_cna_matrix(_patient_profiles, data_key):
+    # Encoded from every sample once per data version, then memory-mapped from .cache/cna/
+    return load_cna_matrix(_patient_profiles, data_key)
+
+# Multi-worker deployments point every worker at one dataset built by build_shared_dataset.py
+SHARED_DATASET = os.environ.get("TWIN_SHARED_DATASET")
+ingestor = None
+
+@st.fragment(run_every=5)
+def ingest_status(ingestor):
+    # Checks for live-ingested data without rerunning the page
+    if ingestor.version != st.session_state.get("ingest_version"):
+        st.info(f"New data arrived ({ingestor.ingested} file(s) added since startup).")
+        if st.button("Refresh", key="ingest_refresh"):
+            st.rerun()
+
+try:
+    if SHARED_DATASET:
+        shared = get_shared_data(SHARED_DATASET)
+        analyses, patient_profiles = shared.analyses, shared.patient_profiles
+        validation_reports, pair_index = shared.reports, shared.pair_index
+        search_index, treatment_matrices = shared.search_index, shared.treatment_matrices
+        cna_profiles = patient_profiles
+        cna_key = (os.path.abspath(SHARED_DATASET), shared.manifest['generation'])
+    elif is_partitioned_root(DATA_ROOT):
+        dataset = get_partitioned_data(DATA_ROOT)
+        partition = st.sidebar.selectbox("Data Partition", dataset.partition_names, key="data_partition")
+        # Pinned while it is being served, so memory pressure can't make it reload on every rerun
+        active = dataset.activate(partition)
+        analyses = dataset.analyses(partition)
+        patient_profiles = dataset.patient_profiles
+        validation_reports = dataset.validation_reports(partition)
+        pair_index = dataset.pair_index(partition)
+        search_index = dataset.search_index(partition)
+        treatment_matrices = dataset.treatment_matrices(partition) if page == "Treatment Patterns" else None
+        # The landscape covers the active partition's samples only, keyed on what its profiles hold
+        cna_profiles = active.patient_profiles
+        cna_key = ((os.path.abspath(DATA_ROOT), partition, get_content_digest(cna_profiles))
+                   if page == "CNA Landscape" else None)
+    else:
+        (analyses, patient_profiles, validation_reports, pair_index,
+         search_index, treatment_matrices, ingestor, profiles_key) = get_data(DATA_ROOT, RAW_DATA)
+        # Any profile changed before startup or added by live ingestion since means a new matrix
+        cna_profiles = patient_profiles
+        cna_key = (os.path.abspath(DATA_ROOT), profiles_key, ingestor.profile_version)
+except FileNotFoundError as e:
+    st.error(f"Error loading data: {e}")
+    st.stop()
+
+for report in validation_reports:
+    if report.rejected:
+        st.sidebar.warning(f"{len(report.rejected)} invalid {report.kind} file(s) skipped. "
+                           f"See `{report.report_path}` for reasons.")
+# Derived views (rankings) are rebuilt when live ingestion changes the data
+data_version = ingestor.version if ingestor is not None else 0
+if ingestor is not None:
+    # This run shows everything ingested so far
+    st.session_state.ingest_version = ingestor.version
+    if page == "Treatment Patterns":
+        treatment_matrices = ingestor.treatment_matrices()
+    if ingestor.rejected:
+        st.sidebar.warning(f"{len(ingestor.rejected)} newly added file(s) failed validation and were skipped.")
+    with st.sidebar:
+        ingest_status(ingestor)
+if pair_index.collisions:
+    st.sidebar.warning(f"{len(pair_index.collisions)} pair(s) have conflicting analyses; all versions are listed.")
 
 if page == "Analysis Detail":
-    analysis_detail.show(analyses)
+    analysis_detail.show(analyses, patient_profiles, search_index, data_version=data_version)
+elif page == "Twin Leaderboard":
+    leaderboard.show(analyses, data_version=data_version)
 elif page == "Clinical Deep Dive":
-    deep_dive.show(patient_profiles)
+    deep_dive.show(patient_profiles, data_version=data_version)
 elif page == "Genomics Deep Dive":
-    genomics_deep_dive.show(patient_profiles)
+    genomics_deep_dive.show(patient_profiles, data_version=data_version)
+elif page == "Treatment Patterns":
+    treatment_patterns.show(treatment_matrices)
+elif page == "CNA Landscape":
+    cna_landscape.show(get_cna_matrix(cna_profiles, cna_key))
+elif page == "Memory Usage":
+    memory_usage.show(GOVERNOR)
@@ -0,0 +1,60 @@
+"""Builds the patient profile JSON files from the raw cBioPortal-style tables.
+
+Reads data_clinical_patient.txt, data_clinical_sample.txt and the annotated
+mutation, CNA and SV CSVs (see utils/profile_builder.py for the columns it
+uses), groups every table by patient or sample with one sort, and writes
+one <patient_id>.json per patient from several worker processes. With
+--analyses-dir only the query and twin patients of those analyses are
+written, as copy_patient_profiles.py used to copy them.
+
+The app can also serve profiles straight from the raw directory, without
+this step: start it with TWIN_RAW_DATA pointing at that directory.
+
+Usage:
+    python build_profiles.py --raw-dir raw_data --out patient_profiles_2
+    python build_profiles.py --raw-dir raw_data --out patient_profiles_2 \\
+        --analyses-dir final_twin_analysis_2 --workers 8
+"""
+import argparse
+import os
+import time
+
+from utils.data_loader import load_twin_analyses
+from utils.export import involved_patients
+from utils.profile_builder import RAW_FILENAMES, is_raw_directory, load_raw_profiles, write_profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build patient profiles from raw clinical and genomics tables.")
+    parser.add_argument('--raw-dir', default=".", help=f"Directory holding {RAW_FILENAMES[0]} and the other "
+                                                       f"raw files (default: .)")
+    parser.add_argument('--out', default="patient_profiles_2", help="Profiles directory (default: patient_profiles_2)")
+    parser.add_argument('--analyses-dir', help="Only build the patients named in these twin analyses")
+    parser.add_argument('--workers', type=int, help="Worker processes writing profiles (default: one per CPU)")
+    args = parser.parse_args()
+    if not is_raw_directory(args.raw_dir):
+        parser.error(f"{os.path.join(args.raw_dir, RAW_FILENAMES[0])} not found")
+
+    start = time.perf_counter()
+    profiles = load_raw_profiles(args.raw_dir)
+    print(f"Grouped {len(profiles)} patients in {time.perf_counter() - start:.1f}s")
+    unmatched = profiles.unmatched_samples()
+    if unmatched:
+        print(f"Skipped variants of {len(unmatched)} sample(s) missing from the sample table, "
+              f"e.g. {sorted(unmatched)[:5]}")
+
+    patient_ids = None
+    if args.analyses_dir:
+        patient_ids = involved_patients(load_twin_analyses(args.analyses_dir))
+        missing = [p for p in patient_ids if p not in profiles]
+        if missing:
+            print(f"{len(missing)} patient(s) of the analyses have no clinical or sample rows, e.g. {missing[:5]}")
+
+    written_start = time.perf_counter()
+    written = write_profiles(profiles, args.out, patient_ids, workers=args.workers)
+    print(f"Wrote {written} profiles to {args.out} in {time.perf_counter() - written_start:.1f}s "
+          f"({time.perf_counter() - start:.1f}s total)")
+
+
+if __name__ == "__main__":
+    main()
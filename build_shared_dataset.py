@@ -0,0 +1,36 @@
+"""Builds the memory-mapped dataset shared by several dashboard workers.
+
+Run it once per data update (for example from the deploy job); each worker
+started with TWIN_SHARED_DATASET pointing at the output directory maps the
+files read-only instead of loading its own copy of the data. Rebuilding
+writes a new generation and switches manifest.json over atomically, so
+running workers are not disturbed.
+
+Usage:
+    python build_shared_dataset.py --analyses-dir final_twin_analysis_2 \\
+        --profiles-dir patient_profiles_2 --out .shared
+"""
+import argparse
+import os
+import time
+
+from utils.shared_dataset import write_shared_dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the shared memory-mapped dataset for multi-worker deployments.")
+    parser.add_argument('--analyses-dir', default="final_twin_analysis_2")
+    parser.add_argument('--profiles-dir', default="patient_profiles_2")
+    parser.add_argument('--out', default=".shared", help="Output directory (default: .shared)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    start = time.perf_counter()
+    manifest = write_shared_dataset(args.analyses_dir, args.profiles_dir, args.out)
+    print(f"Wrote {manifest['generation']}: {manifest['analyses']} analyses ({manifest['payloads']} payloads), "
+          f"{manifest['patients']} patients, {manifest['samples']} samples "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
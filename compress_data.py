@@ -0,0 +1,96 @@
+"""Compresses a data tree (analyses or patient profiles) for the dashboard loaders.
+
+Each '*.json' file is written as '*.json.gz' or '*.json.zst', or, with --pack,
+all files of a directory go into a single line-delimited pack. The directory
+layout is mirrored under the output directory, and the size ratio and load-time
+change are reported at the end.
+
+Usage:
+    python compress_data.py patient_profiles_2 patient_profiles_2_gz
+    python compress_data.py final_twin_analysis_2 final_twin_analysis_2_zst --format zst --pack
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import time
+
+from utils.data_loader import iter_json_records, zstandard
+
+PACK_NAME = "pack.jsonl"
+
+
+def open_compressed_writer(path, fmt, level):
+    if fmt == 'gz':
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=level)
+    if zstandard is None:
+        raise SystemExit("--format zst requires the 'zstandard' package")
+    stream = zstandard.ZstdCompressor(level=level).stream_writer(open(path, 'wb'), closefd=True)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def tree_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def time_load(directory):
+    start = time.perf_counter()
+    count = 0
+    for root, _, _ in os.walk(directory):
+        count += sum(1 for _ in iter_json_records(root))
+    return count, time.perf_counter() - start
+
+
+def compress_directory(src, dst, fmt, level, pack):
+    os.makedirs(dst, exist_ok=True)
+    if pack:
+        written = 0
+        with open_compressed_writer(os.path.join(dst, f"{PACK_NAME}.{fmt}"), fmt, level) as out:
+            for filename, data in iter_json_records(src):
+                out.write(json.dumps({'filename': filename, 'data': data}, separators=(',', ':')))
+                out.write('\n')
+                written += 1
+        return written
+
+    written = 0
+    for filename, data in iter_json_records(src):
+        with open_compressed_writer(os.path.join(dst, f"{filename}.{fmt}"), fmt, level) as out:
+            json.dump(data, out, separators=(',', ':'))
+        written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress a tree of JSON analyses or profiles.")
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    parser.add_argument('--format', choices=['gz', 'zst'], default='gz')
+    parser.add_argument('--level', type=int, default=None,
+                        help="Compression level (default: 6 for gz, 10 for zst)")
+    parser.add_argument('--pack', action='store_true',
+                        help="Write one pack per directory instead of one file per document")
+    args = parser.parse_args()
+    level = args.level if args.level is not None else (6 if args.format == 'gz' else 10)
+
+    written = 0
+    for root, _, _ in os.walk(args.source):
+        rel = os.path.relpath(root, args.source)
+        written += compress_directory(root, os.path.normpath(os.path.join(args.destination, rel)),
+                                      args.format, level, args.pack)
+
+    before_size, after_size = tree_size(args.source), tree_size(args.destination)
+    before_count, before_time = time_load(args.source)
+    after_count, after_time = time_load(args.destination)
+
+    print(f"Compressed {written} documents from {args.source} to {args.destination}")
+    print(f"Size: {before_size / 1e6:.2f} MB -> {after_size / 1e6:.2f} MB "
+          f"(ratio {before_size / max(after_size, 1):.1f}x)")
+    print(f"Load time: {before_time:.2f}s ({before_count} docs) -> {after_time:.2f}s ({after_count} docs)")
+
+
+if __name__ == "__main__":
+    main()
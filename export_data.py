@@ -0,0 +1,109 @@
+"""Streams twin pairs, and optionally every variant of the patients in them, to Parquet or CSV.
+
+Pairs can be narrowed with the filters of the dashboard's filter panel.
+Rows are written in chunks (one Parquet row group each) and profiles are
+read one sample at a time, so memory stays flat however many variant rows
+are exported. Partitioned data roots are exported one partition at a time.
+The format follows the file name (.parquet, .csv or .csv.gz) unless
+--format is given; Parquet needs the optional `pyarrow` package.
+
+Usage:
+    python export_data.py --out pairs.parquet
+    python export_data.py --data-root data_root --grade A --gene EGFR --min-score 0.8 \\
+        --out pairs.csv --variants-out variants.parquet
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.data_loader import load_twin_analyses, load_patient_profiles
+from utils.validation import validate_directory
+from utils.pairs import dedupe_analyses
+from utils.partitions import PartitionedDataset, is_partitioned_root
+from utils.filters import PairFilterIndex, PatientFilterIndex
+from utils.export import (EXPORT_FORMATS, PAIR_COLUMNS, ChunkWriter, export_format, write_pairs, export_variants,
+                          involved_patients)
+
+ANALYSES_DIRNAME = "final_twin_analysis_2"
+PROFILES_DIRNAME = "patient_profiles_2"
+
+
+def flat_sources(root):
+    """Yields the (analyses, patient_profiles) of a flat data root, loaded as the app loads them."""
+    analyses_dir = os.path.join(root, ANALYSES_DIRNAME)
+    profiles_dir = os.path.join(root, PROFILES_DIRNAME)
+    report = validate_directory(analyses_dir, "analysis")
+    analyses, _ = dedupe_analyses(load_twin_analyses(analyses_dir, exclude=report.rejected))
+    profile_rejects = validate_directory(profiles_dir, "profile").rejected if os.path.exists(profiles_dir) else {}
+    yield analyses, load_patient_profiles(profiles_dir, lazy=True, exclude=profile_rejects)
+
+
+def partitioned_sources(root):
+    dataset = PartitionedDataset(root)
+    for name in dataset.partition_names:
+        yield dataset.analyses(name), dataset.patient_profiles
+
+
+def filter_specs(args):
+    """(pair filters, query patient filters) from the command line, as the filter panel builds them."""
+    filters, query_filters = {}, {}
+    if args.grade:
+        filters['grade'] = args.grade
+    if args.gene:
+        filters['shared_gene'] = args.gene
+    if args.min_score is not None or args.max_score is not None:
+        filters['similarity_score'] = (-np.inf if args.min_score is None else args.min_score,
+                                       np.inf if args.max_score is None else args.max_score)
+    if args.query_stage:
+        query_filters['Stage'] = args.query_stage
+    if args.query_oncotree:
+        query_filters['Oncotree Code'] = args.query_oncotree
+    return filters, query_filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export twin pairs and their patients' variants.")
+    parser.add_argument('--data-root', default=".", help="Flat or partitioned data root (default: .)")
+    parser.add_argument('--out', required=True, help="Pairs file (.parquet, .csv or .csv.gz)")
+    parser.add_argument('--variants-out', help="Also write every variant of the query and twin patients here")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help="Format of both files (default: from file name)")
+    parser.add_argument('--grade', action='append', help="Match grade; repeat for several")
+    parser.add_argument('--gene', action='append', help="Gene shared by the pair; repeat for several")
+    parser.add_argument('--min-score', type=float, help="Minimum similarity score")
+    parser.add_argument('--max-score', type=float, help="Maximum similarity score")
+    parser.add_argument('--query-stage', action='append', help="Query patient's highest recorded stage")
+    parser.add_argument('--query-oncotree', action='append', help="Query patient's oncotree code")
+    args = parser.parse_args()
+    for path in filter(None, (args.out, args.variants_out)):
+        try:
+            export_format(path, args.format)
+        except ValueError as e:
+            parser.error(str(e))
+
+    filters, query_filters = filter_specs(args)
+    sources = partitioned_sources if is_partitioned_root(args.data_root) else flat_sources
+    start = time.perf_counter()
+    patient_ids = set()
+    variants_profiles = None
+    with ChunkWriter(args.out, PAIR_COLUMNS, args.format) as writer:
+        for analyses, patient_profiles in sources(args.data_root):
+            if filters or query_filters:
+                patient_index = PatientFilterIndex(patient_profiles) if query_filters else None
+                mask = PairFilterIndex(analyses).mask(filters, patient_index, query_filters)
+                analyses = [analyses[i] for i in np.flatnonzero(mask)]
+            write_pairs(writer, analyses)
+            if args.variants_out:
+                patient_ids.update(involved_patients(analyses))
+                variants_profiles = patient_profiles
+    print(f"Wrote {writer.count} pairs to {args.out}")
+
+    if args.variants_out:
+        rows = export_variants(variants_profiles or {}, sorted(patient_ids, key=str), args.variants_out, args.format)
+        print(f"Wrote {rows} variants of {len(patient_ids)} patients to {args.variants_out}")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
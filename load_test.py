@@ -0,0 +1,265 @@
+"""Drives simulated dashboard sessions through common click paths and reports how the app holds up.
+
+Each session opens the app and then repeats a click path: select a pair in
+Analysis Detail, open the query patient's Clinical Deep Dive, go back, open
+the twin's Genomics Deep Dive and switch between its samples. Sessions are
+driven through Streamlit's AppTest. Within a worker process all sessions
+stay open and take turns, sharing the cached dataset the way sessions of
+one server do (AppTest runs one script at a time per process); --workers
+starts several processes to measure how throughput scales with server
+workers. Reported: rerun latency per step (p50/p95/p99), throughput, cold
+start and memory growth per worker. With --payload it also reports the
+bytes sent to the browser per rerun for each page, and how many of them
+are inline CSS.
+
+Either point it at an existing data root, or let it generate a synthetic
+dataset of the chosen size first.
+
+Usage:
+    python load_test.py --data-root . --sessions 8 --iterations 5
+    python load_test.py --patients 5000 --twins 10 --sessions 16 --workers 4
+    python load_test.py --patients 200 --sessions 2 --payload
+"""
+import argparse
+import gc
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+ANALYSES_DIRNAME = "final_twin_analysis_2"
+SAMPLE_SELECT_LABEL = "Select a sample to view detailed genomic data:"
+
+# [bytes, of which inline CSS] of the messages queued for the browser since the last reset
+PAYLOAD = [0, 0]
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_payload():
+    """Counts every message Streamlit queues for the browser in this process into PAYLOAD."""
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    enqueue = ForwardMsgQueue.enqueue
+
+    def counting_enqueue(self, msg):
+        size = msg.ByteSize()
+        PAYLOAD[0] += size
+        if msg.WhichOneof('type') == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+            element = msg.delta.new_element
+            kind = element.WhichOneof('type')
+            if kind in ('markdown', 'html') and '<style' in getattr(element, kind).body:
+                PAYLOAD[1] += size
+        enqueue(self, msg)
+
+    # The server's sessions queue through the same class, so this is what a browser would receive
+    ForwardMsgQueue.enqueue = counting_enqueue
+
+
+def selectable_analysis_ids(root):
+    """Ids the pair selector offers: valid analyses after deduplication, as the app loads them."""
+    from utils.data_loader import load_twin_analyses, analysis_id
+    from utils.validation import validate_directory
+    from utils.pairs import dedupe_analyses
+    analyses_dir = os.path.join(root, ANALYSES_DIRNAME)
+    report = validate_directory(analyses_dir, "analysis")
+    analyses, _ = dedupe_analyses(load_twin_analyses(analyses_dir, exclude=report.rejected))
+    return [analysis_id(a) for a in analyses]
+
+
+def run_session(analysis_ids, iterations, seed, timeout):
+    """One simulated session; yields (step, seconds, failed, page, payload) after every rerun."""
+    from streamlit.testing.v1 import AppTest
+    from views.analysis_detail import PAGE_SIZE
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def rerun(step):
+        PAYLOAD[:] = [0, 0]
+        start = time.perf_counter()
+        at.run(timeout=timeout)
+        seconds = time.perf_counter() - start
+        page = at.session_state["navigation"] if "navigation" in at.session_state else None
+        return step, seconds, bool(at.exception), page, tuple(PAYLOAD)
+
+    yield rerun("open app")
+    for _ in range(iterations):
+        position = rng.randrange(len(analysis_ids))
+        pair = analysis_ids[position]
+        # The selector lists the pairs in load order, a page at a time
+        page_inputs = [n for n in at.number_input if n.key == "analysis_page"]
+        if page_inputs and page_inputs[0].value != position // PAGE_SIZE + 1:
+            page_inputs[0].set_value(position // PAGE_SIZE + 1)
+            yield rerun("switch page")
+            if at.exception:
+                continue
+        at.selectbox(key="analysis_select").set_value(pair)
+        yield rerun("select pair")
+        if at.exception:
+            continue
+        at.button(key="btn_clinical_query").click()
+        yield rerun("clinical deep dive")
+        # The selector's state is dropped while another page is shown
+        at.sidebar.radio[0].set_value("Analysis Detail")
+        at.session_state["analysis_select"] = pair
+        yield rerun("back to analysis detail")
+        at.button(key="btn_genomic_twin").click()
+        yield rerun("genomics deep dive")
+        sample_selects = [s for s in at.selectbox if s.label == SAMPLE_SELECT_LABEL]
+        if sample_selects and len(sample_selects[0].options) > 1:
+            sample_selects[0].set_value(rng.choice(sample_selects[0].options[1:]))
+            yield rerun("switch sample")
+        at.sidebar.radio[0].set_value("Analysis Detail")
+        yield rerun("back to analysis detail")
+
+
+def run_worker(root, analysis_ids, sessions, iterations, seed, timeout, payload=False):
+    """Runs `sessions` sessions in this process, interleaving their steps; returns latencies and memory."""
+    os.environ["TWIN_DATA_ROOT"] = root
+    # Live ingestion would only add noise here
+    os.environ.setdefault("TWIN_INGEST_POLL_SECONDS", "0")
+    from streamlit.testing.v1 import AppTest
+    result = {'latencies': defaultdict(list), 'errors': defaultdict(int), 'payload': defaultdict(list),
+              'start': rss_bytes()}
+    if payload:
+        count_payload()
+
+    # The first run pays for loading the dataset; it is timed on its own
+    start = time.perf_counter()
+    warmup = AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+    result['cold_start'] = time.perf_counter() - start
+    if warmup.exception:
+        raise RuntimeError(f"App failed to start: {warmup.exception[0].message}")
+    del warmup
+    gc.collect()
+    result['warm'] = rss_bytes()
+
+    # All sessions stay alive together; each takes one step per round
+    active = [run_session(analysis_ids, iterations, seed + i, timeout) for i in range(sessions)]
+    while active:
+        for session in list(active):
+            step = next(session, None)
+            if step is None:
+                active.remove(session)
+                continue
+            name, seconds, failed, page, sent = step
+            result['latencies'][name].append(seconds)
+            result['errors'][name] += failed
+            if payload:
+                result['payload'][page].append(sent)
+    gc.collect()
+    result['end'] = rss_bytes()
+    result['peak'] = peak_rss_bytes()
+    result['sessions'] = sessions
+    return {k: dict(v) if isinstance(v, defaultdict) else v for k, v in result.items()}
+
+
+def report_payload(results):
+    payloads = defaultdict(list)
+    for result in results:
+        for page, values in result['payload'].items():
+            payloads[page].extend(values)
+    if not payloads:
+        return
+    print(f"\n{'page':<26}{'reruns':>8}{'mean KB':>10}{'p95 KB':>10}{'max KB':>10}{'CSS KB':>10}")
+    for page, values in payloads.items():
+        sent = np.asarray(values, dtype=float) / 1024
+        print(f"{page:<26}{len(sent):>8}{sent[:, 0].mean():>10.1f}{np.percentile(sent[:, 0], 95):>10.1f}"
+              f"{sent[:, 0].max():>10.1f}{sent[:, 1].mean():>10.1f}")
+
+
+def report(results, wall_seconds):
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for result in results:
+        for step, values in result['latencies'].items():
+            latencies[step].extend(values)
+            errors[step] += result['errors'].get(step, 0)
+    print(f"\n{'step':<26}{'reruns':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for step, values in latencies.items():
+        ms = np.asarray(values) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"{step:<26}{len(ms):>8}{p50:>10.0f}{p95:>10.0f}{p99:>10.0f}{ms.max():>10.0f}{errors[step]:>8}")
+
+    reruns = sum(len(v) for v in latencies.values())
+    print(f"\nThroughput: {reruns / wall_seconds:.1f} reruns/s ({reruns} reruns in {wall_seconds:.1f}s, "
+          f"{len(results)} worker(s))")
+    mb = 2 ** 20
+    for i, r in enumerate(results):
+        per_session = (r['end'] - r['warm']) / mb / max(r['sessions'], 1)
+        print(f"Worker {i}: cold start {r['cold_start']:.1f}s; RSS {r['start'] / mb:.0f} MB at start, "
+              f"{r['warm'] / mb:.0f} MB with data loaded, {r['end'] / mb:.0f} MB after {r['sessions']} session(s) "
+              f"(peak {r['peak'] / mb:.0f} MB, {per_session:.1f} MB per session)")
+    report_payload(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with simulated sessions.")
+    parser.add_argument('--data-root', help="Existing data root (default: generate a synthetic one)")
+    parser.add_argument('--patients', type=int, default=1000, help="Synthetic dataset: number of patients")
+    parser.add_argument('--twins', type=int, default=5, help="Synthetic dataset: twins per query patient")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sessions', type=int, default=8, help="Simulated sessions per worker")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes, each with its own copy of the app")
+    parser.add_argument('--iterations', type=int, default=3, help="Click paths per session")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds allowed per rerun")
+    parser.add_argument('--payload', action='store_true',
+                        help="Also report bytes sent to the browser per rerun, per page (mean over reruns)")
+    parser.add_argument('--keep-data', action='store_true', help="Keep the generated synthetic dataset")
+    args = parser.parse_args()
+
+    generated = None
+    root = args.data_root
+    if root is None:
+        from utils.synthetic import write_synthetic_dataset
+        generated = root = tempfile.mkdtemp(prefix="twin-load-test-")
+        start = time.perf_counter()
+        analyses, patients = write_synthetic_dataset(root, args.patients, args.twins, seed=args.seed)
+        print(f"Generated {patients} patients and {analyses} analyses in {root} "
+              f"({time.perf_counter() - start:.1f}s)")
+    root = os.path.abspath(root)
+
+    try:
+        context = multiprocessing.get_context("fork")
+        # Loading the analyses imports Streamlit, so it is done in a child process of its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            analysis_ids = pool.submit(selectable_analysis_ids, root).result()
+        if not analysis_ids:
+            sys.exit(f"No valid analyses under {root}")
+        print(f"Running {args.workers} worker(s) x {args.sessions} session(s) x {args.iterations} click path(s) "
+              f"over {len(analysis_ids)} analyses")
+        start = time.perf_counter()
+        # This process never imports Streamlit, so each worker starts like a separately launched server
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            futures = [pool.submit(run_worker, root, analysis_ids, args.sessions, args.iterations,
+                                   args.seed + i * args.sessions, args.timeout, args.payload)
+                       for i in range(args.workers)]
+            results = [future.result() for future in futures]
+        report(results, time.perf_counter() - start)
+    finally:
+        if generated and not args.keep_data:
+            shutil.rmtree(generated, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Splits flat analyses/profiles directories into a partitioned dataset root.
+
+Profiles are placed by patient-id prefix and analyses by their query
+patient's prefix, then catalog.json is written. Run with only --root to
+rebuild the catalog of an existing partitioned root (for example after
+adding cohort or run partitions by hand).
+
+Usage:
+    python partition_data.py --root data_root --analyses-dir final_twin_analysis_2 \\
+        --profiles-dir patient_profiles_2 --prefix-length 7
+    python partition_data.py --root data_root
+"""
+import argparse
+import os
+import re
+import shutil
+
+from utils.data_loader import JSON_SUFFIXES, logical_filename
+from utils.partitions import ANALYSES_DIRNAME, PROFILES_DIRNAME, build_catalog
+
+PATIENT_ID = re.compile(r'P-\d{7}')
+
+
+def place(src_dir, dst_root, subdir, prefix_length, key_for):
+    placed = 0
+    for filename in os.listdir(src_dir):
+        if not filename.endswith(JSON_SUFFIXES):
+            continue
+        key = key_for(logical_filename(filename))
+        if key is None:
+            print(f"Skipping {filename}: no patient id in file name")
+            continue
+        dst_dir = os.path.join(dst_root, key[:prefix_length], subdir)
+        os.makedirs(dst_dir, exist_ok=True)
+        src, dst = os.path.join(src_dir, filename), os.path.join(dst_dir, filename)
+        # Hard links keep the split free when source and root share a filesystem
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        placed += 1
+    return placed
+
+
+def first_patient_id(filename):
+    # Analysis files are named after the query patient first ('<query>_vs_<twin>.json')
+    match = PATIENT_ID.search(filename)
+    return match.group(0) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition twin analyses and profiles by patient-id prefix.")
+    parser.add_argument('--root', required=True, help="Partitioned dataset root to write")
+    parser.add_argument('--analyses-dir')
+    parser.add_argument('--profiles-dir')
+    parser.add_argument('--prefix-length', type=int, default=7,
+                        help="Characters of the patient id used as partition key (default: 7, e.g. 'P-00012')")
+    args = parser.parse_args()
+
+    os.makedirs(args.root, exist_ok=True)
+    if args.profiles_dir:
+        n = place(args.profiles_dir, args.root, PROFILES_DIRNAME, args.prefix_length, first_patient_id)
+        print(f"Placed {n} profiles")
+    if args.analyses_dir:
+        n = place(args.analyses_dir, args.root, ANALYSES_DIRNAME, args.prefix_length, first_patient_id)
+        print(f"Placed {n} analyses")
+
+    catalog = build_catalog(args.root)
+    print(f"Wrote catalog with {len(catalog['partitions'])} partitions to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
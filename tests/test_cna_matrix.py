@@ -0,0 +1,51 @@
+import json
+import os
+
+from utils.cna_matrix import load_cna_matrix
+from utils.partitions import PartitionedDataset, build_catalog
+from utils.profile_store import get_content_digest
+
+
+def write_profile(root, partition, patient_id, samples):
+    profiles_dir = os.path.join(root, partition, 'patient_profiles_2')
+    os.makedirs(profiles_dir, exist_ok=True)
+    profile = {'patient_id': patient_id, 'genomics': {'samples': {
+        sample_id: {'copy_number_alterations': [{'gene': gene, 'gistic_value': value}
+                                                for gene, value in cna.items()]}
+        for sample_id, cna in samples.items()}}}
+    with open(os.path.join(profiles_dir, f"{patient_id}.json"), 'w') as f:
+        json.dump(profile, f)
+
+
+def partition_matrix(dataset, name, cache_dir):
+    # As app.py does for the CNA page of a partitioned root
+    profiles = dataset.activate(name).patient_profiles
+    return load_cna_matrix(profiles, (dataset.root, name, get_content_digest(profiles)), cache_dir)
+
+
+def test_partition_switch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = str(tmp_path / 'root')
+    cache_dir = str(tmp_path / 'cna')
+    write_profile(root, 'A-', 'A-1', {'A-1-S1': {'MYC': 2}, 'A-1-S2': {'TP53': -2}})
+    write_profile(root, 'B-', 'B-1', {'B-1-S1': {'ERBB2': 1}})
+    build_catalog(root)
+    dataset = PartitionedDataset(root)
+
+    matrix = partition_matrix(dataset, 'A-', cache_dir)
+    assert sorted(matrix.sample_ids) == ['A-1-S1', 'A-1-S2']
+    assert matrix.genes == ['MYC', 'TP53']
+
+    # B is loaded next to A now; its matrix still holds only B's samples
+    matrix = partition_matrix(dataset, 'B-', cache_dir)
+    assert matrix.sample_ids == ['B-1-S1'] and matrix.genes == ['ERBB2']
+    assert matrix.values.tolist() == [[1]]
+
+    assert partition_matrix(dataset, 'A-', cache_dir).sample_ids == ['A-1-S1', 'A-1-S2']
+    assert len([f for f in os.listdir(cache_dir) if f.endswith('.npy')]) == 2
+
+    # A rewritten profile means a new key, not the stale matrix
+    write_profile(root, 'A-', 'A-1', {'A-1-S1': {'MYC': -1, 'KRAS': 2}})
+    matrix = partition_matrix(dataset, 'A-', cache_dir)
+    assert matrix.sample_ids == ['A-1-S1'] and matrix.genes == ['KRAS', 'MYC']
+    assert matrix.values.tolist() == [[2, -1]]
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+import pytest
+
+from utils import disk_cache
+from utils.disk_cache import DiskCache
+
+
+def test_computed_once_per_inputs_and_code(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    calls = []
+
+    def compute(value):
+        return lambda: calls.append(value) or value
+
+    assert cache.get_or_compute('square', 'd1', compute(1)) == 1
+    assert cache.get_or_compute('square', 'd1', compute(2)) == 1
+    assert cache.get_or_compute('square', 'd2', compute(3)) == 3
+    assert cache.get_or_compute('square', 'd1', compute(4), code='v2') == 4
+    assert cache.get_or_compute('cube', 'd1', compute(5)) == 5
+    assert calls == [1, 3, 4, 5]
+    # Another cache over the same directory, as another worker would have
+    assert DiskCache(str(tmp_path)).get_or_compute('square', 'd1', compute(6)) == 1
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = cache.key('name', 'digest')
+    cache.put(key, [1, 2, 3])
+    assert cache.get(key) == (True, [1, 2, 3])
+    with open(cache._path(key), 'r+b') as f:
+        f.truncate(5)
+    assert cache.get(key) == (False, None)
+    assert cache.get_or_compute('name', 'digest', lambda: 'again') == 'again'
+
+
+@pytest.mark.skipif(disk_cache.fcntl is None, reason="no per-key locking without fcntl")
+def test_concurrent_callers_wait_for_one_computation(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('slow', 'd', compute)))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 6 and len(calls) == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    payload = b'x' * 10_000
+    cache = DiskCache(str(tmp_path), max_bytes=35_000)
+    keys = [cache.key('blob', str(i)) for i in range(3)]
+    for age, key in zip((300, 200, 100), keys):
+        cache.put(key, payload)
+        past = time.time() - age
+        os.utime(cache._path(key), (past, past))
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(keys[0])[0]
+
+    cache.put(cache.key('blob', '3'), payload)
+    assert cache.get(keys[0])[0]
+    assert not cache.get(keys[1])[0] and not cache.get(keys[2])[0]
+    assert sum(size for _, size, _ in cache.entries()) <= 35_000
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+from types import MappingProxyType
+
+from utils import ingest
+from utils.ingest import DeltaIngestor, JOURNAL_FILENAME, journal_size
+from utils.pairs import dedupe_analyses
+from utils.search import SearchIndex
+
+
+def analysis(query, twin, rank=1, text="shared EGFR"):
+    return {'query_patient_id': query, 'twin_id': twin, 'rank': rank, 'key_differences': [text]}
+
+
+def write_json(directory, filename, data):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, filename), 'w') as f:
+        json.dump(data, f)
+
+
+def make_ingestor(root, patient_profiles=None, **kwargs):
+    analyses_dir, profiles_dir = os.path.join(root, 'analyses'), os.path.join(root, 'profiles')
+    os.makedirs(analyses_dir, exist_ok=True)
+    os.makedirs(profiles_dir, exist_ok=True)
+    analyses, pair_index = dedupe_analyses([])
+    return DeltaIngestor(analyses_dir, profiles_dir, analyses, pair_index, SearchIndex(),
+                         {} if patient_profiles is None else patient_profiles, poll_seconds=0, **kwargs)
+
+
+def journal(root, *paths):
+    with open(os.path.join(root, JOURNAL_FILENAME), 'a') as f:
+        for path in paths:
+            f.write(json.dumps({'path': path}) + '\n')
+
+
+def test_journal_offset_taken_before_load(tmp_path):
+    root = str(tmp_path)
+    journal_path = os.path.join(root, JOURNAL_FILENAME)
+    journal(root, 'analyses/old.json')
+    offset = journal_size(journal_path)
+    # Written and journaled while the dataset was loading
+    write_json(os.path.join(root, 'analyses'), 'A_vs_B.json', analysis('A', 'B'))
+    journal(root, 'analyses/A_vs_B.json')
+
+    ingestor = make_ingestor(root, journal_path=journal_path, journal_offset=offset)
+    assert ingestor.poll() == 1
+    assert [a['twin_id'] for a in ingestor.analyses] == ['B']
+    assert ingestor.poll() == 0
+
+    # Without the offset the ingestor starts at the end and misses it
+    assert make_ingestor(root, journal_path=journal_path).poll() == 0
+
+
+def test_profiles_rejected_for_read_only_containers(tmp_path):
+    root = str(tmp_path)
+    ingestor = make_ingestor(root, MappingProxyType({}))
+    write_json(os.path.join(root, 'profiles'), 'P-1.json', {'patient_id': 'P-1'})
+    write_json(os.path.join(root, 'analyses'), 'A_vs_B.json', analysis('A', 'B'))
+    assert ingestor.poll() == 1
+    assert 'P-1.json' in ingestor.rejected
+    assert ingestor.profile_version == 0
+
+    profiles = {}
+    ingestor = make_ingestor(str(tmp_path / 'other'), profiles)
+    write_json(ingestor.profiles_dir, 'P-1.json', {'patient_id': 'P-1'})
+    assert ingestor.poll() == 1
+    assert profiles['P-1'] == {'patient_id': 'P-1'} and ingestor.profile_version == 1
+
+
+def test_treatment_matrices_built_once_per_version(tmp_path, monkeypatch):
+    builds = []
+    entered = threading.Event()
+
+    def build(patient_profiles, analyses):
+        entered.set()
+        builds.append(len(analyses))
+        return object()
+
+    monkeypatch.setattr(ingest, 'build_treatment_matrices', build)
+    ingestor = make_ingestor(str(tmp_path))
+    write_json(ingestor.analyses_dir, 'A_vs_B.json', analysis('A', 'B'))
+    ingestor.poll()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(ingestor.treatment_matrices())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [1] and len({id(r) for r in results}) == 1
+    assert ingestor.treatment_matrices() is results[0]
+
+    write_json(ingestor.analyses_dir, 'A_vs_C.json', analysis('A', 'C'))
+    ingestor.poll()
+    assert ingestor.treatment_matrices() is not results[0]
+    assert builds == [1, 2]
+
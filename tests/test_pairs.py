@@ -0,0 +1,48 @@
+from utils.pairs import PairIndex, dedupe_analyses
+
+
+def analysis(query, twin, rank=1, filename=None, query_stage='II', twin_stage='IV'):
+    return {'query_patient_id': query, 'twin_id': twin, 'rank': rank,
+            'filename': filename or f"{query}_vs_{twin}.json",
+            'clinical_summary': {'query': {'stage': query_stage}, 'twin': {'stage': twin_stage}}}
+
+
+def test_both_directions_share_one_payload():
+    analyses, index = dedupe_analyses([analysis('A', 'B'), analysis('B', 'A', query_stage='IV', twin_stage='II')])
+    assert len(analyses) == 2 and index.shared_payloads == 1
+    forward, backward = analyses
+    assert backward.content is forward.content
+    assert backward['clinical_summary'] == {'query': {'stage': 'IV'}, 'twin': {'stage': 'II'}}
+    assert index.lookup('B', 'A') == [backward]
+
+
+def test_exact_duplicates_dropped_and_collisions_reported():
+    analyses, index = dedupe_analyses([analysis('A', 'B'), analysis('A', 'B', filename='copy.json'),
+                                       analysis('A', 'B', filename='rerun.json', twin_stage='III')])
+    assert [a['filename'] for a in analyses] == ['A_vs_B.json', 'rerun.json']
+    assert index.collisions == [{'query_patient_id': 'A', 'twin_id': 'B', 'files': ['A_vs_B.json', 'rerun.json']}]
+
+    index.remove(analyses[1])
+    assert index.collisions == [] and index.analyses == 1
+
+
+def test_removed_then_re_added():
+    index = PairIndex()
+    forward = index.add(analysis('A', 'B'))
+    backward = index.add(analysis('B', 'A', query_stage='IV', twin_stage='II'))
+    index.remove(forward)
+    # The reverse analysis still reads the payload
+    assert index.shared_payloads == 1 and backward['clinical_summary']['query'] == {'stage': 'IV'}
+
+    # Not a duplicate of what was removed
+    again = index.add(analysis('A', 'B'))
+    assert again is not None and again.content is backward.content
+    assert index.lookup('A', 'B') == [again] and index.analyses == 2
+
+    index.remove(again)
+    index.remove(backward)
+    assert index.shared_payloads == 0 and index.analyses == 0
+    assert not index.by_pair and index.lookup('A', 'B') == []
+    # Removing twice is harmless
+    index.remove(backward)
+    assert index.add(analysis('B', 'A')) is not None
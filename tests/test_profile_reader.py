@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+
+from utils import profile_reader
+from utils.profile_reader import JsonStreamReader, read_profile, read_sample, read_sample_index, read_samples
+from utils.profile_store import ProfileStore, get_samples
+
+NUMBERS = {'a': -2.5e10, 'b': 2, 'c': 0.125, 'd': 12345678901234567890, 'e': 1E-7, 'f': [3.0, -0, 10]}
+
+
+class SplitStream(io.StringIO):
+    """Text stream whose first read returns at most `split` characters, so a value can be cut anywhere."""
+
+    def __init__(self, text, split):
+        super().__init__(text)
+        self._split = split
+
+    def read(self, size=-1):
+        if self._split is not None:
+            size, self._split = self._split, None
+        return super().read(size)
+
+
+def read_all(text, split=None, chunk_size=4):
+    reader = JsonStreamReader(SplitStream(text, split), chunk_size=chunk_size)
+    return {key: reader.read_value() for key in reader.iter_object()}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64])
+def test_numbers_split_at_every_offset(chunk_size):
+    text = json.dumps(NUMBERS)
+    for split in range(1, len(text) + 1):
+        assert read_all(text, split, chunk_size) == NUMBERS, (split, chunk_size)
+
+
+def test_number_split_inside_exponent():
+    assert read_all('{"a": -2.5e10, "b": 2}', chunk_size=3) == {'a': -2.5e10, 'b': 2}
+
+
+def test_number_at_end_of_document():
+    reader = JsonStreamReader(io.StringIO('12.5'), chunk_size=2)
+    assert reader.read_value() == 12.5
+
+
+SAMPLES = {
+    'S1': {'sample_info': {'type': 'Primary "quoted" \\ [x]'},
+           'mutations': [{'gene': 'EGFR', 'note': '{not a bracket}'}, {'gene': 'KRAS'}],
+           'copy_number_alterations': [], 'structural_variants': None},
+    'S2': {'sample_info': {}, 'mutations': [{'gene': 'TP53', 'vaf': 0.31}],
+           'copy_number_alterations': [{'gene': 'MYC', 'gistic_value': 2}], 'structural_variants': []},
+}
+PROFILE = {'patient_id': 'P-1', 'clinical': {'stage': {'highest_recorded': 'IV'}},
+           'genomics': {'samples': SAMPLES}, 'timeline': {'events': [1, 2.5, "]"]}}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 16, 1 << 16])
+def test_skipping_matches_full_parse(chunk_size):
+    text = json.dumps(PROFILE)
+    reader = JsonStreamReader(io.StringIO(text), chunk_size=chunk_size)
+    kept = {}
+    for key in reader.iter_object():
+        if key == 'genomics':
+            reader.skip_value()
+        else:
+            kept[key] = reader.read_value()
+    assert kept == {k: v for k, v in PROFILE.items() if k != 'genomics'}
+
+
+def test_profile_parts(tmp_path):
+    path = tmp_path / 'P-1.json'
+    path.write_text(json.dumps(PROFILE))
+    assert read_profile(str(path)) == {k: v for k, v in PROFILE.items() if k != 'genomics'}
+    assert read_sample(str(path), 'S2') == SAMPLES['S2']
+    assert read_sample(str(path), 'missing') is None
+    index = read_sample_index(str(path))
+    assert index['S1'] == {'sample_info': SAMPLES['S1']['sample_info'], 'mutations': 2,
+                           'copy_number_alterations': 0, 'structural_variants': 0}
+    assert index['S2']['copy_number_alterations'] == 1
+
+
+def test_all_samples_in_one_pass(tmp_path, monkeypatch):
+    (tmp_path / 'P-1.json').write_text(json.dumps(PROFILE))
+    opened = []
+    open_data_file = profile_reader.open_data_file
+    monkeypatch.setattr(profile_reader, 'open_data_file', lambda path: opened.append(path) or open_data_file(path))
+
+    assert list(read_samples(str(tmp_path / 'P-1.json'))) == list(SAMPLES.items())
+    opened.clear()
+    store = ProfileStore(str(tmp_path))
+    assert list(get_samples(store, 'P-1')) == list(SAMPLES.items())
+    assert len(opened) == 1
+    assert list(get_samples({'P-1': PROFILE}, 'P-1')) == list(SAMPLES.items())
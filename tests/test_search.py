@@ -0,0 +1,55 @@
+from utils.search import SearchIndex, load_search_index
+
+
+def analysis(name, text, query='A', twin='B'):
+    return {'filename': f"{name}.json", 'query_patient_id': query, 'twin_id': twin,
+            'key_differences': [text], 'match_quality': {'overall_assessment': 'strong'}}
+
+
+ANALYSES = [analysis('A_vs_B', "EGFR exon 19 deletion in both"),
+            analysis('A_vs_C', "KRAS G12C, EGFR wild type"),
+            analysis('B_vs_C', "ALK fusion; no EGFR")]
+
+
+def ids(results):
+    return [key for key, _ in results]
+
+
+def test_ranks_matching_documents():
+    index = SearchIndex()
+    assert index.update(ANALYSES) == 3
+    assert ids(index.search("kras")) == ['A_vs_C']
+    assert sorted(ids(index.search("egfr"))) == ['A_vs_B', 'A_vs_C', 'B_vs_C']
+    assert ids(index.search("egfr deletion"))[0] == 'A_vs_B'
+    assert ids(index.search("egfr", limit=1)) == ids(index.search("egfr"))[:1]
+    assert index.search("braf") == []
+
+
+def test_changes_and_removals():
+    index = SearchIndex()
+    index.update(ANALYSES)
+    assert index.update(ANALYSES) == 0
+
+    assert index.add(analysis('A_vs_C', "BRAF V600E"))
+    assert not index.add(analysis('A_vs_C', "BRAF V600E"))
+    assert ids(index.search("kras")) == [] and ids(index.search("braf")) == ['A_vs_C']
+
+    index.discard('A_vs_B')
+    assert ids(index.search("egfr")) == ['B_vs_C'] and len(index) == 2
+    # Dropped from the results before compacting and from the postings after, with the same scores
+    before = index.search("egfr braf")
+    index.compact()
+    assert index.search("egfr braf") == before
+    assert len(index.doc_ids) == 2
+
+    assert index.update(ANALYSES[2:]) == 0
+    assert ids(index.search("braf")) == [] and len(index) == 1
+
+
+def test_persisted_index_reindexes_only_changes(tmp_path):
+    index = load_search_index(ANALYSES, 'key', cache_dir=str(tmp_path))
+    assert ids(index.search("alk")) == ['B_vs_C']
+    changed = ANALYSES[:2] + [analysis('B_vs_C', "ROS1 fusion")]
+    index = load_search_index(changed, 'key', cache_dir=str(tmp_path))
+    assert ids(index.search("ros1")) == ['B_vs_C'] and index.search("alk") == []
+    assert index.update(changed) == 0
@@ -0,0 +1,238 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.profile_store import get_samples
+from utils.disk_cache import DISK_CACHE
+
+try:
+    from scipy.cluster.hierarchy import linkage, leaves_list
+except ImportError:  # heatmaps fall back to a spectral ordering
+    linkage = None
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "cna")
+# Matrix files kept on disk; older ones belong to earlier versions of the data
+KEEP_MATRICES = 4
+# Rows multiplied per block, so queries on a memory-mapped matrix never copy all of it
+BLOCK_ROWS = 65536
+# GISTIC value assumed when a CNA record only names its alteration type
+ALTERATION_VALUES = {'amplification': 2, 'amp': 2, 'gain': 1, 'loss': -1, 'hetloss': -1,
+                     'deletion': -2, 'homdel': -2}
+
+
+def cna_cache_tag(key):
+    """Short digest of a data-version key, used to name the matrix files."""
+    return hashlib.sha1(str(key).encode()).hexdigest()[:12]
+
+
+def gistic_value(record):
+    value = record.get('gistic_value')
+    try:
+        return int(np.clip(int(float(value)), -2, 2))
+    except (TypeError, ValueError):
+        return ALTERATION_VALUES.get(str(record.get('alteration_type', '')).lower(), 0)
+
+
+class CNAMatrix:
+    """Samples x genes matrix of GISTIC copy-number values (int8), genes in sorted order.
+
+    `values` is usually a read-only memory map of the .npy file written by
+    build(); similarity queries are matrix-vector products over it.
+    """
+
+    def __init__(self, values, sample_ids, patient_ids, genes):
+        self.values = values
+        self.sample_ids = list(sample_ids)
+        self.patient_ids = list(patient_ids)
+        self.genes = list(genes)
+        self._rows = {sample_id: i for i, sample_id in enumerate(self.sample_ids)}
+        self._gene_columns = {gene: i for i, gene in enumerate(self.genes)}
+        self._by_patient = {}
+        for sample_id, patient_id in zip(self.sample_ids, self.patient_ids):
+            self._by_patient.setdefault(patient_id, []).append(sample_id)
+        self._stats = None
+
+    @classmethod
+    def build(cls, patient_profiles, path):
+        """Encodes every sample's copy_number_alterations into a new matrix file at `path` and opens it."""
+        sample_ids, patient_ids, rows, genes, values = [], [], [], [], []
+        for patient_id in patient_profiles:
+            for sample_id, sample in get_samples(patient_profiles, patient_id):
+                for record in (sample or {}).get('copy_number_alterations', []):
+                    if record.get('gene'):
+                        rows.append(len(sample_ids))
+                        genes.append(str(record['gene']))
+                        values.append(gistic_value(record))
+                sample_ids.append(sample_id)
+                patient_ids.append(patient_id)
+
+        codes, gene_order = pd.factorize(np.asarray(genes, dtype=object), sort=True)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int8,
+                                           shape=(len(sample_ids), len(gene_order)))
+        if rows:
+            matrix[np.asarray(rows), codes] = np.asarray(values, dtype=np.int8)
+        matrix.flush()
+        del matrix
+        with open(f"{tmp_path}.json", 'w') as f:
+            json.dump({'sample_ids': sample_ids, 'patient_ids': patient_ids, 'genes': list(gene_order)}, f)
+        os.replace(tmp_path, path)
+        os.replace(f"{tmp_path}.json", f"{path}.json")
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path):
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        return cls(np.load(path, mmap_mode='r'), meta['sample_ids'], meta['patient_ids'], meta['genes'])
+
+    def __len__(self):
+        return len(self.sample_ids)
+
+    @property
+    def patients(self):
+        return list(self._by_patient)
+
+    def samples_of(self, patient_id):
+        return self._by_patient.get(patient_id, [])
+
+    def row(self, sample_id):
+        return np.asarray(self.values[self._rows[sample_id]], dtype=np.float32)
+
+    def _blocks(self):
+        for start in range(0, len(self.sample_ids), BLOCK_ROWS):
+            yield start, np.asarray(self.values[start:start + BLOCK_ROWS], dtype=np.float32)
+
+    def _row_stats(self):
+        # Per-sample sum and sum of squares, computed once
+        if self._stats is None:
+            sums = np.empty(len(self), dtype=np.float64)
+            squares = np.empty(len(self), dtype=np.float64)
+            for start, block in self._blocks():
+                sums[start:start + len(block)] = block.sum(axis=1)
+                squares[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+            self._stats = (sums, squares)
+        return self._stats
+
+    def _dot(self, vector):
+        out = np.empty(len(self), dtype=np.float64)
+        for start, block in self._blocks():
+            out[start:start + len(block)] = block @ vector
+        return out
+
+    def scores(self, sample_id, metric='correlation'):
+        """Similarity of `sample_id` to every sample: Pearson correlation, or negated Euclidean distance."""
+        vector = self.row(sample_id)
+        dots = self._dot(vector)
+        sums, squares = self._row_stats()
+        if metric == 'euclidean':
+            return -np.sqrt(np.maximum(squares + float(vector @ vector) - 2 * dots, 0))
+        n = len(self.genes)
+        covariance = dots - sums * vector.sum() / n
+        variance = squares - sums ** 2 / n
+        denominator = np.sqrt(np.maximum(variance, 0) * max(float(vector @ vector) - vector.sum() ** 2 / n, 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator > 0, covariance / denominator, 0.0)
+
+    def most_similar(self, sample_id, k=10, metric='correlation'):
+        """The `k` samples with the most similar copy-number profile to `sample_id` (itself excluded).
+
+        The last column is the correlation, or the distance for 'euclidean'.
+        """
+        column = 'distance' if metric == 'euclidean' else 'correlation'
+        scores = self.scores(sample_id, metric)
+        scores[self._rows[sample_id]] = -np.inf
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return pd.DataFrame(columns=['sample_id', 'patient_id', column])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return pd.DataFrame({'sample_id': [self.sample_ids[i] for i in top],
+                             'patient_id': [self.patient_ids[i] for i in top],
+                             column: -scores[top] if metric == 'euclidean' else scores[top]})
+
+    def submatrix(self, sample_ids, genes=None):
+        """The values of `sample_ids` x `genes` (all genes if None) as a DataFrame."""
+        rows = np.asarray([self._rows[s] for s in sample_ids], dtype=np.int64)
+        block = np.asarray(self.values[rows])
+        if genes is not None:
+            block = block[:, [self._gene_columns[g] for g in genes]]
+        return pd.DataFrame(block, index=list(sample_ids), columns=list(genes if genes is not None else self.genes))
+
+    def variable_genes(self, sample_ids, n=40):
+        """The `n` genes whose values vary most across `sample_ids`, ignoring genes never altered there."""
+        block = self.submatrix(sample_ids)
+        spread = block.var(axis=0) + (block != 0).mean(axis=0)
+        spread = spread[(block != 0).any(axis=0)]
+        return list(spread.sort_values(ascending=False).index[:n])
+
+    def correlation(self, sample_ids):
+        """Pearson correlation between the copy-number profiles of `sample_ids`."""
+        block = self.submatrix(sample_ids).to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.nan_to_num(np.corrcoef(block)) if len(block) > 1 else np.ones((len(block), len(block)))
+        return pd.DataFrame(corr, index=list(sample_ids), columns=list(sample_ids))
+
+
+def cluster_order(matrix):
+    """Row order placing similar rows of `matrix` (2-D array) next to each other.
+
+    Average-linkage hierarchical clustering when scipy is installed,
+    otherwise the order of the rows along the leading eigenvector of their
+    correlation matrix.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if len(matrix) < 3:
+        return np.arange(len(matrix))
+    if linkage is not None:
+        return leaves_list(linkage(matrix, method='average', metric='euclidean'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.nan_to_num(np.corrcoef(matrix))
+    _, vectors = np.linalg.eigh(corr)
+    return np.argsort(vectors[:, -1], kind='stable')
+
+
+def load_cna_matrix(patient_profiles, key, cache_dir=DEFAULT_CACHE_DIR):
+    """Opens the CNA matrix built for data version `key`, building it on first use.
+
+    Workers asking for the same matrix at once wait on the disk cache's
+    per-key lock for the first one to build it.
+    """
+    path = os.path.join(cache_dir, f"cna-{cna_cache_tag(key)}.npy")
+    matrix = _open_existing(path)
+    if matrix is not None:
+        return matrix
+    with DISK_CACHE.computing(DISK_CACHE.key('cna-matrix', os.path.abspath(path))):
+        # Another worker may have built it while we waited for the lock
+        matrix = _open_existing(path)
+        if matrix is None:
+            matrix = CNAMatrix.build(patient_profiles, path)
+            _prune(cache_dir, keep=path)
+    return matrix
+
+
+def _open_existing(path):
+    if os.path.exists(path) and os.path.exists(f"{path}.json"):
+        try:
+            return CNAMatrix.open(path)
+        except (OSError, ValueError, KeyError):
+            pass
+    return None
+
+
+def _prune(cache_dir, keep):
+    # Unlinked files stay readable for processes that still have them mapped
+    paths = sorted((os.path.join(cache_dir, f) for f in os.listdir(cache_dir)
+                    if f.startswith("cna-") and f.endswith(".npy") and not f.endswith(".tmp.npy")),
+                   key=os.path.getmtime)
+    for path in paths[:-KEEP_MATRICES]:
+        if path != keep:
+            for stale in (path, f"{path}.json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.normalize import get_treatment_lines
+from utils.profile_store import get_clinical_profile, get_content_digest
+from utils.disk_cache import DISK_CACHE, code_version
+
+
+def collect_treatment_lines(patient_profiles, patient_ids=None):
+    """Returns one row per (patient, line, agent) across all profiles (or `patient_ids`), in either schema.
+
+    Agents are upper-cased so 'Carboplatin' and 'CARBOPLATIN' count together.
+    `line` is the patient's dense line order: line_number where given, else
+    the start day.
+    """
+    rows = []
+    for patient_id in patient_profiles if patient_ids is None else patient_ids:
+        if patient_ids is not None and patient_id not in patient_profiles:
+            continue
+        profile = get_clinical_profile(patient_profiles, patient_id)
+        for line in get_treatment_lines(profile) or []:
+            if not isinstance(line, dict) or not line.get('agent'):
+                continue
+            rows.append((patient_id, str(line['agent']).strip().upper(),
+                         line.get('line_number'), line.get('start_date_days')))
+    lines = pd.DataFrame(rows, columns=['patient_id', 'agent', 'line_number', 'start_date_days'])
+    order = pd.to_numeric(lines['line_number'], errors='coerce')
+    order = order.fillna(pd.to_numeric(lines['start_date_days'], errors='coerce'))
+    lines['line'] = order.groupby(lines['patient_id']).rank(method='dense')
+    return lines[['patient_id', 'line', 'agent']]
+
+
+def _pair_counts(left, right, n_agents):
+    """Counts (left agent code, right agent code) pairs into an n x n matrix."""
+    counts = np.bincount(left * n_agents + right, minlength=n_agents * n_agents)
+    return counts.reshape(n_agents, n_agents)
+
+
+class TreatmentMatrices:
+    """Cohort-wide agent co-occurrence and line-to-line transition counts.
+
+    cooccurrence[a, b] is the number of patients who received both a and b
+    (the diagonal counts patients who received a). transitions[a, b] is the
+    number of times a line containing a was directly followed by a line
+    containing b. Both are built from long (patient, agent) tables with
+    self-joins and bincount rather than a dense patient x agent matrix.
+    Patients are held as codes into the sorted `patients` array, so every
+    table is numeric and can be saved as .npy files and memory-mapped back
+    (save_arrays / from_arrays).
+    """
+
+    # Tables saved by save_arrays, as {table: columns}
+    TABLES = {
+        'patient_agents': ['patient', 'code'],
+        'patient_transitions': ['patient', 'code_from', 'code_to'],
+        'twins': ['query', 'patient'],
+        'twin_agent_counts': ['query', 'code', 'twins'],
+    }
+
+    def __init__(self, lines, analyses=()):
+        self.agents = pd.Index(sorted(lines['agent'].unique()), name='agent')
+        edges = [(a.get('query_patient_id'), a.get('twin_id')) for a in analyses]
+        edges = [(str(q), str(t)) for q, t in edges if q is not None and t is not None]
+        patient_ids = lines['patient_id'].astype(str).tolist()
+        self.patients = np.unique(np.array(patient_ids + [p for edge in edges for p in edge], dtype=str))
+        lines = pd.DataFrame({'patient': np.searchsorted(self.patients, np.array(patient_ids, dtype=str)),
+                              'line': lines['line'].to_numpy(),
+                              'code': self.agents.get_indexer(lines['agent'])})
+
+        # Patients who received each agent, once per patient
+        self.patient_agents = lines[['patient', 'code']].drop_duplicates().reset_index(drop=True)
+        # Directly consecutive lines of the same patient, every agent of one to every agent of the next
+        following = lines.assign(line=lines['line'] - 1)
+        self.patient_transitions = lines.merge(following, on=['patient', 'line'], suffixes=('_from', '_to'))[
+            ['patient', 'code_from', 'code_to']]
+
+        self.cooccurrence = self._cooccurrence(self.patient_agents)
+        self.transitions = self._transitions(self.patient_transitions)
+        self.patient_count = lines['patient'].nunique()
+
+        # (query patient, twin) edges, for aggregating over each patient's twins
+        edges = np.array(edges, dtype=str).reshape(-1, 2)
+        self.twins = pd.DataFrame({'query': np.searchsorted(self.patients, edges[:, 0]),
+                                   'patient': np.searchsorted(self.patients, edges[:, 1])}).drop_duplicates()
+        self.twin_agent_counts = self.twins.merge(self.patient_agents, on='patient').groupby(
+            ['query', 'code']).size().rename('twins').reset_index()
+
+    def save_arrays(self, directory):
+        """Writes every table as .npy files under `directory`, for from_arrays()."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {'agents': self.agents.to_numpy(dtype=str), 'patients': self.patients,
+                  'cooccurrence': self.cooccurrence.to_numpy(), 'transitions': self.transitions.to_numpy(),
+                  'patient_count': np.array(self.patient_count)}
+        for table, columns in self.TABLES.items():
+            for column in columns:
+                arrays[f"{table}.{column}"] = getattr(self, table)[column].to_numpy()
+        for name, values in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+
+    @classmethod
+    def from_arrays(cls, directory):
+        """Matrices saved by save_arrays, memory-mapped read-only rather than loaded."""
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+        matrices = cls.__new__(cls)
+        matrices.agents = pd.Index(load('agents'), name='agent')
+        matrices.patients = load('patients')
+        matrices.cooccurrence = matrices._frame(load('cooccurrence'))
+        matrices.transitions = matrices._frame(load('transitions'))
+        matrices.patient_count = int(load('patient_count'))
+        for table, columns in cls.TABLES.items():
+            setattr(matrices, table, pd.DataFrame({c: load(f"{table}.{c}") for c in columns}, copy=False))
+        return matrices
+
+    def _frame(self, matrix):
+        return pd.DataFrame(matrix, index=self.agents, columns=self.agents, copy=False)
+
+    def _cooccurrence(self, patient_agents):
+        pairs = patient_agents.merge(patient_agents, on='patient')
+        return self._frame(_pair_counts(pairs['code_x'].to_numpy(), pairs['code_y'].to_numpy(), len(self.agents)))
+
+    def _transitions(self, patient_transitions):
+        return self._frame(_pair_counts(patient_transitions['code_from'].to_numpy(),
+                                        patient_transitions['code_to'].to_numpy(), len(self.agents)))
+
+    def _patient_codes(self, patient_ids):
+        """Codes of the `patient_ids` that are known; unknown ones are left out."""
+        patient_ids = np.array([str(p) for p in patient_ids], dtype=str)
+        if len(self.patients) == 0 or len(patient_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        codes = np.minimum(np.searchsorted(self.patients, patient_ids), len(self.patients) - 1)
+        return codes[self.patients[codes] == patient_ids]
+
+    def query_patients(self):
+        return self.patients[np.unique(self.twins['query'].to_numpy())].tolist()
+
+    def twin_ids(self, query_patient_id):
+        codes = self._patient_codes([query_patient_id])
+        twins = self.twins.loc[self.twins['query'].isin(codes), 'patient'].to_numpy()
+        return self.patients[twins].tolist()
+
+    def twin_summary(self, query_patient_id):
+        """Agents received by `query_patient_id`'s twins, as a Series of twin counts (most common first)."""
+        codes = self._patient_codes([query_patient_id])
+        rows = self.twin_agent_counts[self.twin_agent_counts['query'].isin(codes)]
+        counts = pd.Series(rows['twins'].to_numpy(), index=self.agents[rows['code'].to_numpy()], name='twins')
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def for_patients(self, patient_ids):
+        """(cooccurrence, transitions) restricted to `patient_ids`, e.g. one query patient's twins."""
+        codes = self._patient_codes(patient_ids)
+        agents = self.patient_agents[self.patient_agents['patient'].isin(codes)]
+        transitions = self.patient_transitions[self.patient_transitions['patient'].isin(codes)]
+        return self._cooccurrence(agents), self._transitions(transitions)
+
+    def top_agents(self, n):
+        """The `n` agents received by the most patients."""
+        counts = pd.Series(np.diag(self.cooccurrence.to_numpy()), index=self.agents)
+        return counts.sort_values(ascending=False, kind='stable').index[:n]
+
+
+def build_treatment_matrices(patient_profiles, analyses=(), patient_ids=None):
+    digest = get_content_digest(patient_profiles, patient_ids)
+    if digest is None:
+        lines = collect_treatment_lines(patient_profiles, patient_ids)
+    else:
+        # Reading every profile is the slow part; restarts and other workers reuse the lines of the same files
+        lines = DISK_CACHE.get_or_compute('treatment-lines', digest,
+                                          lambda: collect_treatment_lines(patient_profiles, patient_ids),
+                                          code=code_version(collect_treatment_lines, get_treatment_lines))
+    return TreatmentMatrices(lines, analyses)
@@ -1,26 +1,137 @@
 import os
+import io
+import gzip
 import json
+import zlib
 import pandas as pd
 import streamlit as st
+from utils.vocab import intern_profile
 
-def load_twin_analyses(directory):
-    """Loads all JSON twin analysis files from the specified directory."""
-    analyses = []
-    if not os.path.exists(directory):
-        raise FileNotFoundError(f"Directory not found: {directory}")
+try:
+    import zstandard
+except ImportError:  # .zst support is optional
+    zstandard = None
+
+# One JSON document per file, optionally compressed
+JSON_SUFFIXES = ('.json', '.json.gz', '.json.zst')
+# Packs hold many documents, one {"filename": ..., "data": ...} record per line
+PACK_SUFFIXES = ('.jsonl.gz', '.jsonl.zst')
+# What a corrupt or truncated (possibly compressed) file raises while it is read
+READ_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, EOFError, gzip.BadGzipFile, zlib.error) + \
+    ((zstandard.ZstdError,) if zstandard is not None else ())
+
+def open_data_file(path):
+    """Opens a (possibly gzip/zstd compressed) data file for streaming text reads."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError(f"Reading {path} requires the 'zstandard' package")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def logical_filename(filename):
+    """Maps 'X.json', 'X.json.gz' and 'X.json.zst' to 'X.json'."""
+    for suffix in JSON_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)] + '.json'
+    return filename
 
+def iter_json_records(directory, exclude=()):
+    """Yields (filename, data) for every JSON document in a directory.
+
+    Plain, compressed and packed files are read the same way; the filename is
+    always the logical '*.json' name so callers don't care how it was stored.
+    Invalid documents and those named in `exclude` (logical or file names,
+    e.g. a ValidationReport's rejected records) are skipped.
+    """
     for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
+        filepath = os.path.join(directory, filename)
+        if filename in exclude or logical_filename(filename) in exclude:
+            continue
+        if filename.endswith(JSON_SUFFIXES):
             try:
-                with open(filepath, 'r') as f:
+                with open_data_file(filepath) as f:
                     data = json.load(f)
-                    data['filename'] = filename # Add filename for reference
-                    analyses.append(data)
-            except json.JSONDecodeError:
-                pass # st.warning(f"Skipping invalid JSON file: {filename}")
+            except READ_ERRORS:
+                continue # st.warning(f"Skipping invalid JSON file: {filename}")
+            yield logical_filename(filename), data
+        elif filename.endswith(PACK_SUFFIXES):
+            yield from iter_pack_records(filepath, exclude)
+
+def iter_pack_records(filepath, exclude=()):
+    """Yields (filename, data) for every record of a pack, skipping invalid lines.
+
+    A pack that turns out corrupt part way through yields the records before
+    the damage.
+    """
+    try:
+        with open_data_file(filepath) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    filename, data = record['filename'], record['data']
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                if filename not in exclude:
+                    yield filename, data
+    except READ_ERRORS:
+        return
+
+def load_twin_analyses(directory, exclude=()):
+    """Loads all JSON twin analysis files from the specified directory, except those in `exclude`."""
+    analyses = []
+    if not os.path.exists(directory):
+        raise FileNotFoundError(f"Directory not found: {directory}")
+
+    for filename, data in iter_json_records(directory, exclude):
+        data['filename'] = filename # Add filename for reference
+        analyses.append(data)
     return analyses
 
+def analysis_id(analysis):
+    """Returns the stable identifier of an analysis (its filename without extension)."""
+    return os.path.splitext(analysis.get('filename', ''))[0]
+
+def count_shared_biomarkers(analysis):
+    """Counts shared biomarkers; `shared_features` can be a list or a dict with a 'biomarkers' key."""
+    shared_features = analysis.get('shared_features', {})
+    if isinstance(shared_features, dict):
+        return len(shared_features.get('biomarkers', []))
+    elif isinstance(shared_features, list):
+        return len(shared_features)
+    return 0
+
+def live_analyses(analyses):
+    """The analyses of a live-ingested list, skipping the None tombstones left where analyses were removed."""
+    return (a for a in analyses if a is not None)
+
+def build_pair_summary(analyses):
+    """Builds a flat one-row-per-analysis DataFrame used for listing, filtering and paging pairs.
+
+    A tombstone (None) gets an empty row, so rows keep lining up with list positions.
+    """
+    rows = []
+    for a in analyses:
+        if a is None:
+            rows.append({})
+            continue
+        rows.append({
+            'analysis_id': analysis_id(a),
+            'query_patient_id': a.get('query_patient_id'),
+            'twin_id': a.get('twin_id'),
+            'rank': a.get('rank'),
+            'similarity_score': pd.to_numeric(a.get('similarity_score'), errors='coerce'),
+            'clinical_pct': pd.to_numeric(a.get('clinical_pct'), errors='coerce'),
+            'genomic_pct': pd.to_numeric(a.get('genomic_pct'), errors='coerce'),
+            'grade': (a.get('match_quality') or {}).get('grade'),
+            'shared_biomarkers': count_shared_biomarkers(a),
+        })
+    columns = ['analysis_id', 'query_patient_id', 'twin_id', 'rank', 'similarity_score',
+               'clinical_pct', 'genomic_pct', 'grade', 'shared_biomarkers']
+    return pd.DataFrame(rows, columns=columns)
+
 def load_clinical_data(directory):
     """Loads clinical patient and sample data from text files."""
     patient_file = os.path.join(directory, "data_clinical_patient.txt")
@@ -66,23 +177,25 @@ def load_genomics_data(directory):
 
     return genomics_data
 
-def load_patient_profiles(directory):
-    """Loads all patient profile JSON files from the specified directory."""
+def load_patient_profiles(directory, lazy=False, exclude=()):
+    """Loads all patient profile JSON files from the specified directory, except those in `exclude`.
+
+    With lazy=True only the directory is indexed and profiles are parsed on
+    demand (see utils.profile_store.ProfileStore).
+    """
     profiles = {}
     if not os.path.exists(directory):
         st.error(f"Directory not found: {directory}")
         return profiles
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
-            try:
-                with open(filepath, 'r') as f:
-                    data = json.load(f)
-                    # Use filename without extension as key if patient_id is missing, 
-                    # though patient_id should be in the JSON
-                    patient_id = data.get('patient_id', os.path.splitext(filename)[0])
-                    profiles[patient_id] = data
-            except json.JSONDecodeError:
-                pass
+    if lazy:
+        from utils.profile_store import ProfileStore # profile_store imports this module
+        return ProfileStore(directory, exclude=exclude)
+
+    for filename, data in iter_json_records(directory, exclude):
+        # Use filename without extension as key if patient_id is missing, 
+        # though patient_id should be in the JSON
+        patient_id = data.get('patient_id', os.path.splitext(filename)[0])
+        # Genes, classifications etc. repeat across profiles; keep one copy of each
+        profiles[patient_id] = intern_profile(data)
     return profiles
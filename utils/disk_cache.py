@@ -0,0 +1,184 @@
+import os
+import sys
+import pickle
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking (Windows): workers may compute the same entry twice
+    fcntl = None
+
+# Bump to invalidate every entry, e.g. when the pickle layout of cached objects changes
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(".cache", "derived")
+DEFAULT_MAX_MB = 1024
+# Eviction trims the cache to this share of its budget, so it doesn't run on every write
+EVICT_TO = 0.8
+
+_digests = {}  # path -> (size, mtime_ns, content digest)
+_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """Content hash of a file; re-read only when its size or mtime changed since the last call."""
+    stat = os.stat(path)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _digests_lock:
+        _digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def combine_digests(items):
+    """One digest over (name, digest) pairs, independent of their order."""
+    h = hashlib.blake2b(digest_size=16)
+    for name, digest in sorted((str(n), str(d)) for n, d in items):
+        h.update(f"{name}\0{digest}\n".encode())
+    return h.hexdigest()
+
+
+def code_version(*objects):
+    """Digest of the source files defining `objects` (functions, classes or modules)."""
+    digests = []
+    for obj in objects:
+        module = obj if hasattr(obj, '__file__') else sys.modules[obj.__module__]
+        digests.append((module.__name__, file_digest(module.__file__)))
+    return combine_digests(digests)
+
+
+class DiskCache:
+    """Pickled derived results on disk, addressed by a hash of their inputs.
+
+    Keys combine the derivation's name, the content digest of its inputs,
+    the code version and CACHE_VERSION, so a result is only reused for the
+    exact inputs and code that produced it and never needs invalidating.
+    Entries are written to a temporary file and renamed into place, so
+    readers in any process see either nothing or a complete entry. A lock
+    file per key makes concurrent workers wait for the first one computing
+    it instead of computing it again. Hits refresh an entry's mtime; once the
+    cache grows past `max_bytes` the least recently used entries go first.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0  # bytes written since the last size check
+        self._lock = threading.Lock()
+
+    def key(self, name, inputs_digest, code=None):
+        return combine_digests([('name', name), ('inputs', inputs_digest), ('code', code),
+                                ('cache', CACHE_VERSION)])
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.pkl")
+
+    def get(self, key):
+        """Returns (True, value) for a stored entry, else (False, None)."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:  # evicted meanwhile
+            pass
+        return True, value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._written += size
+            check = self._written > self.max_bytes * (1 - EVICT_TO)
+            if check:
+                self._written = 0
+        if check:
+            self.evict()
+
+    @contextmanager
+    def computing(self, key):
+        """Exclusive per-key lock across processes, held while `key` is computed so others wait for it."""
+        if fcntl is None:
+            yield
+            return
+        path = os.path.join(self.directory, "locks", f"{key}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_or_compute(self, name, inputs_digest, compute, code=None):
+        """Returns the stored result of `name` for these inputs, computing and storing it on a miss."""
+        key = self.key(name, inputs_digest, code)
+        found, value = self.get(key)
+        if found:
+            return value
+        with self.computing(key):
+            # Another worker may have finished it while we waited for the lock
+            found, value = self.get(key)
+            if not found:
+                value = compute()
+                self.put(key, value)
+        return value
+
+    def entries(self):
+        """[(mtime, size, path)] of every stored entry."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if shard == "locks" or not os.path.isdir(shard_dir):
+                continue
+            with os.scandir(shard_dir) as it:
+                for e in it:
+                    if e.name.endswith('.pkl'):
+                        try:
+                            stat = e.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime_ns, stat.st_size, e.path))
+        return entries
+
+    def evict(self):
+        """Deletes least recently used entries until the cache is back under EVICT_TO of its budget."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            # Processes already reading the file keep their open handle
+            for stale in (path, os.path.join(self.directory, "locks", os.path.basename(path)[:-4] + ".lock")):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+
+DISK_CACHE = DiskCache(os.environ.get("TWIN_DISK_CACHE_DIR", DEFAULT_CACHE_DIR),
+                       int(float(os.environ.get("TWIN_DISK_CACHE_MB", DEFAULT_MAX_MB)) * 2 ** 20))
@@ -0,0 +1,177 @@
+import os
+import gzip
+
+import pandas as pd
+
+from utils.data_loader import build_pair_summary
+from utils.profile_store import get_samples
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional; CSV always works
+    pa = None
+
+EXPORT_FORMATS = ('parquet', 'csv')
+# Rows buffered before they are written out; one Parquet row group each
+ROW_GROUP_ROWS = 65536
+
+# Column -> type ('string', 'int' or 'float') of the exported tables
+PAIR_COLUMNS = {
+    'analysis_id': 'string', 'query_patient_id': 'string', 'twin_id': 'string', 'rank': 'int',
+    'similarity_score': 'float', 'clinical_pct': 'float', 'genomic_pct': 'float', 'grade': 'string',
+    'shared_biomarkers': 'int',
+}
+# One row per mutation, CNA or SV; fields that don't apply to a variant type are empty
+VARIANT_COLUMNS = {
+    'patient_id': 'string', 'sample_id': 'string', 'variant_type': 'string', 'gene': 'string',
+    'change': 'string', 'classification': 'string', 'chromosome': 'string', 'position': 'int',
+    'gistic_value': 'int', 'partner_gene': 'string',
+}
+
+
+def parquet_available():
+    return pa is not None
+
+
+def export_format(path, fmt=None):
+    """`fmt` if given, else the format implied by the file name (.parquet, .csv or .csv.gz)."""
+    if fmt is None:
+        if path.endswith(('.parquet', '.pq')):
+            fmt = 'parquet'
+        elif path.endswith(('.csv', '.csv.gz')):
+            fmt = 'csv'
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Can't tell the export format of {path}; use .parquet or .csv")
+    return fmt
+
+
+def _coerce(frame, columns):
+    frame = frame.reindex(columns=list(columns))
+    for name, kind in columns.items():
+        if kind == 'string':
+            frame[name] = frame[name].astype('string')
+        else:
+            values = pd.to_numeric(frame[name], errors='coerce')
+            frame[name] = values.round().astype('Int64') if kind == 'int' else values.astype(float)
+    return frame
+
+
+class ChunkWriter:
+    """Streams rows to a Parquet or CSV file, ROW_GROUP_ROWS at a time.
+
+    Only the current chunk is held in memory. The file is written next to
+    `path` and moved into place by close(), so readers never see a partial
+    export.
+    """
+
+    def __init__(self, path, columns, fmt=None):
+        self.path = path
+        self.columns = columns
+        self.fmt = export_format(path, fmt)
+        if self.fmt == 'parquet' and pa is None:
+            raise ImportError("Parquet export needs the 'pyarrow' package")
+        self.count = 0
+        self._rows = []
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        if self.fmt == 'parquet':
+            types = {'string': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+            self._schema = pa.schema([(name, types[kind]) for name, kind in columns.items()])
+            self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+        else:
+            opener = gzip.open if path.endswith('.gz') else open
+            self._writer = opener(self._tmp_path, 'wt', encoding='utf-8', newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, row):
+        """Appends one row, a tuple in column order."""
+        self._rows.append(row)
+        if len(self._rows) >= ROW_GROUP_ROWS:
+            self._flush()
+
+    def write_frame(self, frame):
+        """Appends a DataFrame holding (at least) the export columns."""
+        self._flush()
+        self._write(frame)
+
+    def _flush(self):
+        if self._rows:
+            rows, self._rows = self._rows, []
+            self._write(pd.DataFrame(rows, columns=list(self.columns)))
+
+    def _write(self, frame):
+        frame = _coerce(frame, self.columns)
+        if self.fmt == 'parquet':
+            self._writer.write_table(pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+        else:
+            frame.to_csv(self._writer, header=self.count == 0, index=False)
+        self.count += len(frame)
+
+    def close(self):
+        self._flush()
+        if self.fmt == 'csv' and self.count == 0:
+            self._writer.write(','.join(self.columns) + '\n')
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        return self.count
+
+    def abort(self):
+        self._writer.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_pairs(writer, analyses):
+    """Appends the summary fields of `analyses` (any sequence) to a PAIR_COLUMNS writer, a chunk at a time."""
+    for start in range(0, len(analyses), ROW_GROUP_ROWS):
+        chunk = [analyses[i] for i in range(start, min(start + ROW_GROUP_ROWS, len(analyses)))]
+        writer.write_frame(build_pair_summary(chunk))
+
+
+def export_pairs(analyses, path, fmt=None):
+    """Writes the summary fields of `analyses` to `path`; returns the number of rows."""
+    with ChunkWriter(path, PAIR_COLUMNS, fmt) as writer:
+        write_pairs(writer, analyses)
+    return writer.count
+
+
+def involved_patients(analyses):
+    """Query and twin patients of `analyses`, sorted."""
+    patient_ids = set()
+    for a in analyses:
+        patient_ids.update(p for p in (a.get('query_patient_id'), a.get('twin_id')) if p is not None)
+    return sorted(patient_ids, key=str)
+
+
+def variant_rows(patient_profiles, patient_id):
+    """Yields one VARIANT_COLUMNS tuple per variant of the patient, streaming one sample at a time."""
+    for sample_id, sample in get_samples(patient_profiles, patient_id):
+        sample = sample or {}
+        for m in sample.get('mutations', []):
+            yield (patient_id, sample_id, 'mutation', m.get('gene'), m.get('protein_change'),
+                   m.get('variant_classification'), m.get('chromosome'), m.get('position'), None, None)
+        for c in sample.get('copy_number_alterations', []):
+            yield (patient_id, sample_id, 'cna', c.get('gene'), c.get('alteration_type'),
+                   None, None, None, c.get('gistic_value'), None)
+        for s in sample.get('structural_variants', []):
+            yield (patient_id, sample_id, 'sv', s.get('site1_gene'), None,
+                   s.get('sv_type'), s.get('site1_chromosome'), None, None, s.get('site2_gene'))
+
+
+def export_variants(patient_profiles, patient_ids, path, fmt=None):
+    """Writes every variant of every sample of `patient_ids` to `path`; returns the number of rows."""
+    with ChunkWriter(path, VARIANT_COLUMNS, fmt) as writer:
+        for patient_id in patient_ids:
+            if patient_id not in patient_profiles:
+                continue
+            for row in variant_rows(patient_profiles, patient_id):
+                writer.add(row)
+    return writer.count
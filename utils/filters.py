@@ -0,0 +1,259 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import build_pair_summary
+from utils.profile_store import get_clinical_profile, get_content_digest
+from utils.disk_cache import DISK_CACHE, code_version
+
+# Value bitmaps kept per index; each is one byte per row
+MAX_BITMAPS = 64
+
+# (label, section of profile['clinical'], field) of the patient filter fields
+PATIENT_FIELDS = [
+    ('Sex', 'demographics', 'sex'),
+    ('Vital Status', 'demographics', 'vital_status'),
+    ('Stage', 'stage', 'highest_recorded'),
+    ('Oncotree Code', 'biomarkers', 'oncotree_code'),
+    ('Cancer Type', 'biomarkers', 'cancer_type_detailed'),
+]
+
+
+class FilterIndex:
+    """Rows of one table as numeric columns plus value postings, for filtering with mask algebra.
+
+    A filter is a dict {field: (low, high)} for numeric fields or {field:
+    [values]} for categorical ones. Fields are ANDed and the values of one
+    field ORed. Each value's bitmap (a boolean mask over the rows) is built
+    from its postings on first use and kept, and numeric columns are stored
+    as ranks into their sorted distinct values, so a range is one compare
+    on a narrow integer column. Any combination of filters costs a few
+    vectorized ANDs and ORs.
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.numeric = {}    # field -> (sorted distinct values, rank of each row's value)
+        self._postings = {}  # field -> {value: row positions}
+        self._bitmaps = {}   # (field, value) -> bool mask
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.n_rows
+
+    # Pickled (into the disk cache) without the bitmaps, which are rebuilt on use
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in ('_bitmaps', '_lock')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bitmaps = {}
+        self._lock = threading.Lock()
+
+    def add_numeric(self, field, values):
+        values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+        distinct = np.unique(values[~np.isnan(values)])
+        # Missing values get rank len(distinct), past the end of every range
+        dtype = np.uint16 if len(distinct) < np.iinfo(np.uint16).max else np.uint32
+        self.numeric[field] = (distinct, np.searchsorted(distinct, values).astype(dtype))
+
+    def add_categorical(self, field, rows, values):
+        """Row `rows[i]` has value `values[i]`; a row may have several values or none."""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        rows = np.asarray(rows, dtype=np.int64)[codes >= 0]
+        codes = codes[codes >= 0]
+        order = np.argsort(codes, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(uniques)))]
+        self._postings[field] = {value: np.unique(rows[order[bounds[i]:bounds[i + 1]]])
+                                 for i, value in enumerate(uniques)}
+
+    def values(self, field):
+        """The values of `field`, most frequent first."""
+        postings = self._postings.get(field, {})
+        return sorted(postings, key=lambda value: (-len(postings[value]), str(value)))
+
+    def count(self, field, value):
+        return len(self._postings.get(field, {}).get(value, ()))
+
+    def range(self, field):
+        """(min, max) of a numeric field, or None if it has no values."""
+        if field not in self.numeric or len(self.numeric[field][0]) == 0:
+            return None
+        distinct = self.numeric[field][0]
+        return float(distinct[0]), float(distinct[-1])
+
+    def bitmap(self, field, value):
+        key = (field, value)
+        mask = self._bitmaps.get(key)
+        if mask is None:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[self._postings.get(field, {}).get(value, [])] = True
+            with self._lock:
+                if len(self._bitmaps) >= MAX_BITMAPS:
+                    self._bitmaps.clear()
+                self._bitmaps[key] = mask
+        return mask
+
+    def any_of(self, field, values):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for value in values:
+            mask |= self.bitmap(field, value)
+        return mask
+
+    def between(self, field, low, high):
+        distinct, ranks = self.numeric[field]
+        first = np.searchsorted(distinct, low, side='left')
+        last = np.searchsorted(distinct, high, side='right') - 1
+        if last < first:
+            return np.zeros(self.n_rows, dtype=bool)
+        # Unsigned wrap-around: ranks below `first` become huge, so one compare checks both bounds
+        return np.subtract(ranks, ranks.dtype.type(first)) <= ranks.dtype.type(last - first)
+
+    def mask(self, filters):
+        """Boolean mask of the rows matching every entry of `filters` (all rows if it is empty)."""
+        mask = np.ones(self.n_rows, dtype=bool)
+        for field, condition in filters.items():
+            if field in self.numeric:
+                mask &= self.between(field, *condition)
+            else:
+                mask &= self.any_of(field, condition)
+        return mask
+
+
+def shared_genes(analysis):
+    """Genes shared by a pair: its shared biomarkers and the genes of its shared variants."""
+    genes = []
+    shared_features = analysis.get('shared_features', {})
+    biomarkers = shared_features.get('biomarkers', []) if isinstance(shared_features, dict) else shared_features
+    if isinstance(biomarkers, list):
+        genes.extend(b for b in biomarkers if isinstance(b, str))
+    genomic = analysis.get('genomic_comparison') or {}
+    if isinstance(genomic, dict):
+        for variant in genomic.get('shared_variants') or []:
+            if isinstance(variant, dict) and variant.get('gene'):
+                genes.append(str(variant['gene']))
+    return set(genes)
+
+
+class PatientFilterIndex(FilterIndex):
+    """FilterIndex over patients (in sorted id order): age, plus the clinical fields in PATIENT_FIELDS."""
+
+    def __init__(self, patient_profiles):
+        self.patient_ids = np.asarray(sorted(patient_profiles), dtype=object)
+        super().__init__(len(self.patient_ids))
+        ages, rows, fields, values = [], [], [], []
+        for i, patient_id in enumerate(self.patient_ids):
+            clinical = get_clinical_profile(patient_profiles, patient_id).get('clinical', {})
+            ages.append((clinical.get('demographics') or {}).get('age'))
+            for label, section, field in PATIENT_FIELDS:
+                value = (clinical.get(section) or {}).get(field)
+                if value not in (None, ''):
+                    rows.append(i)
+                    fields.append(label)
+                    values.append(str(value))
+        self.add_numeric('Age', ages)
+        rows, fields, values = np.asarray(rows, dtype=np.int64), np.asarray(fields, dtype=object), values
+        for label, _, _ in PATIENT_FIELDS:
+            selected = np.flatnonzero(fields == label)
+            self.add_categorical(label, rows[selected], [values[i] for i in selected])
+
+    def rows_of(self, patient_ids):
+        """Row positions of `patient_ids`; -1 for patients not in the index."""
+        return pd.Index(self.patient_ids).get_indexer(pd.Index(patient_ids, dtype=object))
+
+    def matching(self, filters):
+        """Sorted ids of the patients matching `filters`."""
+        return self.patient_ids[self.mask(filters)].tolist()
+
+
+class PairFilterIndex(FilterIndex):
+    """FilterIndex over analyses (in list order): scores, grade and shared genes.
+
+    Filters on the query patient's clinical fields are evaluated on a
+    PatientFilterIndex and lifted to the pairs through each pair's query
+    patient row.
+    """
+
+    def __init__(self, analyses):
+        summary = build_pair_summary(analyses)
+        super().__init__(len(summary))
+        for field in ('similarity_score', 'clinical_pct', 'genomic_pct'):
+            self.add_numeric(field, summary[field])
+        self.add_categorical('grade', np.arange(len(summary)), summary['grade'].tolist())
+        rows, genes = [], []
+        # Tombstones (analyses removed by live ingestion) never match
+        self.live = np.ones(len(summary), dtype=bool)
+        for i, analysis in enumerate(analyses):
+            if analysis is None:
+                self.live[i] = False
+                continue
+            for gene in shared_genes(analysis):
+                rows.append(i)
+                genes.append(gene)
+        self.add_categorical('shared_gene', rows, genes)
+        self.query_patient_ids = summary['query_patient_id'].tolist()
+        self._query_rows = (None, None)  # (PatientFilterIndex, query patient row of every pair)
+
+    def mask(self, filters, patient_index=None, query_filters=None):
+        """Mask of the pairs matching `filters` whose query patient matches `query_filters`."""
+        mask = super().mask(filters) & self.live
+        if query_filters:
+            if self._query_rows[0] is not patient_index:
+                self._query_rows = (patient_index, patient_index.rows_of(self.query_patient_ids))
+            # Row -1 picks the appended False: a pair whose query patient has no profile never matches
+            patient_mask = np.append(patient_index.mask(query_filters), False)
+            mask &= patient_mask[self._query_rows[1]]
+        return mask
+
+
+# Only a handful of datasets (flat data, loaded partitions) are alive at once
+MAX_CACHED_INDEXES = 16
+
+_indexes = OrderedDict()  # (kind, id(data)) -> (data, data version, index), least recently used first
+_lock = threading.Lock()
+
+
+def _cached(kind, data, version, build):
+    key = (kind, id(data))
+    with _lock:
+        cached = _indexes.get(key)
+        # Entries hold their data, so its id can't be reused while it is cached
+        if cached is not None and cached[0] is not data:
+            cached = None
+        if cached is not None:
+            _indexes.move_to_end(key)
+    if cached is not None and cached[1] == version and len(cached[2]) == len(data):
+        return cached[2]
+    index = build(data)
+    with _lock:
+        _indexes[key] = (data, version, index)
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def pair_filter_index(analyses, version=0):
+    """Returns the PairFilterIndex of `analyses` at data `version`, building it on first use."""
+    return _cached('pairs', analyses, version, PairFilterIndex)
+
+
+def _build_patient_index(patient_profiles):
+    digest = get_content_digest(patient_profiles)
+    if digest is None:
+        return PatientFilterIndex(patient_profiles)
+    # Restarts and other workers reuse the index built from the same profile files
+    return DISK_CACHE.get_or_compute('patient-filter-index', digest, lambda: PatientFilterIndex(patient_profiles),
+                                     code=code_version(PatientFilterIndex))
+
+
+def patient_filter_index(patient_profiles, version=0):
+    """Returns the PatientFilterIndex of `patient_profiles` at data `version`; reads every clinical profile once."""
+    return _cached('patients', patient_profiles, version, _build_patient_index)
+
+
+def sorted_patient_ids(patient_profiles, version=0):
+    """Returns the sorted ids of `patient_profiles` at data `version`, sorted once and shared; don't modify it."""
+    return _cached('patient ids', patient_profiles, version, sorted)
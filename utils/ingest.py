@@ -0,0 +1,220 @@
+import os
+import gzip
+import json
+import threading
+from collections.abc import MutableMapping
+
+from utils.data_loader import JSON_SUFFIXES, open_data_file, logical_filename, analysis_id, live_analyses
+from utils.validation import validate_record
+from utils.snapshot import directory_fingerprints
+from utils.prefetch import invalidate_patient
+from utils.cohort import build_treatment_matrices
+from utils.vocab import intern_profile
+
+DEFAULT_POLL_SECONDS = 2.0
+JOURNAL_FILENAME = "ingest_journal.jsonl"
+
+
+def journal_size(journal_path):
+    """Current length of the journal, 0 if there is none yet; the offset to start tailing it from."""
+    try:
+        return os.path.getsize(journal_path)
+    except OSError:
+        return 0
+
+
+def _mtime(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DeltaIngestor:
+    """Adds analyses and profiles written after startup to the live dataset, in place.
+
+    New files are found by tailing a journal (one {"path": ...} JSON line per
+    written file, relative to the journal's directory) when `journal_path`
+    exists, or else by polling both directories; a directory's files are only
+    listed when its mtime changed, so files must be written under a new name
+    or renamed into place. Each file costs one parse, one validation and one
+    index update, however large the dataset is.
+
+    Writes are serialized by an internal lock that readers never take: the
+    analyses list is only appended to or has single items replaced, and a
+    removed analysis leaves a None tombstone, so list positions never shift
+    and a concurrent reader sees either the old or the new analysis. `version`
+    is bumped before and after each change, so anything derived while one was
+    in progress is keyed to a version that is already stale.
+
+    Pass the `journal_offset` taken with journal_size() before the data was
+    loaded, so files journaled during the load aren't missed. Profiles are
+    only ingested into containers that can take them (ProfileStore, a dict);
+    profiles built from raw tables are read-only and profile files are
+    rejected there.
+    """
+
+    def __init__(self, analyses_dir, profiles_dir, analyses, pair_index, search_index, patient_profiles,
+                 treatment_matrices=None, fingerprints=None, journal_path=None, journal_offset=None,
+                 poll_seconds=DEFAULT_POLL_SECONDS):
+        self.analyses_dir = os.path.abspath(analyses_dir)
+        self.profiles_dir = os.path.abspath(profiles_dir)
+        self.analyses = analyses
+        self.pair_index = pair_index
+        self.search_index = search_index
+        self.patient_profiles = patient_profiles
+        self.journal_path = journal_path
+        self.poll_seconds = poll_seconds
+        self.version = 0    # bumped twice for every file applied
+        self.ingested = 0
+        self.profile_version = 0  # bumped for every profile applied, for results derived from profiles only
+        self.rejected = {}  # filename -> [reasons]
+        self._treatment_matrices = (treatment_matrices, self.version)
+        self._positions = {a.get('filename'): i for i, a in enumerate(analyses)}
+        # Changes are relative to what the initial load saw
+        self._fingerprints = fingerprints or directory_fingerprints([analyses_dir, profiles_dir])
+        self._fingerprints = {os.path.abspath(d): f or {} for d, f in self._fingerprints.items()}
+        # Listed once on the first poll, for files written since those fingerprints were taken
+        self._mtimes = {d: -1 for d in self._fingerprints}
+        if journal_offset is None:
+            journal_offset = journal_size(journal_path) if journal_path is not None else 0
+        self._journal_offset = journal_offset
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _has_journal(self):
+        return self.journal_path is not None and os.path.exists(self.journal_path)
+
+    def start(self):
+        if self.poll_seconds and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="delta-ingest", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.poll()
+
+    def poll(self):
+        """Applies every file written since the last poll; returns how many were applied."""
+        paths = self._journal_paths() if self._has_journal() else self._changed_paths()
+        return sum(self.ingest_file(path) for path in paths)
+
+    def _journal_paths(self):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            chunk = f.read()
+        # A line still being written is picked up on the next poll
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        self._journal_offset += len(complete)
+        base = os.path.dirname(os.path.abspath(self.journal_path))
+        paths = []
+        for line in complete.decode('utf-8').splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and entry.get('path'):
+                paths.append(os.path.join(base, entry['path']))
+        return paths
+
+    def _changed_paths(self):
+        # Adding, removing or renaming a file changes its directory's mtime; listing one is O(files)
+        changed = []
+        for directory, mtime in self._mtimes.items():
+            current = _mtime(directory)
+            if current != mtime:
+                self._mtimes[directory] = current
+                changed.append(directory)
+        if not changed:
+            return []
+        paths = []
+        for directory, files in directory_fingerprints(changed).items():
+            known = self._fingerprints[directory]
+            for filename, fingerprint in (files or {}).items():
+                if known.get(filename) != fingerprint:
+                    paths.append(os.path.join(directory, filename))
+            self._fingerprints[directory] = files or {}
+        return paths
+
+    def ingest_file(self, path):
+        """Validates and applies one analysis or profile file; returns True if it was applied."""
+        filename = os.path.basename(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        if not filename.endswith(JSON_SUFFIXES) or directory not in (self.analyses_dir, self.profiles_dir):
+            return False
+        kind = "analysis" if directory == self.analyses_dir else "profile"
+        if kind == "profile" and not self._accepts_profiles():
+            self.rejected[logical_filename(filename)] = ["profiles built from raw tables are read-only; "
+                                                         "restart to load changes"]
+            return False
+        try:
+            with open_data_file(path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError, EOFError, gzip.BadGzipFile) as e:
+            self.rejected[logical_filename(filename)] = [f"unreadable: {e}"]
+            return False
+        errors = validate_record(data, kind)
+        if errors:
+            self.rejected[logical_filename(filename)] = errors
+            return False
+        self.rejected.pop(logical_filename(filename), None)
+
+        with self._lock:
+            self.version += 1
+            if kind == "analysis":
+                self._apply_analysis(logical_filename(filename), data)
+            else:
+                self._apply_profile(path, data)
+            self.ingested += 1
+            self.version += 1
+        return True
+
+    def _apply_analysis(self, filename, data):
+        data['filename'] = filename
+        position = self._positions.get(filename)
+        if position is not None:
+            self.pair_index.remove(self.analyses[position])
+        pair = self.pair_index.add(data)
+        if pair is None:
+            # Now an exact duplicate of another analysis
+            if position is not None:
+                self.search_index.discard(analysis_id(self.analyses[position]))
+                self.analyses[position] = None
+                del self._positions[filename]
+            return
+        if position is None:
+            self._positions[filename] = len(self.analyses)
+            self.analyses.append(pair)
+        else:
+            self.analyses[position] = pair
+        self.search_index.add(pair)
+
+    def _accepts_profiles(self):
+        return hasattr(self.patient_profiles, 'refresh') or isinstance(self.patient_profiles, MutableMapping)
+
+    def _apply_profile(self, path, data):
+        if hasattr(self.patient_profiles, 'refresh'):
+            patient_id = self.patient_profiles.refresh(path)
+        else:
+            patient_id = os.path.splitext(logical_filename(os.path.basename(path)))[0]
+            self.patient_profiles[patient_id] = intern_profile(data)
+        self.profile_version += 1
+        invalidate_patient(patient_id)
+
+    def treatment_matrices(self):
+        """The cohort treatment matrices, rebuilt once per version on first use after new data arrived."""
+        matrices, version = self._treatment_matrices
+        if matrices is not None and version == self.version:
+            return matrices
+        # Under the write lock: one session rebuilds, the others wait for it, and no file lands mid-build
+        with self._lock:
+            matrices, version = self._treatment_matrices
+            if matrices is None or version != self.version:
+                matrices = build_treatment_matrices(self.patient_profiles, list(live_analyses(self.analyses)))
+                self._treatment_matrices = (matrices, self.version)
+            return matrices
@@ -0,0 +1,189 @@
+import os
+import sys
+import types
+import weakref
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Byte budget shared by every cache registered with GOVERNOR
+DEFAULT_BUDGET_MB = 2048
+# Containers longer than this are measured on an evenly spaced sample
+SAMPLE_SIZE = 100
+
+
+def estimate_size(obj, _seen=None):
+    """Rough deep size of `obj` in bytes.
+
+    Understands DataFrames, NumPy arrays, plotly figures and the dataset's own
+    objects. Shared objects (interned strings, deduplicated payloads) are
+    counted once, and long lists and dicts are extrapolated from a sample.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True).sum()) if not isinstance(obj, pd.Index) \
+            else int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + sys.getsizeof(np.empty(0))
+    if isinstance(obj, (str, bytes, int, float, bool, array, type(None))):
+        return sys.getsizeof(obj)
+    if hasattr(obj, 'to_plotly_json'):
+        return estimate_size(obj.to_plotly_json(), seen)
+    if isinstance(obj, (types.FunctionType, types.MethodType, type, threading.Thread)) or \
+            type(obj).__name__ in ('lock', 'RLock'):
+        return 0
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        size += _sampled(items, lambda kv: estimate_size(kv[0], seen) + estimate_size(kv[1], seen))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += _sampled(list(obj), lambda v: estimate_size(v, seen))
+    else:
+        # Attributes rather than items, so mapping views (PairAnalysis, ProfileStore) aren't materialized
+        if hasattr(obj, '__dict__'):
+            size += estimate_size(vars(obj), seen)
+        for slot in getattr(type(obj), '__slots__', ()):
+            size += estimate_size(getattr(obj, slot, None), seen)
+    return size
+
+
+def _sampled(items, measure):
+    if len(items) <= SAMPLE_SIZE:
+        return sum(measure(item) for item in items)
+    step = len(items) / SAMPLE_SIZE
+    sample = [items[int(i * step)] for i in range(SAMPLE_SIZE)]
+    return int(sum(measure(item) for item in sample) * len(items) / SAMPLE_SIZE)
+
+
+class MemoryGovernor:
+    """Accounts for cached objects and evicts the least recently used ones across all caches.
+
+    Each cache registers once with a kind (the label shown in the debug view)
+    and an evict(key) callback, then reports its entries with account(),
+    touch() and release(). When the total goes over the budget, the oldest
+    unpinned entries are evicted, whichever cache they belong to. Callbacks
+    run outside the governor's lock, so caches must call account() while not
+    holding their own lock. Caches are referenced weakly.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # (handle, key) -> bytes, least recently used first
+        self._pinned = {}              # (handle, key) -> bytes, never evicted
+        self._caches = {}              # handle -> (kind, weak or strong evict callback)
+        self._evictions = {}           # kind -> count
+        self._next_handle = 0
+        self._lock = threading.Lock()
+
+    def register(self, kind, evict=None):
+        """Registers a cache and returns the handle to account its entries under."""
+        if isinstance(evict, types.MethodType):
+            callback = weakref.WeakMethod(evict)
+        else:
+            callback = (lambda: evict) if evict is not None else (lambda: None)
+        with self._lock:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._caches[handle] = (kind, callback)
+            self._evictions.setdefault(kind, 0)
+        return handle
+
+    def account(self, handle, key, obj=None, nbytes=None, pinned=False):
+        """Records `key` of cache `handle` at `nbytes` (estimated from `obj` if not given)."""
+        if nbytes is None:
+            nbytes = estimate_size(obj)
+        with self._lock:
+            self._entries.pop((handle, key), None)
+            if pinned:
+                self._pinned[(handle, key)] = nbytes
+            else:
+                self._entries[(handle, key)] = nbytes
+            victims = self._select_victims()
+        self._evict(victims)
+        return nbytes
+
+    def touch(self, handle, key):
+        with self._lock:
+            if (handle, key) in self._entries:
+                self._entries.move_to_end((handle, key))
+
+    def release(self, handle, key):
+        """Forgets `key`; for entries the cache dropped on its own."""
+        with self._lock:
+            self._entries.pop((handle, key), None)
+            self._pinned.pop((handle, key), None)
+
+    def _total(self):
+        return sum(self._entries.values()) + sum(self._pinned.values())
+
+    def _select_victims(self):
+        total = self._total()
+        victims = []
+        while total > self.budget_bytes and self._entries:
+            (handle, key), nbytes = self._entries.popitem(last=False)
+            total -= nbytes
+            victims.append((handle, key))
+        return victims
+
+    def _evict(self, victims):
+        for handle, key in victims:
+            kind, callback = self._caches.get(handle, (None, lambda: None))
+            evict = callback()
+            if evict is not None:
+                evict(key)
+            if kind is not None:
+                with self._lock:
+                    self._evictions[kind] += 1
+
+    def _drop_dead_caches(self):
+        dead = {h for h, (_, callback) in self._caches.items()
+                if isinstance(callback, weakref.WeakMethod) and callback() is None}
+        if dead:
+            for table in (self._entries, self._pinned):
+                for entry in [e for e in table if e[0] in dead]:
+                    del table[entry]
+            for handle in dead:
+                del self._caches[handle]
+
+    def usage(self):
+        """Bytes, entries and evictions per cache kind, largest first."""
+        with self._lock:
+            self._drop_dead_caches()
+            rows = {}
+            for table, pinned in ((self._entries, False), (self._pinned, True)):
+                for (handle, _), nbytes in table.items():
+                    kind = self._caches[handle][0]
+                    row = rows.setdefault(kind, {'cache': kind, 'entries': 0, 'bytes': 0, 'pinned_bytes': 0})
+                    row['entries'] += 1
+                    row['bytes'] += nbytes
+                    if pinned:
+                        row['pinned_bytes'] += nbytes
+            for kind, count in self._evictions.items():
+                rows.setdefault(kind, {'cache': kind, 'entries': 0, 'bytes': 0, 'pinned_bytes': 0})
+                rows[kind]['evictions'] = count
+        usage = pd.DataFrame(list(rows.values()), columns=['cache', 'entries', 'bytes', 'pinned_bytes', 'evictions'])
+        return usage.fillna({'evictions': 0}).sort_values('bytes', ascending=False).reset_index(drop=True)
+
+    def largest(self, n=20):
+        """The `n` largest accounted entries as (cache kind, key, bytes, pinned)."""
+        with self._lock:
+            self._drop_dead_caches()
+            entries = [(self._caches[h][0], str(k), b, False) for (h, k), b in self._entries.items()]
+            entries += [(self._caches[h][0], str(k), b, True) for (h, k), b in self._pinned.items()]
+        return sorted(entries, key=lambda e: e[2], reverse=True)[:n]
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return self._total()
+
+
+GOVERNOR = MemoryGovernor(int(float(os.environ.get("TWIN_MEMORY_BUDGET_MB", DEFAULT_BUDGET_MB)) * 2 ** 20))
@@ -0,0 +1,66 @@
+import pandas as pd
+from utils.vocab import encode_columns
+from utils.timeline import PatientTimeline
+
+# Profile JSON field name -> column name shown in the Genomics Deep Dive tables
+MUTATION_COLUMNS = {
+    'gene': 'hugo_symbol',
+    'protein_change': 'HGVSp_Short',
+    'variant_classification': 'variant_classification',
+    'chromosome': 'chromosome',
+    'position': 'start_position',
+    'ref_allele': 'reference_allele',
+    'alt_allele': 'tumor_seq_allele2'
+}
+CNA_COLUMNS = {
+    'gene': 'Hugo_Symbol',
+    'alteration_type': 'Alteration_Type',
+    'gistic_value': 'GISTIC_value'
+}
+SV_COLUMNS = {
+    'site1_gene': 'SITE1_HUGO_SYMBOL',
+    'site2_gene': 'SITE2_HUGO_SYMBOL',
+    'sv_type': 'SV_STATUS',
+    'site1_chromosome': 'SITE1_CHROMOSOME',
+    'site2_chromosome': 'SITE2_CHROMOSOME'
+}
+TIMELINE_KEYS = ['surgery', 'radiation', 'progression', 'tumor_sites']
+
+
+def get_treatment_lines(profile):
+    """Returns treatment lines from either the nested (Schema A) or flat (Schema B) layout."""
+    treatments = profile.get('treatments', {}).get('drug_therapy', {}).get('lines', [])
+    if not treatments:
+        treatments = profile.get('treatment', [])
+    return treatments
+
+
+def get_timeline_events(profile, key):
+    """Returns timeline events nested under 'timeline' (Schema A) or at the top level (Schema B)."""
+    events = profile.get('timeline', {}).get(key, [])
+    if not events:
+        events = profile.get(key, [])
+    return events
+
+
+def normalize_sample(sample_data):
+    """Builds the display DataFrames (mutations, CNA, SV) for one genomic sample.
+
+    Genes, classifications, chromosomes etc. become categoricals over the
+    shared vocabularies in utils.vocab, so each table stores integer codes.
+    """
+    return {
+        'mutations': encode_columns(pd.DataFrame(sample_data.get('mutations', []))).rename(columns=MUTATION_COLUMNS),
+        'cna': encode_columns(pd.DataFrame(sample_data.get('copy_number_alterations', []))).rename(columns=CNA_COLUMNS),
+        'sv': encode_columns(pd.DataFrame(sample_data.get('structural_variants', []))).rename(columns=SV_COLUMNS),
+    }
+
+
+def normalize_profile(profile):
+    """Builds the treatment and timeline DataFrames the Clinical Deep Dive renders, plus the combined event timeline."""
+    tables = {
+        'treatments': pd.DataFrame(get_treatment_lines(profile)),
+        'timeline': {key: pd.DataFrame(get_timeline_events(profile, key)) for key in TIMELINE_KEYS},
+    }
+    tables['events'] = PatientTimeline(tables)
+    return tables
@@ -0,0 +1,201 @@
+import json
+import hashlib
+from collections import defaultdict
+from collections.abc import Mapping
+
+# Fields that belong to one direction of a pair and are kept per analysis
+DIRECTION_FIELDS = ('query_patient_id', 'twin_id', 'rank', 'filename')
+
+# (section, query-side key, twin-side key) swapped when a pair is read the other way round
+ROLE_FIELDS = [
+    ('clinical_summary', 'query', 'twin'),
+    ('phenotype_comparison', 'query_only', 'twin_only'),
+    ('genomic_comparison', 'query_unique', 'twin_unique'),
+    ('treatment_comparison', 'query_treatments', 'twin_treatments'),
+]
+
+
+def canonical_pair_key(patient_a, patient_b):
+    """Returns the same key for A_vs_B and B_vs_A."""
+    return '|'.join(sorted((str(patient_a), str(patient_b))))
+
+
+def swap_roles(content):
+    """Returns `content` as seen from the twin's side (query and twin fields exchanged)."""
+    swapped = dict(content)
+    for section, query_key, twin_key in ROLE_FIELDS:
+        value = content.get(section)
+        if isinstance(value, dict):
+            swapped[section] = _swap_keys(value, query_key, twin_key)
+    for key in ('key_differences', 'differences'):
+        diffs = content.get(key)
+        if isinstance(diffs, list):
+            swapped[key] = [_swap_keys(d, 'query_value', 'twin_value') if isinstance(d, dict) else d
+                            for d in diffs]
+    return swapped
+
+
+def _swap_keys(d, key_a, key_b):
+    swapped = {k: v for k, v in d.items() if k not in (key_a, key_b)}
+    if key_b in d:
+        swapped[key_a] = d[key_b]
+    if key_a in d:
+        swapped[key_b] = d[key_a]
+    return swapped
+
+
+class PairAnalysis(Mapping):
+    """One direction of a twin analysis over content shared by both directions.
+
+    Reads like the analysis dict it replaces. The shared content is stored in
+    canonical orientation (lower patient id as query); the reverse direction
+    swaps query/twin fields on first access.
+    """
+
+    __slots__ = ('_content', '_direction', '_reversed', '_view')
+
+    def __init__(self, content, direction, reversed_):
+        self._content = content
+        self._direction = direction
+        self._reversed = reversed_
+        self._view = None
+
+    @property
+    def content(self):
+        """The shared payload, in canonical orientation."""
+        return self._content
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @property
+    def reversed(self):
+        """True if this analysis reads the shared payload with query and twin swapped."""
+        return self._reversed
+
+    def _data(self):
+        if self._view is None:
+            self._view = swap_roles(self._content) if self._reversed else self._content
+        return self._view
+
+    def __getitem__(self, key):
+        if key in self._direction:
+            return self._direction[key]
+        return self._data()[key]
+
+    def __iter__(self):
+        yield from self._direction
+        yield from (k for k in self._content if k not in self._direction)
+
+    def __len__(self):
+        return len(self._direction) + sum(1 for k in self._content if k not in self._direction)
+
+    def __contains__(self, key):
+        return key in self._direction or key in self._content
+
+
+class PairIndex:
+    """Result of dedupe_analyses: lookups by pair and what was merged.
+
+    Can also be grown one analysis at a time with add()/remove(), which is
+    how live ingestion keeps it current.
+    """
+
+    def __init__(self):
+        self.by_pair = defaultdict(list)  # canonical key -> [PairAnalysis]
+        self.collisions = []
+        self.shared_payloads = 0
+        self.analyses = 0
+        self._payloads = {}                    # content digest -> [shared content, number of analyses using it]
+        self._seen = {}                        # (query, twin, rank, digest) -> PairAnalysis
+        self._by_direction = defaultdict(dict)  # (query, twin) -> {id(PairAnalysis): (PairAnalysis, digest)}
+        self._collisions = {}                  # (query, twin) -> entry in self.collisions
+
+    def lookup(self, query_patient_id, twin_id):
+        """Returns the analyses of `query_patient_id` against `twin_id`, in that direction."""
+        return [a for a in self.by_pair.get(canonical_pair_key(query_patient_id, twin_id), [])
+                if a['query_patient_id'] == query_patient_id and a['twin_id'] == twin_id]
+
+    def add(self, a):
+        """Indexes analysis dict `a` and returns its PairAnalysis, or None if it exactly duplicates one already indexed."""
+        direction = {k: a[k] for k in DIRECTION_FIELDS if k in a}
+        query, twin = a.get('query_patient_id'), a.get('twin_id')
+        reversed_ = str(query) > str(twin)
+        content = {k: v for k, v in a.items() if k not in DIRECTION_FIELDS}
+        if reversed_:
+            # Swapping is its own inverse, so this gives the canonical orientation
+            content = swap_roles(content)
+        digest = _content_hash(content)
+        seen_key = (query, twin, str(a.get('rank')), digest)
+        if seen_key in self._seen:
+            return None
+        payload = self._payloads.setdefault(digest, [content, 0])
+        payload[1] += 1
+        content = payload[0]
+
+        pair = PairAnalysis(content, direction, reversed_)
+        self._seen[seen_key] = pair
+        self.by_pair[canonical_pair_key(query, twin)].append(pair)
+        self._by_direction[(query, twin)][id(pair)] = (pair, digest)
+        self._update_collision(query, twin)
+        self.shared_payloads = len(self._payloads)
+        self.analyses += 1
+        return pair
+
+    def remove(self, pair):
+        """Drops a PairAnalysis returned by add(), e.g. before indexing a newer version of its file."""
+        query, twin = pair['query_patient_id'], pair['twin_id']
+        entry = self._by_direction.get((query, twin), {}).pop(id(pair), None)
+        if entry is None:
+            return
+        digest = entry[1]
+        self._seen.pop((query, twin, str(pair.get('rank')), digest), None)
+        key = canonical_pair_key(query, twin)
+        self.by_pair[key].remove(pair)
+        if not self.by_pair[key]:
+            del self.by_pair[key]
+        # The payload goes once the last analysis reading it does
+        payload = self._payloads[digest]
+        payload[1] -= 1
+        if payload[1] == 0:
+            del self._payloads[digest]
+        self._update_collision(query, twin)
+        if not self._by_direction[(query, twin)]:
+            del self._by_direction[(query, twin)]
+        self.shared_payloads = len(self._payloads)
+        self.analyses -= 1
+
+    def _update_collision(self, query, twin):
+        entries = self._by_direction[(query, twin)]
+        entry = self._collisions.get((query, twin))
+        if len({digest for _, digest in entries.values()}) > 1:
+            if entry is None:
+                entry = self._collisions[(query, twin)] = {'query_patient_id': query, 'twin_id': twin}
+                self.collisions.append(entry)
+            entry['files'] = sorted(str(p.get('filename')) for p, _ in entries.values())
+        elif entry is not None:
+            self.collisions.remove(self._collisions.pop((query, twin)))
+
+
+def _content_hash(content):
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def dedupe_analyses(analyses):
+    """Stores each pair's content once for both directions.
+
+    A_vs_B and B_vs_A analyses whose content matches after swapping roles (and
+    identical re-runs) share a single payload; only the direction fields
+    (query/twin ids, rank, filename) are kept per analysis. Analyses of the
+    same directed pair with different content are kept apart and reported as
+    collisions; exact duplicates (same direction, rank and content) are
+    dropped. Returns (analyses, PairIndex).
+    """
+    index = PairIndex()
+    deduped = []
+    for a in analyses:
+        pair = index.add(a)
+        if pair is not None:
+            deduped.append(pair)
+    return deduped, index
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import threading
+from collections.abc import Mapping
+from concurrent.futures import Future
+
+from utils.data_loader import JSON_SUFFIXES, load_twin_analyses, load_patient_profiles
+from utils.profile_store import get_clinical_profile, get_sample_index, get_sample, get_samples, get_content_digest
+from utils.disk_cache import combine_digests
+from utils.validation import validate_directory
+from utils.pairs import dedupe_analyses
+from utils.search import load_search_index
+from utils.cohort import build_treatment_matrices
+from utils.memory import GOVERNOR
+
+CATALOG_FILENAME = "catalog.json"
+ANALYSES_DIRNAME = "final_twin_analysis_2"
+PROFILES_DIRNAME = "patient_profiles_2"
+# Partitions nobody has touched for this long are dropped from memory
+DEFAULT_IDLE_SECONDS = 15 * 60
+
+
+def is_partitioned_root(root):
+    return os.path.exists(os.path.join(root, CATALOG_FILENAME))
+
+
+def read_catalog(root):
+    with open(os.path.join(root, CATALOG_FILENAME)) as f:
+        return json.load(f)
+
+
+def build_catalog(root):
+    """Writes catalog.json for every partition directory under `root`.
+
+    A partition is a subdirectory holding the usual analyses and/or profiles
+    directories. Its name is used as the patient-id prefix it covers, unless
+    the existing catalog says otherwise (partitions by cohort or run have no
+    prefix and are found by probing for the patient's profile file).
+    """
+    previous = {}
+    if is_partitioned_root(root):
+        previous = {p['name']: p for p in read_catalog(root)['partitions']}
+
+    partitions = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        analyses_dir = os.path.join(path, ANALYSES_DIRNAME)
+        profiles_dir = os.path.join(path, PROFILES_DIRNAME)
+        if not os.path.isdir(analyses_dir) and not os.path.isdir(profiles_dir):
+            continue
+        partitions.append({
+            'name': name,
+            'prefix': previous.get(name, {}).get('prefix', name),
+            'analyses': os.path.relpath(analyses_dir, root),
+            'profiles': os.path.relpath(profiles_dir, root),
+            'analysis_count': _count_documents(analyses_dir),
+            'patient_count': _count_documents(profiles_dir),
+        })
+
+    catalog = {'version': 1, 'partitions': partitions}
+    tmp_path = os.path.join(root, f"{CATALOG_FILENAME}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(tmp_path, os.path.join(root, CATALOG_FILENAME))
+    return catalog
+
+
+def _count_documents(directory):
+    if not os.path.isdir(directory):
+        return 0
+    return sum(1 for f in os.listdir(directory) if f.endswith(JSON_SUFFIXES))
+
+
+class _Partition:
+    def __init__(self, analyses, pair_index, search_index, patient_profiles, reports):
+        self.analyses = analyses
+        self.pair_index = pair_index
+        self.search_index = search_index
+        self.patient_profiles = patient_profiles
+        self.reports = reports
+        self.treatment_matrices = None  # built on first use, see PartitionedDataset.treatment_matrices
+        self.last_access = time.monotonic()
+
+
+class PartitionedDataset:
+    """A dataset root split into partitions listed in catalog.json.
+
+    Only the catalog is read up front. A partition's analyses are validated
+    and loaded, and its profiles indexed, the first time something in it is
+    used; partitions idle for longer than `idle_seconds` are evicted and
+    reloaded on next use. A partition loads without holding the dataset's
+    lock, so sessions on other partitions aren't held up, and sessions
+    asking for the same partition wait for the one load. The partition
+    passed to activate() is pinned so the memory governor never evicts it.
+    """
+
+    def __init__(self, root, idle_seconds=DEFAULT_IDLE_SECONDS):
+        self.root = root
+        self.idle_seconds = idle_seconds
+        self.catalog = read_catalog(root)
+        self._entries = {p['name']: p for p in self.catalog['partitions']}
+        # Longest prefix first so 'P-001' wins over 'P-00'
+        self._prefixed = sorted((p for p in self.catalog['partitions'] if p.get('prefix')),
+                                key=lambda p: len(p['prefix']), reverse=True)
+        self._loaded = {}
+        self._loading = {}  # name -> Future of the partition being loaded
+        self._active = None
+        self._lock = threading.Lock()
+        # Profiles are accounted by their own stores; this covers analyses and indexes
+        self._memory = GOVERNOR.register("partitions", self._evict)
+        self.patient_profiles = PartitionedProfiles(self)
+
+    @property
+    def partition_names(self):
+        return list(self._entries)
+
+    def _path(self, entry, key):
+        return os.path.join(self.root, entry[key])
+
+    def _load(self, name):
+        entry = self._entries[name]
+        reports = []
+        analyses = []
+        analyses_dir = self._path(entry, 'analyses')
+        if os.path.isdir(analyses_dir):
+            reports.append(validate_directory(analyses_dir, "analysis"))
+            analyses = load_twin_analyses(analyses_dir, exclude=reports[-1].rejected)
+        analyses, pair_index = dedupe_analyses(analyses)
+        search_index = load_search_index(analyses, os.path.abspath(analyses_dir))
+        profiles = {}
+        profiles_dir = self._path(entry, 'profiles')
+        if os.path.isdir(profiles_dir):
+            reports.append(validate_directory(profiles_dir, "profile"))
+            profiles = load_patient_profiles(profiles_dir, lazy=True, exclude=reports[-1].rejected)
+        return _Partition(analyses, pair_index, search_index, profiles, reports)
+
+    def partition(self, name):
+        """Returns the loaded partition `name`, loading it on first use."""
+        with self._lock:
+            self._evict_idle(keep=name)
+            part = self._loaded.get(name)
+            if part is not None:
+                part.last_access = time.monotonic()
+            else:
+                future = self._loading.get(name)
+                loading = future is None
+                if loading:
+                    future = self._loading[name] = Future()
+        if part is not None:
+            GOVERNOR.touch(self._memory, name)
+            return part
+        if not loading:
+            return future.result()
+        try:
+            part = self._load(name)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._loaded[name] = part
+            del self._loading[name]
+        future.set_result(part)
+        self._account(name, part)
+        return part
+
+    def activate(self, name):
+        """Returns partition `name` as the one being served, pinned in memory until another is activated."""
+        with self._lock:
+            previous, self._active = self._active, name
+        part = self.partition(name)
+        if previous != name:
+            with self._lock:
+                previous_part = self._loaded.get(previous)
+            self._account(name, part)
+            if previous_part is not None:
+                self._account(previous, previous_part)
+        return part
+
+    def _account(self, name, part):
+        # Outside self._lock: the governor may call _evict right away
+        GOVERNOR.account(self._memory, name,
+                         [part.analyses, part.pair_index, part.search_index, part.treatment_matrices],
+                         pinned=name == self._active)
+
+    def _evict(self, name):
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def _evict_idle(self, keep=None):
+        now = time.monotonic()
+        for name in [n for n, p in self._loaded.items()
+                     if n not in (keep, self._active) and now - p.last_access > self.idle_seconds]:
+            del self._loaded[name]
+            GOVERNOR.release(self._memory, name)
+
+    def loaded_partitions(self):
+        with self._lock:
+            self._evict_idle()
+            return dict(self._loaded)
+
+    def analyses(self, name):
+        return self.partition(name).analyses
+
+    def validation_reports(self, name):
+        return self.partition(name).reports
+
+    def pair_index(self, name):
+        return self.partition(name).pair_index
+
+    def search_index(self, name):
+        return self.partition(name).search_index
+
+    def treatment_matrices(self, name):
+        """Treatment matrices over the partition's patients and all twins of its analyses.
+
+        Built outside the partition lock, since twins may live in other
+        partitions that have to be loaded.
+        """
+        part = self.partition(name)
+        if part.treatment_matrices is None:
+            patient_ids = set(part.patient_profiles)
+            patient_ids.update(a.get('twin_id') for a in part.analyses)
+            part.treatment_matrices = build_treatment_matrices(
+                self.patient_profiles, part.analyses, patient_ids=sorted(patient_ids, key=str))
+            self._account(name, part)
+        return part.treatment_matrices
+
+    def partition_for_patient(self, patient_id):
+        """Finds the partition holding `patient_id`'s profile without loading any partition."""
+        if not isinstance(patient_id, str):
+            return None
+        for entry in self._prefixed:
+            if patient_id.startswith(entry['prefix']):
+                return entry['name']
+        # Cohort/run partitions: look for the profile file instead
+        for entry in self.catalog['partitions']:
+            if entry.get('prefix'):
+                continue
+            profiles_dir = self._path(entry, 'profiles')
+            if any(os.path.exists(os.path.join(profiles_dir, patient_id + suffix)) for suffix in JSON_SUFFIXES):
+                return entry['name']
+        return None
+
+
+class PartitionedProfiles(Mapping):
+    """{patient_id: profile} view across all partitions of a PartitionedDataset.
+
+    Lookups are routed to the owning partition, loading it if needed. Iterating
+    only lists patients of the partitions currently loaded, so a patient
+    selector never has to enumerate the whole dataset.
+    """
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def _store(self, patient_id):
+        name = self._dataset.partition_for_patient(patient_id)
+        if name is None:
+            raise KeyError(patient_id)
+        store = self._dataset.partition(name).patient_profiles
+        if patient_id not in store:
+            raise KeyError(patient_id)
+        return store
+
+    def __getitem__(self, patient_id):
+        return self._store(patient_id)[patient_id]
+
+    def __contains__(self, patient_id):
+        try:
+            self._store(patient_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for part in self._dataset.loaded_partitions().values():
+            yield from part.patient_profiles
+
+    def __len__(self):
+        return sum(len(p.patient_profiles) for p in self._dataset.loaded_partitions().values())
+
+    def clinical(self, patient_id):
+        return get_clinical_profile(self._store(patient_id), patient_id)
+
+    def content_digest(self, patient_ids=None):
+        """Digest of the profiles of `patient_ids`, or of every loaded partition's patients if None."""
+        if patient_ids is None:
+            return combine_digests((name, get_content_digest(part.patient_profiles))
+                                   for name, part in self._dataset.loaded_partitions().items())
+        by_partition = {}
+        for patient_id in patient_ids:
+            name = self._dataset.partition_for_patient(patient_id)
+            if name is not None:
+                by_partition.setdefault(name, []).append(patient_id)
+        return combine_digests((name, get_content_digest(self._dataset.partition(name).patient_profiles, ids))
+                               for name, ids in by_partition.items())
+
+    def sample_index(self, patient_id):
+        return get_sample_index(self._store(patient_id), patient_id)
+
+    def sample(self, patient_id, sample_id):
+        return get_sample(self._store(patient_id), patient_id, sample_id)
+
+    def samples(self, patient_id):
+        return get_samples(self._store(patient_id), patient_id)
@@ -0,0 +1,172 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.normalize import normalize_profile, normalize_sample
+from utils.profile_store import get_clinical_profile, get_sample_index, get_sample
+from utils.timeline import align_timelines
+from utils.profile_diff import profile_features
+from utils.memory import GOVERNOR
+
+# Normalized profile parts kept around for navigation into the deep-dive pages;
+# the memory governor may evict them sooner when over its byte budget
+MAX_CACHED_ENTRIES = 256
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="profile-prefetch")
+_lock = threading.Lock()
+_futures = OrderedDict()  # key -> (patient_profiles, Future)
+
+
+def _drop(key):
+    # Called by the memory governor when it needs the space back
+    with _lock:
+        _futures.pop(key, None)
+
+
+_memory = GOVERNOR.register("normalized profile tables", _drop)
+
+
+def _store(key, entry):
+    # Caller holds _lock
+    _futures[key] = entry
+    _futures.move_to_end(key)
+    while len(_futures) > MAX_CACHED_ENTRIES:
+        old_key, _ = _futures.popitem(last=False)
+        GOVERNOR.release(_memory, old_key)
+
+
+def _account(key, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    with _lock:
+        entry = _futures.get(key)
+        current = entry is not None and entry[1] is future
+    # Outside _lock: the governor may call _drop right away
+    if current:
+        GOVERNOR.account(_memory, key, future.result())
+
+
+def _submit(patient_profiles, key, compute):
+    with _lock:
+        entry = _futures.get(key)
+        # Entries built from a previous load of the dataset are stale
+        created = entry is None or entry[0] is not patient_profiles
+        if created:
+            future = _executor.submit(compute)
+            _store(key, (patient_profiles, future))
+        else:
+            future = entry[1]
+            _futures.move_to_end(key)
+            GOVERNOR.touch(_memory, key)
+    if created:
+        future.add_done_callback(lambda f: _account(key, f))
+    return future
+
+
+def _memo(patient_profiles, key, compute):
+    """Like _submit, but computes on the calling thread.
+
+    For results derived from other cached entries: a worker waiting on
+    futures queued behind it could deadlock the pool.
+    """
+    with _lock:
+        entry = _futures.get(key)
+        if entry is not None and entry[0] is patient_profiles:
+            _futures.move_to_end(key)
+            GOVERNOR.touch(_memory, key)
+            return entry[1].result()
+    value = compute()
+    future = Future()
+    future.set_result(value)
+    with _lock:
+        _store(key, (patient_profiles, future))
+    _account(key, future)
+    return value
+
+
+def _result(key, future):
+    try:
+        return future.result()
+    except Exception:
+        # Don't keep a failed prefetch around; the next call retries it
+        with _lock:
+            entry = _futures.get(key)
+            if entry is not None and entry[1] is future:
+                del _futures[key]
+                GOVERNOR.release(_memory, key)
+        raise
+
+
+def _submit_profile(patient_profiles, patient_id):
+    return _submit(patient_profiles, ('profile', patient_id),
+                   lambda: normalize_profile(get_clinical_profile(patient_profiles, patient_id)))
+
+
+def _submit_sample_index(patient_profiles, patient_id):
+    return _submit(patient_profiles, ('samples', patient_id),
+                   lambda: get_sample_index(patient_profiles, patient_id))
+
+
+def _submit_sample(patient_profiles, patient_id, sample_id):
+    return _submit(patient_profiles, ('sample', patient_id, sample_id),
+                   lambda: normalize_sample(get_sample(patient_profiles, patient_id, sample_id) or {}))
+
+
+def prefetch_patients(patient_profiles, patient_ids):
+    """Starts loading and normalizing the given patients' profiles in the background.
+
+    Covers what the deep-dive pages show first: the clinical tables, the sample
+    list and the first sample's variant tables. Only pure data work runs on the
+    worker threads, never Streamlit calls.
+    """
+    for patient_id in patient_ids:
+        if patient_id not in patient_profiles:
+            continue
+        _submit_profile(patient_profiles, patient_id)
+        index_future = _submit_sample_index(patient_profiles, patient_id)
+
+        def prefetch_first_sample(future, patient_id=patient_id):
+            if not future.exception() and future.result():
+                _submit_sample(patient_profiles, patient_id, sorted(future.result())[0])
+        index_future.add_done_callback(prefetch_first_sample)
+
+
+def get_normalized_profile(patient_profiles, patient_id):
+    """Returns the patient's treatment and timeline DataFrames, waiting on a prefetch in flight."""
+    key = ('profile', patient_id)
+    return _result(key, _submit_profile(patient_profiles, patient_id))
+
+
+def get_sample_overview(patient_profiles, patient_id):
+    """Returns the patient's {sample_id: sample_info and variant counts} index."""
+    key = ('samples', patient_id)
+    return _result(key, _submit_sample_index(patient_profiles, patient_id))
+
+
+def get_sample_tables(patient_profiles, patient_id, sample_id):
+    """Returns one sample's mutation, CNA and SV DataFrames."""
+    key = ('sample', patient_id, sample_id)
+    return _result(key, _submit_sample(patient_profiles, patient_id, sample_id))
+
+
+def get_aligned_timelines(patient_profiles, patient_ids):
+    """Returns the patients' events stacked on a shared axis (day 0 = first treatment line)."""
+    patient_ids = tuple(pid for pid in patient_ids if pid in patient_profiles)
+    return _memo(patient_profiles, ('aligned',) + patient_ids,
+                 lambda: align_timelines({pid: get_normalized_profile(patient_profiles, pid)['events']
+                                          for pid in patient_ids}))
+
+
+def get_profile_features(patient_profiles, patient_id):
+    """Returns the patient's ProfileFeatures for ad-hoc comparisons, extracted once per patient."""
+    key = ('features', patient_id)
+    return _result(key, _submit(patient_profiles, key, lambda: profile_features(patient_profiles, patient_id)))
+
+
+def invalidate_patient(patient_id):
+    """Drops everything cached for `patient_id`, e.g. after its profile file changed."""
+    with _lock:
+        keys = [k for k in _futures if patient_id in k[1:]]
+        for key in keys:
+            del _futures[key]
+            GOVERNOR.release(_memory, key)
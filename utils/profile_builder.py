@@ -0,0 +1,332 @@
+import os
+import json
+import multiprocessing
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import load_clinical_data, load_genomics_data
+from utils.cna_matrix import ALTERATION_VALUES
+from utils.disk_cache import file_digest, combine_digests
+
+RAW_FILENAMES = ("data_clinical_patient.txt", "data_clinical_sample.txt", "data_mutations_fully_annotated_luad.csv",
+                 "data_cna_fully_annotated_luad.csv", "data_sv_fully_annotated_luad.csv")
+
+# Profile field -> (raw column names to look for, type). Names are matched case-insensitively and the
+# first one present wins; fields without a column are left out of the profiles.
+PATIENT_FIELDS = {
+    ('demographics', 'age'): (['CURRENT_AGE_DEID', 'AGE_AT_DIAGNOSIS', 'AGE'], 'number'),
+    ('demographics', 'sex'): (['SEX', 'GENDER'], 'string'),
+    ('demographics', 'race'): (['RACE'], 'string'),
+    ('demographics', 'vital_status'): (['VITAL_STATUS', 'OS_STATUS'], 'string'),
+    ('stage', 'highest_recorded'): (['STAGE_HIGHEST_RECORDED', 'STAGE', 'TUMOR_STAGE'], 'string'),
+    ('stage', 'category'): (['STAGE_CATEGORY', 'STAGE_TYPE'], 'string'),
+}
+# Looked up on the patient first, then on the patient's first sample that has a value
+BIOMARKER_FIELDS = {
+    'oncotree_code': (['ONCOTREE_CODE'], 'string'),
+    'cancer_type_detailed': (['CANCER_TYPE_DETAILED'], 'string'),
+    'tmb_nonsynonymous': (['TMB_NONSYNONYMOUS'], 'float'),
+    'msi_type': (['MSI_TYPE'], 'string'),
+    'pdl1_status': (['PDL1_STATUS', 'PD_L1_STATUS', 'PDL1'], 'string'),
+}
+SAMPLE_INFO_FIELDS = {
+    'sample_type': (['SAMPLE_TYPE'], 'string'),
+    'cancer_type_detailed': (['CANCER_TYPE_DETAILED'], 'string'),
+    'oncotree_code': (['ONCOTREE_CODE'], 'string'),
+}
+MUTATION_FIELDS = {
+    'gene': (['Hugo_Symbol', 'GENE'], 'string'),
+    'protein_change': (['HGVSp_Short', 'Protein_Change'], 'string'),
+    'variant_classification': (['Variant_Classification'], 'string'),
+    'chromosome': (['Chromosome'], 'string'),
+    'position': (['Start_Position'], 'int'),
+    'ref_allele': (['Reference_Allele'], 'string'),
+    'alt_allele': (['Tumor_Seq_Allele2'], 'string'),
+}
+CNA_FIELDS = {
+    'gene': (['Hugo_Symbol', 'GENE'], 'string'),
+    'alteration_type': (['Alteration_Type', 'ALTERATION'], 'string'),
+    'gistic_value': (['GISTIC_value', 'GISTIC', 'VALUE'], 'int'),
+}
+SV_FIELDS = {
+    'site1_gene': (['Site1_Hugo_Symbol'], 'string'),
+    'site2_gene': (['Site2_Hugo_Symbol'], 'string'),
+    'sv_type': (['SV_Status', 'Class'], 'string'),
+    'site1_chromosome': (['Site1_Chromosome'], 'string'),
+    'site2_chromosome': (['Site2_Chromosome'], 'string'),
+}
+SAMPLE_ID_COLUMNS = ['SAMPLE_ID', 'Tumor_Sample_Barcode']
+# cBioPortal codes OS_STATUS as '0:LIVING' / '1:DECEASED'
+VITAL_STATUS = {'0:LIVING': "Alive", 'LIVING': "Alive", '1:DECEASED': "Deceased", 'DECEASED': "Deceased"}
+
+
+def _key(name):
+    return str(name).strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def find_column(frame, candidates):
+    """The first column of `frame` matching one of `candidates` (case-insensitively), or None."""
+    columns = {_key(c): c for c in frame.columns}
+    for name in candidates:
+        if _key(name) in columns:
+            return columns[_key(name)]
+    return None
+
+
+def convert_column(series, kind):
+    """Object array of JSON-ready values of `kind`, with None for missing ones.
+
+    'string', 'int' and 'float' convert every value; 'number' keeps whole
+    numbers as int and the rest as float.
+    """
+    if kind == 'string':
+        if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+            # Integer codes read as floats because of missing values ('1.0' -> '1')
+            series = series.astype('Int64')
+        # Each distinct value is converted once, and rows with the same value share one string
+        codes, uniques = pd.factorize(series)
+        strings = np.array([str(v).strip() for v in uniques] + [None], dtype=object)
+        return strings[codes]
+    numbers = pd.to_numeric(series, errors='coerce')
+    if kind == 'int' or (kind == 'number' and (numbers.dropna() % 1 == 0).all()):
+        numbers = numbers.round().astype('Int64')
+    return numbers.astype(object).where(numbers.notna(), None).to_numpy(dtype=object)
+
+
+class GroupIndex:
+    """Rows of a table grouped by a key column, from one stable sort.
+
+    The rows of the i-th key (keys sorted) are order[offsets[i]:offsets[i + 1]];
+    rows with a missing key belong to no group.
+    """
+
+    def __init__(self, keys):
+        codes, self.keys = pd.factorize(pd.Series(keys, dtype=object), sort=True)
+        valid = np.flatnonzero(codes >= 0)
+        self.order = valid[np.argsort(codes[valid], kind='stable')]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(codes[valid], minlength=len(self.keys)))].tolist()
+        self._positions = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bounds(self, key):
+        """(start, stop) of `key`'s rows in `order`; (0, 0) for an unknown key."""
+        i = self._positions.get(key)
+        if i is None:
+            return 0, 0
+        return self.offsets[i], self.offsets[i + 1]
+
+
+class VariantTable:
+    """One variant table, grouped by sample, with its columns converted once and stored in group order."""
+
+    def __init__(self, frame, fields):
+        sample_column = find_column(frame, SAMPLE_ID_COLUMNS)
+        found = {field: find_column(frame, names) for field, (names, _) in fields.items()} if sample_column else {}
+        self.fields = [field for field, column in found.items() if column is not None]
+        if sample_column is None:
+            self.groups = GroupIndex([])
+            self.columns = []
+            return
+        self.groups = GroupIndex(convert_column(frame[sample_column], 'string'))
+        self.columns = [convert_column(frame[found[field]], fields[field][1])[self.groups.order]
+                        for field in self.fields]
+
+    def derive(self, field, source, compute):
+        """Adds `field` computed from the `source` field's values, if the raw table lacks it."""
+        if field in self.fields or source not in self.fields:
+            return
+        values = self.columns[self.fields.index(source)]
+        self.fields.append(field)
+        self.columns.append(np.array([None if v is None else compute(v) for v in values], dtype=object))
+
+    def count(self, sample_id):
+        start, stop = self.groups.bounds(sample_id)
+        return stop - start
+
+    def records(self, sample_id):
+        start, stop = self.groups.bounds(sample_id)
+        return [dict(zip(self.fields, row)) for row in zip(*(column[start:stop] for column in self.columns))]
+
+    def sample_ids(self):
+        return set(self.groups.keys)
+
+
+def _field_values(frame, fields, rows=None):
+    """{field: converted values} for the `fields` found in `frame` (restricted to `rows` if given)."""
+    values = {}
+    for field, (names, kind) in fields.items():
+        column = find_column(frame, names)
+        if column is not None:
+            series = frame[column] if rows is None else frame[column].iloc[rows]
+            values[field] = convert_column(series, kind)
+    return values
+
+
+class RawProfiles(Mapping):
+    """{patient_id: profile} built straight from the raw clinical and genomics tables.
+
+    Each table is grouped once, by patient or by sample, with one sort; a
+    profile is then assembled from slices of its rows when it is read, so no
+    profile JSON is needed in between. Readable in parts like ProfileStore.
+    `source_digest` identifies the raw files it was built from.
+    """
+
+    def __init__(self, clinical_patients, clinical_samples, genomics_data, source_digest=None):
+        self.source_digest = source_digest
+        patient_column = find_column(clinical_samples, ['PATIENT_ID'])
+        sample_column = find_column(clinical_samples, ['SAMPLE_ID'])
+        if patient_column is None or sample_column is None:
+            raise ValueError("The sample table needs PATIENT_ID and SAMPLE_ID columns")
+        sample_patients = convert_column(clinical_samples[patient_column], 'string')
+        sample_ids = convert_column(clinical_samples[sample_column], 'string')
+
+        # Sample rows sorted by patient, then sample id; position i of `order` is the i-th sample
+        order = np.lexsort((sample_ids.astype(str), sample_patients.astype(str)))
+        info = _field_values(clinical_samples, SAMPLE_INFO_FIELDS, order)
+        sample_biomarkers = _field_values(clinical_samples, BIOMARKER_FIELDS, order)
+        self._sample_info = {}
+        self._samples = {}  # patient_id -> [(position in order, sample_id)]
+        for i, row in enumerate(order):
+            patient_id, sample_id = sample_patients[row], sample_ids[row]
+            if patient_id is None or sample_id is None or sample_id in self._sample_info:
+                continue
+            self._sample_info[sample_id] = {field: values[i] for field, values in info.items()}
+            self._samples.setdefault(patient_id, []).append((i, sample_id))
+
+        id_column = find_column(clinical_patients, ['PATIENT_ID'])
+        patient_ids = convert_column(clinical_patients[id_column], 'string') if id_column is not None else []
+        rows = {patient_id: row for row, patient_id in enumerate(patient_ids) if patient_id is not None}
+        patient_values = _field_values(clinical_patients, PATIENT_FIELDS)
+        patient_biomarkers = _field_values(clinical_patients, BIOMARKER_FIELDS)
+
+        self._clinical = {}
+        for patient_id in sorted(rows.keys() | self._samples.keys()):
+            row = rows.get(patient_id)
+            clinical = {'demographics': {}, 'stage': {}, 'biomarkers': {}}
+            for (section, field), values in patient_values.items():
+                value = values[row] if row is not None else None
+                if field == 'vital_status' and value is not None:
+                    value = VITAL_STATUS.get(value.upper(), value)
+                clinical[section][field] = value
+            for field in [f for f in BIOMARKER_FIELDS if f in patient_biomarkers or f in sample_biomarkers]:
+                value = patient_biomarkers[field][row] if row is not None and field in patient_biomarkers else None
+                if value is None and field in sample_biomarkers:
+                    value = next((sample_biomarkers[field][i] for i, _ in self._samples.get(patient_id, [])
+                                  if sample_biomarkers[field][i] is not None), None)
+                clinical['biomarkers'][field] = value
+            self._clinical[patient_id] = {'patient_id': patient_id, 'clinical': clinical}
+        self._samples = {p: [sample_id for _, sample_id in samples] for p, samples in self._samples.items()}
+
+        self._variants = {
+            'mutations': VariantTable(genomics_data.get('mutations', pd.DataFrame()), MUTATION_FIELDS),
+            'copy_number_alterations': VariantTable(genomics_data.get('cna', pd.DataFrame()), CNA_FIELDS),
+            'structural_variants': VariantTable(genomics_data.get('sv', pd.DataFrame()), SV_FIELDS),
+        }
+        self._variants['copy_number_alterations'].derive(
+            'gistic_value', 'alteration_type', lambda v: ALTERATION_VALUES.get(str(v).lower()))
+
+    def unmatched_samples(self):
+        """Sample ids that have variants but no row in the sample table; their variants are left out."""
+        known = self._sample_info.keys()
+        return set().union(*(table.sample_ids() for table in self._variants.values())) - known
+
+    def __getitem__(self, patient_id):
+        profile = self.clinical(patient_id)
+        profile['genomics'] = {'samples': {sample_id: self.sample(patient_id, sample_id)
+                                           for sample_id in self._samples.get(patient_id, [])}}
+        return profile
+
+    def __iter__(self):
+        return iter(self._clinical)
+
+    def __len__(self):
+        return len(self._clinical)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._clinical
+
+    def content_digest(self, patient_ids=None):
+        if patient_ids is None:
+            return self.source_digest
+        return combine_digests([('raw', self.source_digest)] + [(p, '') for p in patient_ids])
+
+    def clinical(self, patient_id):
+        """Returns the profile without its 'genomics' section."""
+        if patient_id not in self._clinical:
+            raise KeyError(patient_id)
+        profile = self._clinical[patient_id]
+        return {'patient_id': patient_id,
+                'clinical': {section: dict(fields) for section, fields in profile['clinical'].items()}}
+
+    def sample_index(self, patient_id):
+        if patient_id not in self._clinical:
+            raise KeyError(patient_id)
+        return {sample_id: dict({'sample_info': dict(self._sample_info[sample_id])},
+                                **{key: table.count(sample_id) for key, table in self._variants.items()})
+                for sample_id in self._samples.get(patient_id, [])}
+
+    def sample(self, patient_id, sample_id):
+        if sample_id not in self._samples.get(patient_id, []):
+            return None
+        sample = {'sample_info': dict(self._sample_info[sample_id])}
+        for key, table in self._variants.items():
+            sample[key] = table.records(sample_id)
+        return sample
+
+
+def is_raw_directory(directory):
+    return os.path.exists(os.path.join(directory, RAW_FILENAMES[0]))
+
+
+def load_raw_profiles(directory):
+    """RawProfiles over the cBioPortal-style files in `directory` (see RAW_FILENAMES)."""
+    digest = combine_digests([(name, file_digest(os.path.join(directory, name)))
+                              for name in RAW_FILENAMES if os.path.exists(os.path.join(directory, name))])
+    clinical_patients, clinical_samples = load_clinical_data(directory)
+    return RawProfiles(clinical_patients, clinical_samples, load_genomics_data(directory), source_digest=digest)
+
+
+_worker_profiles = None
+
+
+def _init_worker(profiles):
+    global _worker_profiles
+    _worker_profiles = profiles
+
+
+def _write_chunk(args):
+    out_dir, patient_ids = args
+    for patient_id in patient_ids:
+        path = os.path.join(out_dir, f"{patient_id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            # dumps encodes in one C call; dump would write the document piece by piece
+            f.write(json.dumps(_worker_profiles[patient_id]))
+        # Renamed into place, so a running app's ingestion never reads a half-written profile
+        os.replace(tmp_path, path)
+    return len(patient_ids)
+
+
+def write_profiles(profiles, out_dir, patient_ids=None, workers=None, chunk_size=500):
+    """Writes one `<patient_id>.json` per patient (all, or `patient_ids`) to `out_dir`; returns the count.
+
+    Chunks of patients are serialized by `workers` processes (default: one
+    per CPU). Forked workers share the grouped tables instead of copying them.
+    """
+    patient_ids = list(profiles) if patient_ids is None else [p for p in patient_ids if p in profiles]
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = [(out_dir, patient_ids[i:i + chunk_size]) for i in range(0, len(patient_ids), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(profiles)
+        return sum(map(_write_chunk, chunks))
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(profiles,)) as pool:
+        return sum(pool.map(_write_chunk, chunks))
@@ -0,0 +1,163 @@
+from utils.normalize import get_treatment_lines
+from utils.profile_store import get_clinical_profile, get_samples
+
+# (label, section of profile['clinical'], field) compared between two patients
+CLINICAL_FIELDS = [
+    ('Age', 'demographics', 'age'),
+    ('Sex', 'demographics', 'sex'),
+    ('Race', 'demographics', 'race'),
+    ('Vital Status', 'demographics', 'vital_status'),
+    ('Stage', 'stage', 'highest_recorded'),
+    ('Stage Category', 'stage', 'category'),
+    ('Oncotree Code', 'biomarkers', 'oncotree_code'),
+    ('Cancer Type', 'biomarkers', 'cancer_type_detailed'),
+    ('TMB (Non-synonymous)', 'biomarkers', 'tmb_nonsynonymous'),
+    ('MSI Type', 'biomarkers', 'msi_type'),
+    ('PD-L1 Status', 'biomarkers', 'pdl1_status'),
+]
+# Numeric fields that count as matching within a tolerance
+NUMERIC_TOLERANCE = {'Age': 5, 'TMB (Non-synonymous)': 2.0}
+
+
+class ProfileFeatures:
+    """What a profile comparison needs from one patient, extracted once.
+
+    Alterations and treatments are dicts keyed by hashable tuples (gene,
+    change), (gene, alteration type), (gene, gene) and agent, with display
+    labels as values, so comparing two patients is a few set operations on
+    the keys.
+    """
+
+    __slots__ = ('patient_id', 'clinical', 'mutations', 'cna', 'sv', 'treatments')
+
+    def __init__(self, patient_id, clinical, mutations, cna, sv, treatments):
+        self.patient_id = patient_id
+        self.clinical = clinical
+        self.mutations = mutations
+        self.cna = cna
+        self.sv = sv
+        self.treatments = treatments
+
+
+def profile_features(patient_profiles, patient_id):
+    """Reads `patient_id`'s clinical fields, alterations over all samples and treatment agents."""
+    profile = get_clinical_profile(patient_profiles, patient_id)
+    clinical_data = profile.get('clinical', {})
+    clinical = {}
+    for label, section, field in CLINICAL_FIELDS:
+        value = (clinical_data.get(section) or {}).get(field)
+        if value not in (None, ''):
+            clinical[label] = value
+
+    mutations, cna, sv = {}, {}, {}
+    for _, sample in get_samples(patient_profiles, patient_id):
+        sample = sample or {}
+        for m in sample.get('mutations', []):
+            key = (m.get('gene'), m.get('protein_change'))
+            mutations[key] = ' '.join(str(part) for part in key if part)
+        for c in sample.get('copy_number_alterations', []):
+            key = (c.get('gene'), c.get('alteration_type'))
+            cna[key] = ' '.join(str(part) for part in key if part)
+        for s in sample.get('structural_variants', []):
+            key = (s.get('site1_gene'), s.get('site2_gene'))
+            sv[key] = '::'.join(str(part) for part in key if part)
+
+    treatments = {}
+    for line in get_treatment_lines(profile):
+        agent = line.get('agent') if isinstance(line, dict) else None
+        if agent:
+            treatments[str(agent).upper()] = str(agent)
+    return ProfileFeatures(patient_id, clinical, mutations, cna, sv, treatments)
+
+
+def _values_match(label, query_value, twin_value):
+    tolerance = NUMERIC_TOLERANCE.get(label)
+    if tolerance is not None:
+        try:
+            return abs(float(query_value) - float(twin_value)) <= tolerance
+        except (TypeError, ValueError):
+            pass
+    return str(query_value) == str(twin_value)
+
+
+def _format(value):
+    return f"{value:.2f}" if isinstance(value, float) else value
+
+
+def _by_field(clinical):
+    # The Twin Comparison table titles its keys itself
+    return {field: clinical[label] for label, _, field in CLINICAL_FIELDS if label in clinical}
+
+
+def compare_profiles(query, twin):
+    """Compares two ProfileFeatures and returns the result shaped like a twin analysis.
+
+    Only the sections Analysis Detail renders are filled in: clinical
+    summary, phenotype and genomic comparison, key differences, treatment
+    comparison and match percentages (share of matching clinical fields and
+    overlap of all alterations).
+    """
+    phenotypes = {'shared': [], 'query_only': [], 'twin_only': []}
+    differences = []
+    compared = matched = 0
+    for label, _, _ in CLINICAL_FIELDS:
+        query_value, twin_value = query.clinical.get(label), twin.clinical.get(label)
+        if query_value is None and twin_value is None:
+            continue
+        if query_value is None:
+            phenotypes['twin_only'].append(f"{label}: {_format(twin_value)}")
+            continue
+        if twin_value is None:
+            phenotypes['query_only'].append(f"{label}: {_format(query_value)}")
+            continue
+        compared += 1
+        if _values_match(label, query_value, twin_value):
+            matched += 1
+            phenotypes['shared'].append(f"{label}: {_format(query_value)}")
+        else:
+            differences.append({'feature': label, 'query_value': _format(query_value),
+                                'twin_value': _format(twin_value)})
+
+    shared_variants, query_unique, twin_unique = [], [], []
+    for kind, significance in (('mutations', "Shared mutation"), ('cna', "Shared copy number alteration"),
+                               ('sv', "Shared structural variant")):
+        query_keys, twin_keys = getattr(query, kind), getattr(twin, kind)
+        for key in sorted(query_keys.keys() & twin_keys.keys(), key=str):
+            # Mutation and CNA keys are (gene, change); a fusion is shown under its label
+            gene, variant = (query_keys[key], '') if kind == 'sv' else (key[0], key[1] or '')
+            shared_variants.append({'gene': gene, 'variant': variant, 'clinical_significance': significance})
+        query_unique += sorted(query_keys[k] for k in query_keys.keys() - twin_keys.keys())
+        twin_unique += sorted(twin_keys[k] for k in twin_keys.keys() - query_keys.keys())
+
+    all_query = query.mutations.keys() | query.cna.keys() | query.sv.keys()
+    all_twin = twin.mutations.keys() | twin.cna.keys() | twin.sv.keys()
+    union = len(all_query | all_twin)
+    genomic_pct = round(100 * len(shared_variants) / union) if union else 0
+    clinical_pct = round(100 * matched / compared) if compared else 0
+
+    shared_treatments = sorted(query.treatments[k] for k in query.treatments.keys() & twin.treatments.keys())
+    shared_genes = sorted({v['gene'] for v in shared_variants if v['gene']})
+    return {
+        'query_patient_id': query.patient_id,
+        'twin_id': twin.patient_id,
+        'rank': '-',
+        'similarity_score': round((clinical_pct + genomic_pct) / 200, 3),
+        'clinical_pct': clinical_pct,
+        'genomic_pct': genomic_pct,
+        'clinical_summary': {'query': _by_field(query.clinical), 'twin': _by_field(twin.clinical)},
+        'shared_features': {'biomarkers': shared_genes},
+        'summary': (f"Computed from the two profiles: {matched} of {compared} clinical fields match, "
+                    f"{len(shared_variants)} alteration(s) are shared and "
+                    f"{len(shared_treatments)} treatment agent(s) were given to both patients."),
+        'phenotype_comparison': phenotypes,
+        'key_differences': differences,
+        'genomic_comparison': {'shared_variants': shared_variants,
+                               'query_unique': query_unique, 'twin_unique': twin_unique},
+        'treatment_comparison': {
+            'query_treatments': sorted(query.treatments.values()),
+            'twin_treatments': sorted(twin.treatments.values()),
+            'treatment_overlap': ', '.join(shared_treatments) if shared_treatments else "None",
+        },
+        'match_quality': {'overall_assessment': "Ad-hoc comparison computed from the patient profiles; "
+                                                "no precomputed twin analysis is involved."},
+    }
@@ -0,0 +1,253 @@
+import re
+import json
+
+from utils.data_loader import open_data_file
+
+# Skips everything up to the next bracket outside a string (group 1), in C. Group 1 is
+# instead the opening quote of a string that runs past the end of the buffer, or empty
+# at the end of the buffer. Every position has a way to end the match, so it never
+# backtracks more than one string.
+_NEXT_BRACKET = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*([{}\[\]]|"|\Z)', re.DOTALL)
+# What may still follow a number that the decoder stopped at: its fraction or exponent
+_NUMBER_TAIL = re.compile(r'[.eE][-+0-9.eE]*')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,\]}\s]')
+_WHITESPACE = ' \t\n\r'
+
+CHUNK_SIZE = 1 << 16
+
+_DECODER = json.JSONDecoder()
+
+
+class JsonStreamReader:
+    """Incremental reader for one JSON document.
+
+    Walks the document token by token from a text stream, so callers can pick
+    out the subtrees they need and skip everything else. Skipped values are
+    never materialized and the read buffer stays around one chunk in size,
+    except while a value is being read: the buffer then grows fourfold until
+    it holds the whole value, which is decoded by the C parser in one go.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size=None):
+        data = self._f.read(size or self._chunk_size)
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        self._eof = not data
+        return bool(data)
+
+    def _fill_or_fail(self):
+        if not self._fill():
+            raise ValueError("Unexpected end of JSON document")
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._fill_or_fail()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self._pos}, found '{self._buf[self._pos]}'")
+        self._pos += 1
+
+    def _skip_string(self):
+        self._pos += 1  # opening quote
+        while True:
+            m = _STRING_SPECIAL.search(self._buf, self._pos)
+            if m is None:
+                self._pos = len(self._buf)
+                self._fill_or_fail()
+                continue
+            k = m.start()
+            if self._buf[k] == '"':
+                self._pos = k + 1
+                return
+            # Backslash escape: the escaped character may not be buffered yet
+            if k + 1 >= len(self._buf):
+                self._pos = k
+                self._fill_or_fail()
+                continue
+            self._pos = k + 2
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            for m in _NEXT_BRACKET.finditer(self._buf, self._pos):
+                char = m.group(1)
+                if char in ('"', ''):
+                    # Out of buffer, possibly inside a string: rescan from there after the next read
+                    self._pos = m.start(1)
+                    break
+                depth += 1 if char in '{[' else -1
+                if depth == 0:
+                    self._pos = m.end()
+                    return
+            self._fill_or_fail()
+
+    def _skip_scalar(self):
+        while True:
+            m = _SCALAR_END.search(self._buf, self._pos)
+            if m is not None:
+                self._pos = m.start()
+                return
+            self._pos = len(self._buf)
+            if not self._fill():
+                return
+
+    def skip_value(self):
+        """Consumes the next value without building it."""
+        char = self.peek()
+        if char == '"':
+            self._skip_string()
+        elif char in '{[':
+            self._skip_container()
+        else:
+            self._skip_scalar()
+
+    def read_value(self):
+        """Consumes and returns the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+                # A number cut off by the end of the buffer decodes as a prefix of itself (2 for
+                # 2.5e3), so it is only taken once something other than its digits follows
+                if self._eof or not (isinstance(value, (int, float)) and not isinstance(value, bool)
+                                     and (end == len(self._buf) or _NUMBER_TAIL.fullmatch(self._buf, end))):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Growing the buffer geometrically keeps the failed decode attempts linear in the value's size
+            self._fill(max(self._chunk_size, 3 * (len(self._buf) - self._pos)))
+
+    def iter_object(self):
+        """Iterates over the keys of the next object.
+
+        After each key the reader is positioned at its value, which the caller
+        must consume (read_value, skip_value, or a nested iteration) before
+        asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError(f"Expected an object key at offset {self._pos}")
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self._pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or '}}' at offset {self._pos - 1}")
+
+    def count_array(self):
+        """Consumes the next array and returns its length; null counts as empty."""
+        if self.peek() != '[':
+            self.skip_value()
+            return 0
+        self._pos += 1
+        if self.peek() == ']':
+            self._pos += 1
+            return 0
+        count = 0
+        while True:
+            self.skip_value()
+            count += 1
+            char = self.peek()
+            self._pos += 1
+            if char == ']':
+                return count
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' at offset {self._pos - 1}")
+
+    def seek_path(self, path):
+        """Moves to the value at `path` (a sequence of object keys).
+
+        Returns False if some key is missing; the reader is then unusable.
+        """
+        for key in path:
+            if self.peek() != '{':
+                return False
+            for k in self.iter_object():
+                if k == key:
+                    break
+                self.skip_value()
+            else:
+                return False
+        return True
+
+
+def read_profile(path, exclude=('genomics',)):
+    """Reads a profile's top-level fields except the `exclude` ones (by default its genomics)."""
+    with open_data_file(path) as f:
+        reader = JsonStreamReader(f)
+        profile = {}
+        for key in reader.iter_object():
+            if key in exclude:
+                reader.skip_value()
+            else:
+                profile[key] = reader.read_value()
+        return profile
+
+
+def read_sample_index(path):
+    """Reads each sample's `sample_info` and variant counts, skipping the variants themselves.
+
+    Returns {sample_id: {'sample_info': {...}, 'mutations': n,
+    'copy_number_alterations': n, 'structural_variants': n}}.
+    """
+    with open_data_file(path) as f:
+        reader = JsonStreamReader(f)
+        if not reader.seek_path(['genomics', 'samples']) or reader.peek() != '{':
+            return {}
+        index = {}
+        for sample_id in reader.iter_object():
+            entry = {'sample_info': {}, 'mutations': 0, 'copy_number_alterations': 0, 'structural_variants': 0}
+            if reader.peek() != '{':
+                reader.skip_value()
+            else:
+                for key in reader.iter_object():
+                    if key == 'sample_info':
+                        entry['sample_info'] = reader.read_value() or {}
+                    elif key in entry:
+                        entry[key] = reader.count_array()
+                    else:
+                        reader.skip_value()
+            index[sample_id] = entry
+        return index
+
+
+def read_sample(path, sample_id):
+    """Reads a single `genomics.samples[sample_id]` subtree, or None if it is missing."""
+    with open_data_file(path) as f:
+        reader = JsonStreamReader(f)
+        if not reader.seek_path(['genomics', 'samples', sample_id]):
+            return None
+        return reader.read_value()
+
+
+def read_samples(path):
+    """Yields (sample_id, sample) for every `genomics.samples` entry, in one pass over the file."""
+    with open_data_file(path) as f:
+        reader = JsonStreamReader(f)
+        if not reader.seek_path(['genomics', 'samples']) or reader.peek() != '{':
+            return
+        for sample_id in reader.iter_object():
+            yield sample_id, reader.read_value()
@@ -0,0 +1,237 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from utils.data_loader import JSON_SUFFIXES, PACK_SUFFIXES, iter_pack_records, logical_filename
+from utils.profile_reader import read_profile, read_sample_index, read_sample, read_samples
+from utils.vocab import intern_profile
+from utils.memory import GOVERNOR
+from utils.disk_cache import file_digest, combine_digests
+
+
+class _LRU:
+    """Small thread-safe LRU dict, accounted with the memory governor under `kind`."""
+
+    def __init__(self, max_entries, kind):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory = GOVERNOR.register(kind, self._evict)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            GOVERNOR.touch(self._memory, key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                old_key, _ = self._data.popitem(last=False)
+                GOVERNOR.release(self._memory, old_key)
+        # Outside the lock: the governor may call _evict right away
+        GOVERNOR.account(self._memory, key, value)
+
+    def _evict(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        GOVERNOR.release(self._memory, key)
+
+
+class ProfileStore(Mapping):
+    """Patient profiles indexed by file path and parsed on demand.
+
+    Behaves like the {patient_id: profile} dict returned by
+    load_patient_profiles, but only lists the directory up front. Besides full
+    profiles it can stream out just the clinical part, the sample list or a
+    single sample, which keeps large multi-sample profiles out of memory.
+    Patients are keyed by file name, as in 'P-XXXXXXX.json'. Packed profiles
+    can't be read partially and are held in memory instead. Files named in
+    `exclude` are left out, as in iter_json_records.
+    """
+
+    def __init__(self, directory, max_full_profiles=8, max_partial_entries=512, exclude=()):
+        self.directory = directory
+        self._paths = {}
+        self._inline = {}
+        self._packs = []
+        for filename in os.listdir(directory):
+            filepath = os.path.join(directory, filename)
+            if filename in exclude or logical_filename(filename) in exclude:
+                continue
+            if filename.endswith(JSON_SUFFIXES):
+                self._paths[os.path.splitext(logical_filename(filename))[0]] = filepath
+            elif filename.endswith(PACK_SUFFIXES):
+                self._packs.append(filepath)
+                for packed_name, data in iter_pack_records(filepath, exclude):
+                    self._inline[data.get('patient_id', os.path.splitext(packed_name)[0])] = intern_profile(data)
+        self.max_full_profiles = max_full_profiles
+        self.max_partial_entries = max_partial_entries
+        self._make_caches()
+
+    def _make_caches(self):
+        self._full = _LRU(self.max_full_profiles, "full profiles")
+        self._clinical = _LRU(self.max_partial_entries, "clinical profiles")
+        self._sample_index = _LRU(self.max_partial_entries, "sample indexes")
+
+    # Pickled (e.g. in a startup snapshot) as just the file index and packed profiles
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in ('_full', '_clinical', '_sample_index')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_caches()
+
+    def __getitem__(self, patient_id):
+        if patient_id in self._inline:
+            return self._inline[patient_id]
+        profile = self._full.get(patient_id)
+        if profile is None:
+            profile = intern_profile(self._read(patient_id, read_profile, ()))
+            self._full.put(patient_id, profile)
+        return profile
+
+    def __iter__(self):
+        yield from self._paths
+        yield from (p for p in self._inline if p not in self._paths)
+
+    def __len__(self):
+        return len(self._paths.keys() | self._inline.keys())
+
+    def __contains__(self, patient_id):
+        return patient_id in self._paths or patient_id in self._inline
+
+    def refresh(self, filepath):
+        """Points the store at a new or rewritten profile file and drops anything cached for it.
+
+        Returns the patient id the file is stored under.
+        """
+        patient_id = os.path.splitext(logical_filename(os.path.basename(filepath)))[0]
+        self._paths[patient_id] = filepath
+        for cache in (self._full, self._clinical, self._sample_index):
+            cache.discard(patient_id)
+        return patient_id
+
+    def content_digest(self, patient_ids=None):
+        """Digest of the files holding `patient_ids` (all patients if None), from their content."""
+        if patient_ids is None:
+            patient_ids = self
+        files = [(p, file_digest(self._paths[p])) for p in patient_ids if p in self._paths]
+        if self._packs and any(p in self._inline for p in patient_ids):
+            files += [(path, file_digest(path)) for path in self._packs]
+        return combine_digests(files)
+
+    def _read(self, patient_id, reader, *args):
+        if patient_id not in self._paths:
+            raise KeyError(patient_id)
+        return reader(self._paths[patient_id], *args)
+
+    def _cached_full(self, patient_id):
+        if patient_id in self._inline:
+            return self._inline[patient_id]
+        return self._full.get(patient_id)
+
+    def clinical(self, patient_id):
+        """Returns the profile without its 'genomics' section."""
+        full = self._cached_full(patient_id)
+        if full is not None:
+            return {k: v for k, v in full.items() if k != 'genomics'}
+        profile = self._clinical.get(patient_id)
+        if profile is None:
+            profile = self._read(patient_id, read_profile)
+            self._clinical.put(patient_id, profile)
+        return profile
+
+    def sample_index(self, patient_id):
+        """Returns {sample_id: sample_info and variant counts} without reading the variants."""
+        full = self._cached_full(patient_id)
+        if full is not None:
+            return summarize_samples(full)
+        index = self._sample_index.get(patient_id)
+        if index is None:
+            index = self._read(patient_id, read_sample_index)
+            self._sample_index.put(patient_id, index)
+        return index
+
+    def sample(self, patient_id, sample_id):
+        """Returns one `genomics.samples[sample_id]` subtree, or None if it is missing."""
+        full = self._cached_full(patient_id)
+        if full is not None:
+            return full.get('genomics', {}).get('samples', {}).get(sample_id)
+        return self._read(patient_id, read_sample, sample_id)
+
+    def samples(self, patient_id):
+        """Yields (sample_id, sample) for each of the patient's samples, reading the file once."""
+        full = self._cached_full(patient_id)
+        if full is not None:
+            yield from full.get('genomics', {}).get('samples', {}).items()
+        else:
+            yield from self._read(patient_id, read_samples)
+
+
+def summarize_samples(profile):
+    """Builds the same per-sample index as read_sample_index from an in-memory profile."""
+    index = {}
+    for sample_id, data in profile.get('genomics', {}).get('samples', {}).items():
+        index[sample_id] = {
+            'sample_info': data.get('sample_info', {}),
+            'mutations': len(data.get('mutations', [])),
+            'copy_number_alterations': len(data.get('copy_number_alterations', [])),
+            'structural_variants': len(data.get('structural_variants', [])),
+        }
+    return index
+
+
+# The helpers below accept a plain {patient_id: profile} dict or any mapping
+# that can read profiles partially (ProfileStore, PartitionedProfiles)
+
+def get_clinical_profile(patient_profiles, patient_id):
+    """Returns the patient's profile, without genomics when it can be read partially."""
+    if hasattr(patient_profiles, 'clinical'):
+        return patient_profiles.clinical(patient_id)
+    return patient_profiles[patient_id]
+
+
+def get_sample_index(patient_profiles, patient_id):
+    """Returns {sample_id: {'sample_info', 'mutations', 'copy_number_alterations', 'structural_variants'}}."""
+    if hasattr(patient_profiles, 'sample_index'):
+        return patient_profiles.sample_index(patient_id)
+    return summarize_samples(patient_profiles[patient_id])
+
+
+def get_content_digest(patient_profiles, patient_ids=None):
+    """Content digest of the profiles of `patient_ids` (all if None), or None if the mapping can't tell."""
+    if hasattr(patient_profiles, 'content_digest'):
+        return patient_profiles.content_digest(patient_ids)
+    return None
+
+
+def get_sample(patient_profiles, patient_id, sample_id):
+    """Returns the raw data of one sample, or None if it is missing."""
+    if hasattr(patient_profiles, 'sample'):
+        return patient_profiles.sample(patient_id, sample_id)
+    return patient_profiles[patient_id].get('genomics', {}).get('samples', {}).get(sample_id)
+
+
+def get_samples(patient_profiles, patient_id):
+    """Yields (sample_id, sample) for each of the patient's samples.
+
+    Use this rather than get_sample per sample id when walking every sample:
+    a ProfileStore streams the file once instead of once per sample.
+    """
+    if hasattr(patient_profiles, 'samples'):
+        yield from patient_profiles.samples(patient_id)
+    elif hasattr(patient_profiles, 'sample'):
+        for sample_id in get_sample_index(patient_profiles, patient_id):
+            yield sample_id, patient_profiles.sample(patient_id, sample_id)
+    else:
+        yield from patient_profiles[patient_id].get('genomics', {}).get('samples', {}).items()
@@ -0,0 +1,201 @@
+import operator
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import build_pair_summary
+
+
+class PairRanking:
+    """Columnar clinical/genomic match percentages of every pair, re-rankable per query patient.
+
+    Built once per version of the analyses list; rerank() is pure NumPy over
+    the columns, so trying other weights costs a lexsort, not a pass over the
+    analyses.
+    """
+
+    def __init__(self, analyses, summary=None):
+        # A list can change under live ingestion, so this version's items are copied; other
+        # sequences (the shared dataset) are read-only and can be used as they are
+        self.items = list(analyses) if isinstance(analyses, list) else analyses
+        summary = build_pair_summary(self.items) if summary is None else summary
+        self._summary = summary[['analysis_id', 'query_patient_id', 'rank', 'similarity_score',
+                                 'clinical_pct', 'genomic_pct']].reset_index(drop=True)
+        self.query_codes, self.query_ids = pd.factorize(self._summary['query_patient_id'])
+        self.clinical = self._summary['clinical_pct'].to_numpy(dtype=float)
+        self.genomic = self._summary['genomic_pct'].to_numpy(dtype=float)
+        self.similarity = self._summary['similarity_score'].to_numpy(dtype=float)
+        self.original_rank = pd.to_numeric(self._summary['rank'], errors='coerce').to_numpy(dtype=float)
+        # Rows of tombstones (analyses removed by live ingestion) are left out of every order
+        self.live = np.fromiter((a is not None for a in self.items), dtype=bool, count=len(self.items))
+        self._base = None
+        self._leaderboards = {}
+        self._rows_by_id = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def row_of(self, key):
+        """Row position of the analysis with id `key`, or -1 if there is none."""
+        if self._rows_by_id is None:
+            ids = self._summary['analysis_id'].to_numpy()
+            self._rows_by_id = {ids[i]: i for i in np.flatnonzero(self.live)}
+        return self._rows_by_id.get(key, -1)
+
+    def select(self, rows):
+        """The analyses at row positions `rows`, as a sequence that looks them up on access."""
+        return RowSelection(self.items, rows)
+
+    def refreshed(self, analyses):
+        """Returns a ranking for the current `analyses`, re-reading only rows that were added or replaced."""
+        if len(analyses) < len(self.items):
+            return PairRanking(analyses)
+        current = list(analyses)
+        same = np.fromiter(map(operator.is_, current, self.items), dtype=bool, count=len(self.items))
+        changed = np.concatenate([np.flatnonzero(~same), np.arange(len(self.items), len(current))])
+        if len(changed) == 0:
+            return self
+        summary = pd.concat([self._summary, pd.DataFrame(index=range(len(self.items), len(current)),
+                                                         columns=self._summary.columns)])
+        patch = build_pair_summary([current[i] for i in changed])
+        summary.iloc[changed, :] = patch[self._summary.columns].to_numpy()
+        return PairRanking(current, summary)
+
+    def composite(self, genomic_weight):
+        """Weighted match percentage; a missing component counts as 0."""
+        clinical = np.nan_to_num(self.clinical, nan=0.0)
+        genomic = np.nan_to_num(self.genomic, nan=0.0)
+        score = (1.0 - genomic_weight) * clinical + genomic_weight * genomic
+        score[np.isnan(self.clinical) & np.isnan(self.genomic)] = np.nan
+        return score
+
+    def _base_order(self):
+        # Query patient, then original rank: the order ties fall back to
+        if self._base is None:
+            base = np.lexsort((np.nan_to_num(self.original_rank, nan=np.inf), self.query_codes))
+            self._base = base[self.live[base]]
+        return self._base
+
+    def _grouped_order(self, score):
+        """Row positions grouped by query patient, highest `score` first; ties and NaNs as in rerank()."""
+        base = self._base_order()
+        n = len(base)
+        # One stable argsort over a single float key: query code in the high part, descending score below it
+        descending = -score[base]
+        if n and not np.isnan(descending).all():
+            low, high = np.nanmin(descending), np.nanmax(descending)
+            descending = np.nan_to_num(descending, nan=high + 1) - low
+            span = high - low + 2
+        else:
+            descending, span = np.zeros(n), 1.0
+        return base[np.argsort(self.query_codes[base] * span + descending, kind='stable')]
+
+    def _group_offsets(self):
+        # Rows of query code c sit at order[offsets[c]:offsets[c + 1]] in any grouped order
+        return np.r_[0, np.cumsum(np.bincount(self.query_codes[self.live], minlength=len(self.query_ids)))]
+
+    def rerank(self, genomic_weight):
+        """Re-derives every query patient's twin ranks under `genomic_weight` (0..1).
+
+        Returns (composite scores, new ranks, order), where `order` lists row
+        positions grouped by query patient, best twin first. Ties keep the
+        original rank order; pairs without percentages go last. Tombstone rows
+        are not in `order` and get rank 0.
+        """
+        score = self.composite(genomic_weight)
+        order = self._grouped_order(score)
+        offsets = self._group_offsets()
+        group_start = np.repeat(offsets[:-1], np.diff(offsets))
+        ranks = np.zeros(len(score), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - group_start + 1
+        return score, ranks, order
+
+    def leaderboard(self, sort_by='rank'):
+        """The Leaderboard of this ranking ordered by original 'rank' or by 'score' (similarity); built once per sort."""
+        if sort_by not in self._leaderboards:
+            if sort_by == 'rank':
+                order = self._base_order()
+            elif sort_by == 'score':
+                order = self._grouped_order(self.similarity)
+            else:
+                raise ValueError(f"Unknown leaderboard sort: {sort_by}")
+            self._leaderboards[sort_by] = Leaderboard(self, order, self._group_offsets())
+        return self._leaderboards[sort_by]
+
+
+class RowSelection(Sequence):
+    """Read-only view of the items of a sequence at the given positions."""
+
+    def __init__(self, items, rows):
+        self._items = items
+        self._rows = rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[i] for i in self._rows[index]]
+        return self._items[self._rows[index]]
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class Leaderboard:
+    """Twins of every query patient in a fixed order, grouped so one patient's top k costs O(k)."""
+
+    def __init__(self, ranking, order, offsets):
+        self.ranking = ranking
+        self.order = order
+        self.offsets = offsets
+        self._codes = {query_id: code for code, query_id in enumerate(ranking.query_ids)}
+
+    @property
+    def query_ids(self):
+        return list(self.ranking.query_ids)
+
+    def twin_count(self, query_patient_id):
+        code = self._codes.get(query_patient_id)
+        return 0 if code is None else int(self.offsets[code + 1] - self.offsets[code])
+
+    def top(self, query_patient_id, k=None):
+        """Row positions of the first `k` twins of `query_patient_id` (all of them if k is None)."""
+        code = self._codes.get(query_patient_id)
+        if code is None:
+            return self.order[:0]
+        start, stop = self.offsets[code], self.offsets[code + 1]
+        if k is not None:
+            stop = min(stop, start + k)
+        return self.order[start:stop]
+
+    def top_analyses(self, query_patient_id, k=None):
+        return [self.ranking.items[i] for i in self.top(query_patient_id, k)]
+
+
+# Only a handful of analyses lists (flat data, loaded partitions) are alive at once
+MAX_CACHED_RANKINGS = 16
+
+_rankings = OrderedDict()  # id(analyses) -> (analyses, data version, PairRanking), least recently used first
+_lock = threading.Lock()
+
+
+def pair_ranking(analyses, version=0):
+    """Returns the PairRanking of `analyses` at data `version`, updating the previous one incrementally."""
+    key = id(analyses)
+    with _lock:
+        cached = _rankings.get(key)
+        # Entries hold their list, so its id can't be reused while it is cached
+        if cached is not None and cached[0] is not analyses:
+            cached = None
+        if cached is not None:
+            _rankings.move_to_end(key)
+    if cached is not None and cached[1] == version and len(cached[2]) == len(analyses):
+        return cached[2]
+    ranking = cached[2].refreshed(analyses) if cached is not None else PairRanking(analyses)
+    with _lock:
+        _rankings[key] = (analyses, version, ranking)
+        _rankings.move_to_end(key)
+        while len(_rankings) > MAX_CACHED_RANKINGS:
+            _rankings.popitem(last=False)
+    return ranking
@@ -0,0 +1,338 @@
+import os
+import re
+import html
+import math
+import pickle
+import hashlib
+import threading
+from array import array
+
+import numpy as np
+
+from utils.data_loader import analysis_id
+
+# Narrative fields searched, as (label, dotted path)
+SEARCH_FIELDS = [
+    ('Clinical Summary', 'clinical_summary'),
+    ('Summary', 'summary'),
+    ('Key Differences', 'key_differences'),
+    ('Actionable Insights', 'actionable_insights'),
+    ('Recommendations', 'recommendations'),
+    ('Overall Assessment', 'match_quality.overall_assessment'),
+]
+INDEX_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(".cache", "search")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _flatten(value):
+    if isinstance(value, dict):
+        return ' '.join(f"{k.replace('_', ' ')}: {_flatten(v)}" for k, v in value.items())
+    if isinstance(value, list):
+        return ' '.join(_flatten(v) for v in value)
+    return '' if value is None else str(value)
+
+
+def extract_fields(analysis):
+    """Returns [(label, text)] for the searchable narrative fields of an analysis."""
+    fields = []
+    for label, path in SEARCH_FIELDS:
+        value = analysis
+        for key in path.split('.'):
+            value = value.get(key) if hasattr(value, 'get') else None
+        text = _flatten(value)
+        if text:
+            fields.append((label, text))
+    return fields
+
+
+class SearchIndex:
+    """Inverted index over analysis narratives, ranked with BM25.
+
+    Postings are append-only typed arrays, so adding documents is cheap and
+    queries read them as NumPy arrays without copying. Replaced or removed
+    analyses are tombstoned and dropped on the next compact().
+    """
+
+    def __init__(self):
+        self.doc_ids = []        # doc number -> analysis_id
+        self.doc_hashes = []     # doc number -> hash of the indexed text
+        self.lengths = array('i')
+        self.alive = array('b')
+        self.postings = {}       # term -> (array of doc numbers, array of term frequencies)
+        self._by_id = {}         # analysis_id -> live doc number
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _add(self, key, text_hash, tokens):
+        doc = len(self.doc_ids)
+        self.doc_ids.append(key)
+        self.doc_hashes.append(text_hash)
+        self.lengths.append(len(tokens))
+        self.alive.append(1)
+        self._by_id[key] = doc
+        self._total_length += len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            docs_tfs = self.postings.get(term)
+            if docs_tfs is None:
+                docs_tfs = self.postings[term] = (array('i'), array('i'))
+            docs_tfs[0].append(doc)
+            docs_tfs[1].append(tf)
+
+    def _remove(self, key):
+        doc = self._by_id.pop(key)
+        self.alive[doc] = 0
+        self._total_length -= self.lengths[doc]
+
+    def update(self, analyses):
+        """Brings the index in line with `analyses`, re-indexing only new or changed ones.
+
+        Returns the number of documents (re)indexed.
+        """
+        with self._lock:
+            current = set()
+            indexed = 0
+            for a in analyses:
+                current.add(analysis_id(a))
+                indexed += self._index(a)
+            for key in [k for k in self._by_id if k not in current]:
+                self._remove(key)
+            return indexed
+
+    def _index(self, a):
+        key = analysis_id(a)
+        text = '\n'.join(text for _, text in extract_fields(a))
+        text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        doc = self._by_id.get(key)
+        if doc is not None:
+            if self.doc_hashes[doc] == text_hash:
+                return False
+            self._remove(key)
+        self._add(key, text_hash, tokenize(text))
+        return True
+
+    def add(self, a):
+        """Indexes one new or changed analysis; returns False if its text is already indexed."""
+        with self._lock:
+            return self._index(a)
+
+    def discard(self, key):
+        """Drops analysis `key` from the results, if indexed."""
+        with self._lock:
+            if key in self._by_id:
+                self._remove(key)
+
+    def compact(self):
+        """Rebuilds the postings without tombstoned documents."""
+        with self._lock:
+            if len(self._by_id) == len(self.doc_ids):
+                return
+            remap = np.full(len(self.doc_ids), -1, dtype=np.int32)
+            alive = np.frombuffer(self.alive, dtype=np.int8).astype(bool)
+            remap[alive] = np.arange(int(alive.sum()), dtype=np.int32)
+            lengths = np.frombuffer(self.lengths, dtype=np.int32)
+            postings = {}
+            for term, (docs, tfs) in self.postings.items():
+                docs = np.frombuffer(docs, dtype=np.int32)
+                keep = alive[docs]
+                if keep.any():
+                    postings[term] = (array('i', remap[docs[keep]].tobytes()),
+                                      array('i', np.frombuffer(tfs, dtype=np.int32)[keep].tobytes()))
+            self.doc_ids = [d for d, a in zip(self.doc_ids, alive) if a]
+            self.doc_hashes = [h for h, a in zip(self.doc_hashes, alive) if a]
+            self.lengths = array('i', lengths[alive].tobytes())
+            self.alive = array('b', b'\x01' * len(self.doc_ids))
+            self.postings = postings
+            self._by_id = {key: doc for doc, key in enumerate(self.doc_ids)}
+
+    def search(self, query, limit=20):
+        """Returns [(analysis_id, score)] for the best BM25 matches of `query`."""
+        with self._lock:
+            if not self._by_id:
+                return []
+            alive = np.frombuffer(self.alive, dtype=np.int8)
+            scores = _bm25(query, lambda term: self.postings.get(term), np.frombuffer(self.lengths, dtype=np.int32),
+                           len(self._by_id), self._total_length, alive.astype(bool))
+            scores *= alive
+            return [(self.doc_ids[d], float(scores[d])) for d in _top(scores, limit)]
+
+    def save_arrays(self, directory):
+        """Writes the postings as .npy files under `directory`, for MappedSearchIndex.
+
+        Tombstones are compacted away first, so doc numbers are positions in
+        doc_ids, which is returned; MappedSearchIndex needs the same order.
+        """
+        self.compact()
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            # Tokens are [a-z0-9]+, so fixed-width ASCII holds them
+            terms = sorted(self.postings)
+            docs = [np.frombuffer(self.postings[t][0], dtype=np.int32) for t in terms]
+            tfs = [np.frombuffer(self.postings[t][1], dtype=np.int32) for t in terms]
+            arrays = {
+                'terms': np.array(terms, dtype=bytes),
+                'offsets': np.r_[0, np.cumsum([len(d) for d in docs], dtype=np.int64)],
+                'docs': np.concatenate(docs) if docs else np.empty(0, dtype=np.int32),
+                'tfs': np.concatenate(tfs) if tfs else np.empty(0, dtype=np.int32),
+                'lengths': np.frombuffer(self.lengths, dtype=np.int32),
+                'total_length': np.array(self._total_length),
+            }
+            for name, values in arrays.items():
+                np.save(os.path.join(directory, f"{name}.npy"), values)
+            return list(self.doc_ids)
+
+
+class MappedSearchIndex:
+    """Read-only SearchIndex over the arrays written by SearchIndex.save_arrays.
+
+    The arrays are memory-mapped, so opening it costs nothing and processes
+    mapping the same files share one copy. `doc_ids` maps doc numbers to
+    analysis ids and can be any sequence, e.g. a column of a mapped table.
+    """
+
+    def __init__(self, directory, doc_ids):
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+        self.terms = load('terms')
+        self.offsets = load('offsets')
+        self.docs = load('docs')
+        self.tfs = load('tfs')
+        self.lengths = load('lengths')
+        self.total_length = int(load('total_length'))
+        self.doc_ids = doc_ids
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _postings(self, term):
+        term = term.encode('ascii')
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:stop], self.tfs[start:stop]
+
+    def search(self, query, limit=20):
+        """Returns [(analysis_id, score)] for the best BM25 matches of `query`."""
+        if len(self.lengths) == 0:
+            return []
+        scores = _bm25(query, self._postings, self.lengths, len(self.lengths), self.total_length)
+        return [(self.doc_ids[d], float(scores[d])) for d in _top(scores, limit)]
+
+
+def _bm25(query, postings, lengths, n_docs, total_length, alive=None):
+    """BM25 score of every document for `query`; postings(term) gives (doc numbers, term frequencies) or None.
+
+    With an `alive` mask, tombstoned documents don't count towards a term's
+    document frequency, so scores match those of the compacted index.
+    """
+    avg_length = total_length / n_docs or 1.0
+    scores = np.zeros(len(lengths), dtype=np.float64)
+    for term in dict.fromkeys(tokenize(query)):
+        docs_tfs = postings(term)
+        if docs_tfs is None:
+            continue
+        docs = np.frombuffer(docs_tfs[0], dtype=np.int32)
+        tfs = np.frombuffer(docs_tfs[1], dtype=np.int32)
+        df = len(docs) if alive is None else int(alive[docs].sum())
+        if df == 0:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        norm = K1 * (1 - B + B * lengths[docs] / avg_length)
+        scores[docs] += idf * tfs * (K1 + 1) / (tfs + norm)
+    return scores
+
+
+def _top(scores, limit):
+    """Doc numbers of the `limit` highest non-zero scores, best first."""
+    candidates = np.flatnonzero(scores)
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def load_search_index(analyses, cache_key, cache_dir=DEFAULT_CACHE_DIR):
+    """Loads the persisted index for `cache_key`, updates it with `analyses` and saves it back.
+
+    Only analyses whose narrative text changed since the last run are
+    re-indexed. The cache file is a pickle written by this module only.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    tag = hashlib.sha1(str(cache_key).encode()).hexdigest()[:12]
+    path = os.path.join(cache_dir, f"index-{tag}.pkl")
+
+    index = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                version, index = pickle.load(f)
+            if version != INDEX_VERSION:
+                index = None
+        except (pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            index = None
+    if index is None:
+        index = SearchIndex()
+
+    if index.update(analyses):
+        # Keep tombstones from piling up across restarts
+        if len(index.doc_ids) > 1.25 * len(index):
+            index.compact()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((INDEX_VERSION, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    return index
+
+
+def highlight_snippet(analysis, query, width=160):
+    """Returns (field label, HTML snippet) around the best match of `query`, with matches in <mark>."""
+    terms = set(tokenize(query))
+    if not terms:
+        return None, ''
+    best = None
+    for label, text in extract_fields(analysis):
+        hits = [m for m in _TOKEN.finditer(text.lower()) if m.group(0) in terms]
+        if hits and (best is None or len({m.group(0) for m in hits}) > best[0]):
+            best = (len({m.group(0) for m in hits}), label, text, hits)
+    if best is None:
+        return None, ''
+
+    _, label, text, hits = best
+    start = max(hits[0].start() - width // 3, 0)
+    end = min(start + width, len(text))
+    parts = ['…' if start > 0 else '']
+    cursor = start
+    for m in hits:
+        if m.start() < start or m.end() > end:
+            continue
+        parts.append(html.escape(text[cursor:m.start()]))
+        parts.append(f"<mark>{html.escape(text[m.start():m.end()])}</mark>")
+        cursor = m.end()
+    parts.append(html.escape(text[cursor:end]))
+    parts.append('…' if end < len(text) else '')
+    return label, ''.join(parts)
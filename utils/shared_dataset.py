@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import shutil
+from collections.abc import Mapping, Sequence
+
+from utils.data_loader import load_twin_analyses, load_patient_profiles, analysis_id
+from utils.profile_store import _LRU, get_clinical_profile, get_sample_index, get_sample
+from utils.validation import validate_directory, ValidationReport
+from utils.pairs import DIRECTION_FIELDS, dedupe_analyses, swap_roles
+from utils.search import SearchIndex, MappedSearchIndex
+from utils.cohort import build_treatment_matrices, TreatmentMatrices
+from utils.vocab import intern_profile, intern_sample
+from utils.disk_cache import combine_digests
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # only needed for the shared dataset mode
+    pa = None
+
+SHARED_VERSION = 2
+MANIFEST_FILENAME = "manifest.json"
+BATCH_ROWS = 1024
+# Generations kept on disk, so workers still mapping the previous one keep working
+KEEP_GENERATIONS = 2
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The shared dataset needs the 'pyarrow' package")
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+class _TableWriter:
+    """Writes rows to an Arrow IPC file in record batches of BATCH_ROWS."""
+
+    def __init__(self, path, schema):
+        self.schema = schema
+        self._sink = pa.OSFile(path, 'wb')
+        self._writer = pa.ipc.new_file(self._sink, schema)
+        self._rows = {name: [] for name in schema.names}
+        self.count = 0
+
+    def add(self, **row):
+        for name, values in self._rows.items():
+            values.append(row[name])
+        self.count += 1
+        if len(self._rows[self.schema.names[0]]) >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._rows[self.schema.names[0]]:
+            self._writer.write_batch(pa.record_batch(self._rows, schema=self.schema))
+            self._rows = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        self._sink.close()
+
+
+def _pair_sort_key(a):
+    return _or_empty(_optional_str(a.get('query_patient_id'))), _or_empty(_optional_str(a.get('twin_id')))
+
+
+def write_shared_dataset(analyses_dir, profiles_dir, out_dir):
+    """Builds a new generation of the shared dataset under `out_dir` and returns its manifest.
+
+    Analyses (deduplicated, one payload per pair), profile clinical parts,
+    sample indexes and samples go into uncompressed Arrow IPC files that
+    workers memory-map; JSON payloads are decoded per record on access.
+    Analyses are sorted by (query, twin) and profiles by patient id, so
+    workers find rows by binary search instead of building lookup dicts. The
+    search postings and treatment matrices are written as .npy arrays, also
+    mapped. manifest.json is replaced last, so workers only ever see
+    complete generations.
+    """
+    _require_pyarrow()
+    generation = f"gen-{int(time.time() * 1000)}"
+    gen_dir = os.path.join(out_dir, generation)
+    os.makedirs(gen_dir)
+
+    reports = [validate_directory(analyses_dir, "analysis")]
+    analyses, pair_index = dedupe_analyses(load_twin_analyses(analyses_dir, exclude=reports[0].rejected))
+    analyses.sort(key=_pair_sort_key)
+
+    contents = _TableWriter(os.path.join(gen_dir, "contents.arrow"),
+                            pa.schema([('payload', pa.large_string())]))
+    # The direction fields as columns; rank is JSON so an int stays an int
+    rows = _TableWriter(os.path.join(gen_dir, "analyses.arrow"), pa.schema([
+        ('analysis_id', pa.string()), ('query_patient_id', pa.string()), ('twin_id', pa.string()),
+        ('rank', pa.string()), ('filename', pa.string()), ('content_id', pa.int32()), ('reversed', pa.bool_()),
+    ]))
+    content_ids = {}
+    for a in analyses:
+        content = a.content
+        if id(content) not in content_ids:
+            content_ids[id(content)] = contents.count
+            contents.add(payload=_dumps(content))
+        direction = a.direction
+        rows.add(analysis_id=analysis_id(a),
+                 query_patient_id=_optional_str(direction.get('query_patient_id')),
+                 twin_id=_optional_str(direction.get('twin_id')),
+                 rank=_dumps(direction['rank']) if 'rank' in direction else None,
+                 filename=_optional_str(direction.get('filename')),
+                 content_id=content_ids[id(content)], reversed=a.reversed)
+    contents.close()
+    rows.close()
+
+    patient_profiles = {}
+    if os.path.exists(profiles_dir):
+        reports.append(validate_directory(profiles_dir, "profile"))
+        patient_profiles = load_patient_profiles(profiles_dir, lazy=True, exclude=reports[-1].rejected)
+    profiles = _TableWriter(os.path.join(gen_dir, "profiles.arrow"), pa.schema([
+        ('patient_id', pa.string()), ('clinical', pa.large_string()), ('sample_index', pa.large_string()),
+        ('sample_start', pa.int64()),
+    ]))
+    samples = _TableWriter(os.path.join(gen_dir, "samples.arrow"), pa.schema([
+        ('patient_id', pa.string()), ('sample_id', pa.string()), ('payload', pa.large_string()),
+    ]))
+    # One patient at a time; the store streams each part out of the source file. A patient's
+    # samples are consecutive rows, in the order of its sample index.
+    for patient_id in sorted(patient_profiles, key=str):
+        sample_index = get_sample_index(patient_profiles, patient_id)
+        profiles.add(patient_id=patient_id, clinical=_dumps(get_clinical_profile(patient_profiles, patient_id)),
+                     sample_index=_dumps(sample_index), sample_start=samples.count)
+        for sample_id in sample_index:
+            samples.add(patient_id=patient_id, sample_id=sample_id,
+                        payload=_dumps(get_sample(patient_profiles, patient_id, sample_id)))
+    profiles.close()
+    samples.close()
+
+    search_index = SearchIndex()
+    search_index.update(analyses)
+    doc_ids = _TableWriter(os.path.join(gen_dir, "search_documents.arrow"), pa.schema([('analysis_id', pa.string())]))
+    for key in search_index.save_arrays(os.path.join(gen_dir, "search")):
+        doc_ids.add(analysis_id=key)
+    doc_ids.close()
+    build_treatment_matrices(patient_profiles, analyses).save_arrays(os.path.join(gen_dir, "treatment_matrices"))
+
+    manifest = {
+        'version': SHARED_VERSION,
+        'generation': generation,
+        'created': time.time(),
+        'analyses': rows.count,
+        'payloads': contents.count,
+        'patients': profiles.count,
+        'samples': samples.count,
+        'collisions': pair_index.collisions,
+        'reports': [{'directory': r.directory, 'kind': r.kind, 'rejected': r.rejected,
+                     'report_path': r.report_path} for r in reports],
+    }
+    tmp_path = os.path.join(out_dir, f"{MANIFEST_FILENAME}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILENAME))
+
+    # Workers map files by path; unlinked files stay readable for workers that still have them mapped
+    generations = sorted(d for d in os.listdir(out_dir) if d.startswith("gen-"))
+    for old in generations[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(out_dir, old), ignore_errors=True)
+    return manifest
+
+
+def _optional_str(value):
+    return None if value is None else str(value)
+
+
+def _or_empty(value):
+    return '' if value is None else value
+
+
+def _map_table(path):
+    # read_all() on a memory map references the mapped pages instead of copying them
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+class MappedColumn(Sequence):
+    """Read-only list view of one column of a mapped table; values are converted one at a time."""
+
+    def __init__(self, column):
+        self._column = column
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._column[index].as_py()
+
+    def __len__(self):
+        return len(self._column)
+
+    def __iter__(self):
+        for chunk in self._column.chunks:
+            yield from chunk.to_pylist()
+
+    def bisect(self, key, lo=0, hi=None, right=False, transform=None):
+        """Like bisect.bisect_left (or bisect_right) over rows [lo, hi), which must be sorted."""
+        hi = len(self) if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self[mid]
+            value = transform(value) if transform else value
+            if value < key or (right and value == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class SharedAnalysis(Mapping):
+    """One analysis of a SharedAnalyses; the payload is decoded from the mapped file on access."""
+
+    __slots__ = ('_owner', '_row', '_direction')
+
+    def __init__(self, owner, row, direction):
+        self._owner = owner
+        self._row = row
+        self._direction = direction
+
+    def _data(self):
+        return self._owner._payload(self._row)
+
+    def __getitem__(self, key):
+        if key in self._direction:
+            return self._direction[key]
+        return self._data()[key]
+
+    def __iter__(self):
+        yield from self._direction
+        yield from (k for k in self._data() if k not in self._direction)
+
+    def __len__(self):
+        return len(self._direction) + sum(1 for k in self._data() if k not in self._direction)
+
+    def __contains__(self, key):
+        return key in self._direction or key in self._data()
+
+
+class SharedAnalyses(Sequence):
+    """Read-only list of analyses backed by memory-mapped Arrow files.
+
+    Nothing is held per analysis: an item is built from its row's direction
+    columns when it is indexed or iterated, and its payload is decoded on
+    access and kept in a small LRU. Rows are sorted by (query, twin).
+    """
+
+    def __init__(self, gen_dir, cache_entries=256):
+        self._rows = _map_table(os.path.join(gen_dir, "analyses.arrow"))
+        self._contents = _map_table(os.path.join(gen_dir, "contents.arrow")).column('payload')
+        self._columns = {name: self._rows.column(name) for name in DIRECTION_FIELDS}
+        self._content_ids = self._rows.column('content_id')
+        self._reversed = self._rows.column('reversed')
+        self.ids = MappedColumn(self._rows.column('analysis_id'))
+        self._query_ids = MappedColumn(self._columns['query_patient_id'])
+        self._twin_ids = MappedColumn(self._columns['twin_id'])
+        self._cache = _LRU(cache_entries, "shared analysis payloads")
+
+    @staticmethod
+    def _direction(values):
+        direction = {k: v for k, v in zip(DIRECTION_FIELDS, values) if v is not None}
+        if 'rank' in direction:
+            direction['rank'] = json.loads(direction['rank'])
+        return direction
+
+    def _payload(self, row):
+        key = (self._content_ids[row].as_py(), self._reversed[row].as_py())
+        payload = self._cache.get(key)
+        if payload is None:
+            payload = json.loads(self._contents[key[0]].as_py())
+            if key[1]:
+                payload = swap_roles(payload)
+            self._cache.put(key, payload)
+        return payload
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        row = index + len(self) if index < 0 else index
+        if not 0 <= row < len(self):
+            raise IndexError(index)
+        return SharedAnalysis(self, row, self._direction(self._columns[k][row].as_py() for k in DIRECTION_FIELDS))
+
+    def __iter__(self):
+        # A record batch at a time, converting whole columns rather than single values
+        row = 0
+        for batch in self._rows.to_batches():
+            columns = [batch.column(k).to_pylist() for k in DIRECTION_FIELDS]
+            for values in zip(*columns):
+                yield SharedAnalysis(self, row, self._direction(values))
+                row += 1
+
+    def __len__(self):
+        return self._rows.num_rows
+
+    def pair_rows(self, query_patient_id, twin_id):
+        """Rows of the analyses of `query_patient_id` against `twin_id`, found by binary search."""
+        query, twin = _or_empty(_optional_str(query_patient_id)), _or_empty(_optional_str(twin_id))
+        lo = self._query_ids.bisect(query, transform=_or_empty)
+        hi = self._query_ids.bisect(query, lo, right=True, transform=_or_empty)
+        lo = self._twin_ids.bisect(twin, lo, hi, transform=_or_empty)
+        hi = self._twin_ids.bisect(twin, lo, hi, right=True, transform=_or_empty)
+        return range(lo, hi)
+
+
+class SharedPairIndex:
+    """The PairIndex attributes the app reads, from the manifest, with lookup() over the sorted rows."""
+
+    def __init__(self, analyses, manifest):
+        self._analyses = analyses
+        self.collisions = manifest['collisions']
+        self.shared_payloads = manifest['payloads']
+        self.analyses = manifest['analyses']
+
+    def lookup(self, query_patient_id, twin_id):
+        """Returns the analyses of `query_patient_id` against `twin_id`, in that direction."""
+        rows = self._analyses.pair_rows(query_patient_id, twin_id)
+        return [a for a in (self._analyses[r] for r in rows)
+                if a['query_patient_id'] == query_patient_id and a['twin_id'] == twin_id]
+
+
+class SharedProfiles(Mapping):
+    """{patient_id: profile} over memory-mapped Arrow files, readable in parts like ProfileStore.
+
+    Profiles are sorted by patient id and a patient's samples are consecutive
+    rows, so lookups are binary searches and no per-patient index is built.
+    """
+
+    def __init__(self, gen_dir, cache_entries=512):
+        self.generation = os.path.basename(os.path.normpath(gen_dir))
+        self._profiles = _map_table(os.path.join(gen_dir, "profiles.arrow"))
+        self._samples = _map_table(os.path.join(gen_dir, "samples.arrow"))
+        self._ids = MappedColumn(self._profiles.column('patient_id'))
+        self._clinical = _LRU(cache_entries, "clinical profiles")
+        self._sample_index = _LRU(cache_entries, "sample indexes")
+
+    def _row(self, patient_id):
+        if not isinstance(patient_id, str):
+            raise KeyError(patient_id)
+        row = self._ids.bisect(patient_id)
+        if row == len(self._ids) or self._ids[row] != patient_id:
+            raise KeyError(patient_id)
+        return row
+
+    def __getitem__(self, patient_id):
+        profile = dict(self.clinical(patient_id))
+        profile['genomics'] = {'samples': {sid: self.sample(patient_id, sid)
+                                           for sid in self.sample_index(patient_id)}}
+        return profile
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, patient_id):
+        try:
+            self._row(patient_id)
+        except KeyError:
+            return False
+        return True
+
+    def content_digest(self, patient_ids=None):
+        # A generation is never rewritten, so its name identifies the content
+        if patient_ids is None:
+            return self.generation
+        return combine_digests([('generation', self.generation)] + [(p, '') for p in patient_ids])
+
+    def clinical(self, patient_id):
+        profile = self._clinical.get(patient_id)
+        if profile is None:
+            profile = intern_profile(json.loads(self._profiles.column('clinical')[self._row(patient_id)].as_py()))
+            self._clinical.put(patient_id, profile)
+        return profile
+
+    def sample_index(self, patient_id):
+        index = self._sample_index.get(patient_id)
+        if index is None:
+            index = json.loads(self._profiles.column('sample_index')[self._row(patient_id)].as_py())
+            self._sample_index.put(patient_id, index)
+        return index
+
+    def sample(self, patient_id, sample_id):
+        sample_ids = list(self.sample_index(patient_id))
+        if sample_id not in sample_ids:
+            return None
+        row = self._profiles.column('sample_start')[self._row(patient_id)].as_py() + sample_ids.index(sample_id)
+        return intern_sample(json.loads(self._samples.column('payload')[row].as_py()))
+
+
+class SharedDataset:
+    """A worker's read-only view of the current shared dataset generation.
+
+    Opening one maps the generation's files and reads the manifest; nothing
+    proportional to the number of analyses or patients is built in the
+    worker's heap.
+    """
+
+    def __init__(self, directory):
+        _require_pyarrow()
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != SHARED_VERSION:
+            raise ValueError(f"Shared dataset in {directory} has version {self.manifest.get('version')}, "
+                             f"expected {SHARED_VERSION}; rebuild it with build_shared_dataset.py")
+        gen_dir = os.path.join(directory, self.manifest['generation'])
+        self.analyses = SharedAnalyses(gen_dir)
+        self.patient_profiles = SharedProfiles(gen_dir)
+        doc_ids = MappedColumn(_map_table(os.path.join(gen_dir, "search_documents.arrow")).column('analysis_id'))
+        self.search_index = MappedSearchIndex(os.path.join(gen_dir, "search"), doc_ids)
+        self.treatment_matrices = TreatmentMatrices.from_arrays(os.path.join(gen_dir, "treatment_matrices"))
+        self.pair_index = SharedPairIndex(self.analyses, self.manifest)
+        self.reports = [ValidationReport(r['directory'], r['kind'], r['rejected'], r['report_path'])
+                        for r in self.manifest['reports']]
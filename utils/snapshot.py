@@ -0,0 +1,61 @@
+import os
+import pickle
+import hashlib
+
+# Bump when anything pickled into a snapshot changes shape
+SNAPSHOT_VERSION = 5
+DEFAULT_CACHE_DIR = os.path.join(".cache", "snapshot")
+
+
+def directory_fingerprints(directories):
+    """{directory: {filename: [size, mtime_ns]}}, or None for a directory that doesn't exist."""
+    fingerprints = {}
+    for directory in directories:
+        if not os.path.isdir(directory):
+            fingerprints[directory] = None
+            continue
+        with os.scandir(directory) as entries:
+            fingerprints[directory] = {e.name: [e.stat().st_size, e.stat().st_mtime_ns]
+                                       for e in entries if e.is_file()}
+    return fingerprints
+
+
+def _snapshot_path(key, cache_dir):
+    tag = hashlib.sha1(str(key).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"snapshot-{tag}.pkl")
+
+
+def load_snapshot(key, fingerprints, cache_dir=DEFAULT_CACHE_DIR):
+    """Returns the state saved for `key` if it was built from files matching `fingerprints`, else None.
+
+    The small header is checked first; the state itself is then read in one
+    go and unpickled from memory.
+    """
+    path = _snapshot_path(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('version') != SNAPSHOT_VERSION or header.get('fingerprints') != fingerprints:
+                return None
+            return pickle.loads(f.read())
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+        return None
+
+
+def save_snapshot(key, fingerprints, state, cache_dir=DEFAULT_CACHE_DIR):
+    """Writes `state` for `key`, tagged with the fingerprints taken before it was loaded.
+
+    Taking them before loading means a file changed mid-load makes the
+    snapshot stale rather than silently out of date.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _snapshot_path(key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'key': str(key), 'fingerprints': fingerprints}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
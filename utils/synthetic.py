@@ -0,0 +1,117 @@
+import os
+import json
+import random
+
+GENES = ["EGFR", "KRAS", "TP53", "ALK", "STK11", "KEAP1", "MET", "BRAF", "ROS1", "CDKN2A", "MYC", "NKX2-1"]
+AGENTS = ["CARBOPLATIN", "PEMETREXED", "OSIMERTINIB", "PEMBROLIZUMAB", "DOCETAXEL"]
+
+
+def _sample(rng):
+    return {
+        'sample_info': {'sample_type': rng.choice(["Primary", "Metastasis"]),
+                        'cancer_type_detailed': "Lung Adenocarcinoma", 'oncotree_code': "LUAD"},
+        'mutations': [{'gene': rng.choice(GENES), 'protein_change': f"p.G{rng.randint(1, 900)}V",
+                       'variant_classification': rng.choice(["Missense_Mutation", "Nonsense_Mutation",
+                                                             "Frame_Shift_Del"]),
+                       'chromosome': str(rng.randint(1, 22)), 'position': rng.randint(1, 10 ** 8),
+                       'ref_allele': "G", 'alt_allele': "T"} for _ in range(rng.randint(0, 15))],
+        'copy_number_alterations': [{'gene': gene, 'alteration_type': rng.choice(["Amplification", "Deletion"]),
+                                     'gistic_value': rng.choice([-2, 2])}
+                                    for gene in rng.sample(GENES, rng.randint(0, 5))],
+        'structural_variants': [{'site1_gene': "EML4", 'site2_gene': "ALK", 'sv_type': "SOMATIC",
+                                 'site1_chromosome': "2", 'site2_chromosome': "2"}] if rng.random() < .2 else [],
+    }
+
+
+def synthetic_profile(rng, patient_id):
+    """A random profile; half use the nested schema (treatments/timeline), half the flat one."""
+    samples = {f"{patient_id}-T0{i + 1}-IM6": _sample(rng) for i in range(rng.randint(1, 3))}
+    lines = [{'line_number': i + 1, 'agent': rng.choice(AGENTS), 'start_date_days': i * 100,
+              'stop_date_days': i * 100 + 80, 'subtype': "Chemo", 'investigative': "No"}
+             for i in range(rng.randint(0, 4))]
+    profile = {
+        'patient_id': patient_id,
+        'clinical': {
+            'demographics': {'age': rng.randint(40, 85), 'sex': rng.choice(["Male", "Female"]),
+                             'race': "White", 'vital_status': "Alive"},
+            'stage': {'highest_recorded': rng.choice(["Stage 1", "Stage 4"]), 'category': "Clinical"},
+            'biomarkers': {'oncotree_code': "LUAD", 'cancer_type_detailed': "Lung Adenocarcinoma",
+                           'tmb_nonsynonymous': round(rng.random() * 20, 2), 'msi_type': "Stable",
+                           'pdl1_status': rng.choice(["Positive", "Negative"])},
+        },
+        'genomics': {'samples': samples},
+    }
+    if rng.random() < .5:
+        profile['treatments'] = {'drug_therapy': {'lines': lines}}
+        profile['timeline'] = {'surgery': [{'start_date_days': 10, 'procedure': "Lobectomy"}],
+                               'radiation': [{'start_date_days': 50, 'stop_date_days': 90}],
+                               'progression': [{'start_date_days': 150}], 'tumor_sites': []}
+    else:
+        profile['treatment'] = lines
+        profile['progression'] = [{'start_date_days': 120}]
+    return profile
+
+
+def synthetic_analysis(rng, query_id, twin_id, rank):
+    """A random twin analysis of `query_id` against `twin_id` with every section the views render."""
+    return {
+        'query_patient_id': query_id, 'twin_id': twin_id, 'rank': rank,
+        'similarity_score': round(rng.random(), 3),
+        'clinical_pct': rng.randint(30, 100), 'genomic_pct': rng.randint(30, 100),
+        'match_quality': {'grade': rng.choice(["A", "B", "C"]),
+                          'overall_assessment': "Strong match on EGFR driver status and stage",
+                          'strengths': ["Same stage"], 'weaknesses': ["Age gap"]},
+        'clinical_summary': {'query': {'stage': "Stage 4", 'sex': "Male"},
+                             'twin': {'stage': "Stage 4", 'sex': "Female"}},
+        'shared_features': {'biomarkers': rng.sample(GENES, 2)},
+        'summary': "Both patients harbor EGFR exon 19 deletions.",
+        'key_differences': [{'feature': "Smoking", 'query_value': "Never", 'twin_value': "Former",
+                             'clinical_impact': "Minor"}],
+        'genomic_comparison': {'shared_variants': [{'gene': "EGFR", 'variant': "L858R",
+                                                    'clinical_significance': "Oncogenic"}],
+                               'query_unique': ["KRAS G12C"], 'twin_unique': []},
+        'treatment_comparison': {'query_treatments': [rng.choice(AGENTS)], 'twin_treatments': [rng.choice(AGENTS)]},
+        'actionable_insights': [{'insight': "Consider osimertinib", 'evidence': "FLAURA",
+                                 'recommended_action': "Discuss at tumor board"}],
+        'recommendations': [{'recommendation': "Monitor for T790M resistance", 'evidence': "NCCN",
+                             'confidence': "High"}],
+        'use_for_treatment_guidance': rng.random() < .5,
+    }
+
+
+def write_synthetic_dataset(root, patients, twins_per_patient=3, seed=0,
+                            analyses_dirname="final_twin_analysis_2", profiles_dirname="patient_profiles_2"):
+    """Writes `patients` random profiles and `twins_per_patient` analyses per patient under `root`.
+
+    Every patient is a query patient, so the dataset has
+    patients * twins_per_patient analyses. Returns (analyses written, profiles written).
+    """
+    rng = random.Random(seed)
+    analyses_dir = os.path.join(root, analyses_dirname)
+    profiles_dir = os.path.join(root, profiles_dirname)
+    os.makedirs(analyses_dir, exist_ok=True)
+    os.makedirs(profiles_dir, exist_ok=True)
+
+    patient_ids = [f"P-{i:07d}" for i in range(1, patients + 1)]
+    for patient_id in patient_ids:
+        with open(os.path.join(profiles_dir, f"{patient_id}.json"), 'w') as f:
+            json.dump(synthetic_profile(rng, patient_id), f)
+
+    written = 0
+    twins_per_patient = min(twins_per_patient, patients - 1)
+    for query_id in patient_ids:
+        for rank, twin_id in enumerate(_pick_twins(rng, patient_ids, query_id, twins_per_patient), start=1):
+            with open(os.path.join(analyses_dir, f"{query_id}_vs_{twin_id}.json"), 'w') as f:
+                json.dump(synthetic_analysis(rng, query_id, twin_id, rank), f)
+            written += 1
+    return written, len(patient_ids)
+
+
+def _pick_twins(rng, patient_ids, query_id, k):
+    # Rejection sampling: cheaper than copying the whole id list per patient on large datasets
+    picked = []
+    while len(picked) < k:
+        candidate = rng.choice(patient_ids)
+        if candidate != query_id and candidate not in picked:
+            picked.append(candidate)
+    return picked
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+# Event type -> (source table in normalize_profile, columns tried in order for the label, fallback label)
+EVENT_SOURCES = {
+    'treatment': ('treatments', ['agent'], 'Treatment'),
+    'surgery': ('surgery', ['procedure', 'subtype'], 'Surgery'),
+    'radiation': ('radiation', ['subtype', 'anatomic_site'], 'Radiation'),
+    'progression': ('progression', ['subtype'], 'Progression'),
+    'tumor_sites': ('tumor_sites', ['site', 'tumor_site', 'anatomic_site'], 'Tumor Site'),
+}
+START_COLUMNS = ['start_date_days', 'start_date', 'days']
+STOP_COLUMNS = ['stop_date_days', 'stop_date']
+EVENT_COLUMNS = ['event_type', 'label', 'start', 'stop', 'line_number']
+
+
+def _first_column(df, candidates):
+    return next((c for c in candidates if c in df.columns), None)
+
+
+def _events_from(df, event_type):
+    _, label_columns, default_label = EVENT_SOURCES[event_type]
+    start_col = _first_column(df, START_COLUMNS)
+    if df.empty or start_col is None:
+        return None
+    start = pd.to_numeric(df[start_col], errors='coerce')
+    stop_col = _first_column(df, STOP_COLUMNS)
+    stop = pd.to_numeric(df[stop_col], errors='coerce') if stop_col else start
+    # Point events (and open-ended ones) cover just their start day
+    stop = stop.fillna(start).where(stop.fillna(start) >= start, start)
+    label_col = _first_column(df, label_columns)
+    label = df[label_col].astype(object).where(df[label_col].notna(), default_label) if label_col else default_label
+    events = pd.DataFrame({
+        'event_type': event_type,
+        'label': label,
+        'start': start,
+        'stop': stop,
+        'line_number': pd.to_numeric(df['line_number'], errors='coerce') if 'line_number' in df.columns else np.nan,
+    })
+    return events[events['start'].notna()]
+
+
+class PatientTimeline:
+    """All of a patient's dated events in one table, indexed by [start, stop] day interval.
+
+    Built from the normalized clinical tables (see normalize_profile), so both
+    profile schemas are covered. Point events such as surgery or progression
+    are zero-length intervals; intervals are closed, so an event on the last
+    day of a treatment line counts as during it.
+    """
+
+    def __init__(self, tables):
+        parts = [_events_from(tables['treatments'], 'treatment')]
+        parts += [_events_from(tables['timeline'].get(source, pd.DataFrame()), event_type)
+                  for event_type, (source, _, _) in EVENT_SOURCES.items() if event_type != 'treatment']
+        parts = [p for p in parts if p is not None and not p.empty]
+        if parts:
+            events = pd.concat(parts, ignore_index=True)
+        else:
+            events = pd.DataFrame({c: pd.Series(dtype=float if c in ('start', 'stop', 'line_number') else object)
+                                   for c in EVENT_COLUMNS})
+        self.events = events.sort_values(['start', 'stop'], kind='stable').reset_index(drop=True)
+        self.events['event_type'] = pd.Categorical(self.events['event_type'], categories=list(EVENT_SOURCES))
+        self.index = pd.IntervalIndex.from_arrays(self.events['start'].astype(float),
+                                                  self.events['stop'].astype(float), closed='both')
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def empty(self):
+        return self.events.empty
+
+    def select(self, event_type=None, **where):
+        """Boolean mask of events of `event_type` whose columns equal the `where` values."""
+        mask = np.ones(len(self.events), dtype=bool)
+        if event_type is not None:
+            mask &= (self.events['event_type'] == event_type).to_numpy()
+        for column, value in where.items():
+            values = self.events[column]
+            if column == 'label':
+                mask &= (values.astype(str).str.upper() == str(value).upper()).to_numpy()
+            else:
+                mask &= (values == value).to_numpy()
+        return mask
+
+    def overlapping(self, start, stop=None, event_type=None):
+        """Events overlapping the day range [start, stop]."""
+        stop = start if stop is None else stop
+        mask = self.index.overlaps(pd.Interval(float(start), float(stop), closed='both'))
+        if event_type is not None:
+            mask &= self.select(event_type)
+        return self.events[mask]
+
+    def concurrent(self, event_type, with_type, **where):
+        """Events of `event_type` overlapping any `with_type` event matching `where`.
+
+        e.g. concurrent('progression', 'treatment', line_number=2) or
+        concurrent('radiation', 'treatment', label='OSIMERTINIB').
+        """
+        candidates = self.select(event_type)
+        anchors = self.select(with_type, **where)
+        if not candidates.any() or not anchors.any():
+            return self.events.iloc[0:0]
+        # The anchors' intervals merged into disjoint runs, in start order (the index is sorted by start)
+        a_start, a_stop = self.index.left[anchors].to_numpy(), self.index.right[anchors].to_numpy()
+        run_stop = np.maximum.accumulate(a_stop)
+        new_run = np.r_[True, a_start[1:] > run_stop[:-1]]
+        starts = a_start[new_run]
+        stops = run_stop[np.r_[np.flatnonzero(new_run)[1:] - 1, len(a_stop) - 1]]
+        # An event overlaps the runs iff the last run starting by its stop day reaches its start day
+        c_start, c_stop = self.index.left[candidates].to_numpy(), self.index.right[candidates].to_numpy()
+        run = np.searchsorted(starts, c_stop, side='right') - 1
+        hits = (run >= 0) & (stops[np.maximum(run, 0)] >= c_start)
+        return self.events[candidates][hits]
+
+    def anchor_day(self):
+        """Day the first treatment line starts, or the first event if there is no treatment."""
+        treatments = self.events[self.select('treatment')]
+        if not treatments.empty:
+            return float(treatments['start'].min())
+        return float(self.events['start'].min()) if not self.empty else 0.0
+
+
+def align_timelines(timelines):
+    """Stacks {patient_id: PatientTimeline} into one table with days relative to each patient's anchor.
+
+    Day 0 is the start of each patient's first treatment line, so a query and
+    its twin can be compared side by side.
+    """
+    parts = []
+    for patient_id, timeline in timelines.items():
+        events = timeline.events.copy()
+        anchor = timeline.anchor_day()
+        events['patient_id'] = patient_id
+        events['start'] = events['start'] - anchor
+        events['stop'] = events['stop'] - anchor
+        parts.append(events)
+    if not parts:
+        return pd.DataFrame(columns=['patient_id'] + EVENT_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.data_loader import JSON_SUFFIXES, PACK_SUFFIXES, READ_ERRORS, open_data_file, logical_filename
+
+# Bump when a schema changes so cached results are revalidated
+SCHEMA_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(".cache", "validation")
+# Below this many files a process pool costs more than it saves
+PARALLEL_THRESHOLD = 32
+
+NUMBER = (int, float)
+
+# field (dotted path) -> (accepted types, required)
+ANALYSIS_SCHEMA = {
+    'query_patient_id': (str, True),
+    'twin_id': (str, True),
+    'rank': (NUMBER, True),
+    'similarity_score': (NUMBER, False),
+    'clinical_pct': (NUMBER, False),
+    'genomic_pct': (NUMBER, False),
+    'match_quality': (dict, False),
+    'clinical_summary': (dict, False),
+    'clinical_summary.query': (dict, False),
+    'clinical_summary.twin': (dict, False),
+    'shared_features': ((dict, list), False),
+    'phenotype_comparison': (dict, False),
+    'genomic_comparison': (dict, False),
+    'treatment_comparison': (dict, False),
+    'key_differences': (list, False),
+    'actionable_insights': (list, False),
+    'recommendations': (list, False),
+}
+
+PROFILE_SCHEMA = {
+    'patient_id': (str, False),
+    'clinical': (dict, False),
+    'clinical.demographics': (dict, False),
+    'clinical.stage': (dict, False),
+    'clinical.biomarkers': (dict, False),
+    'genomics': (dict, False),
+    'genomics.samples': (dict, False),
+    'treatments': (dict, False),
+    'treatment': (list, False),
+    'timeline': (dict, False),
+}
+
+SCHEMAS = {'analysis': ANALYSIS_SCHEMA, 'profile': PROFILE_SCHEMA}
+
+
+def _lookup(data, path):
+    for key in path.split('.'):
+        if not isinstance(data, dict) or key not in data:
+            return False, None
+        data = data[key]
+    return True, data
+
+
+def validate_record(data, kind):
+    """Returns the reasons a record doesn't match the `kind` schema (empty if it does)."""
+    if not isinstance(data, dict):
+        return [f"expected a JSON object, got {type(data).__name__}"]
+    errors = []
+    for path, (types, required) in SCHEMAS[kind].items():
+        present, value = _lookup(data, path)
+        if not present or value is None:
+            if required:
+                errors.append(f"missing required field '{path}'")
+        elif not isinstance(value, types) or (isinstance(value, bool) and types is NUMBER):
+            errors.append(f"field '{path}' has type {type(value).__name__}")
+    if kind == 'profile':
+        samples = data.get('genomics', {}).get('samples', {}) if isinstance(data.get('genomics'), dict) else {}
+        if isinstance(samples, dict):
+            for sample_id, sample in samples.items():
+                if not isinstance(sample, dict):
+                    errors.append(f"sample '{sample_id}' is not an object")
+                    continue
+                for key in ('mutations', 'copy_number_alterations', 'structural_variants'):
+                    if sample.get(key) is not None and not isinstance(sample[key], list):
+                        errors.append(f"sample '{sample_id}' field '{key}' is not a list")
+    return errors
+
+
+def _validate_file(args):
+    """Worker: validates one file and returns {record name: [reasons]}."""
+    filepath, kind = args
+    filename = os.path.basename(filepath)
+    results = {}
+    try:
+        with open_data_file(filepath) as f:
+            if filename.endswith(PACK_SUFFIXES):
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                        name, data = record['filename'], record['data']
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        results[f"{filename}:{line_number}"] = [f"invalid pack record: {e}"]
+                        continue
+                    results[name] = validate_record(data, kind)
+            else:
+                results[logical_filename(filename)] = validate_record(json.load(f), kind)
+    except READ_ERRORS + (OSError,) as e:
+        results[filename] = [f"unreadable: {e}"]
+    except ImportError as e:
+        results[filename] = [str(e)]
+    return results
+
+
+def _fingerprint(filepath):
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ValidationReport:
+    def __init__(self, directory, kind, results, report_path):
+        self.directory = directory
+        self.kind = kind
+        self.rejected = {name: errors for name, errors in results.items() if errors}
+        self.accepted = {name for name, errors in results.items() if not errors}
+        self.report_path = report_path
+
+
+def validate_directory(directory, kind, max_workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """Validates every record in `directory` once per file version.
+
+    Results are cached by file fingerprint (size and mtime), so only new or
+    changed files are parsed; those are checked in parallel worker processes.
+    Rejected records and their reasons are written to a quarantine report.
+    The returned report's `rejected` names can be passed to the loaders'
+    `exclude` argument.
+    """
+    if not os.path.exists(directory):
+        raise FileNotFoundError(f"Directory not found: {directory}")
+    os.makedirs(cache_dir, exist_ok=True)
+    tag = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:12]
+    cache_path = os.path.join(cache_dir, f"{kind}-{tag}.json")
+    report_path = os.path.join(cache_dir, f"quarantine-{kind}-{tag}.json")
+
+    cache = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get('schema_version') == SCHEMA_VERSION:
+                cache = cached['files']
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    files = {}
+    stale = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(JSON_SUFFIXES + PACK_SUFFIXES):
+            continue
+        filepath = os.path.join(directory, filename)
+        fingerprint = _fingerprint(filepath)
+        entry = cache.get(filename)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            files[filename] = entry
+        else:
+            files[filename] = {'fingerprint': fingerprint, 'results': None}
+            stale.append(filename)
+
+    jobs = [(os.path.join(directory, filename), kind) for filename in stale]
+    if len(jobs) >= PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            outcomes = list(pool.map(_validate_file, jobs, chunksize=16))
+    else:
+        outcomes = [_validate_file(job) for job in jobs]
+    for filename, results in zip(stale, outcomes):
+        files[filename]['results'] = results
+
+    changed = bool(stale) or len(files) != len(cache)
+    if changed:
+        _write_json_atomic(cache_path, {'schema_version': SCHEMA_VERSION, 'files': files})
+
+    results = {}
+    for entry in files.values():
+        results.update(entry['results'])
+    report = ValidationReport(directory, kind, results, report_path)
+    if changed or not os.path.exists(report_path):
+        _write_json_atomic(report_path, {
+            'directory': os.path.abspath(directory),
+            'kind': kind,
+            'accepted': len(report.accepted),
+            'rejected': report.rejected,
+        })
+    return report
+
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,135 @@
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Profile field -> shared vocabulary it is coded against
+FIELD_VOCABULARY = {
+    'gene': 'gene',
+    'site1_gene': 'gene',
+    'site2_gene': 'gene',
+    'variant_classification': 'variant_classification',
+    'alteration_type': 'alteration_type',
+    'sv_type': 'sv_type',
+    'chromosome': 'chromosome',
+    'site1_chromosome': 'chromosome',
+    'site2_chromosome': 'chromosome',
+    'oncotree_code': 'oncotree_code',
+}
+
+
+class Vocabulary:
+    """Grow-only string <-> integer code table shared by every profile.
+
+    Codes never change once assigned, so arrays coded earlier stay valid as
+    the vocabulary grows. Each categorical dtype handed out has the
+    categories of an earlier one as a prefix, so an older column joins a
+    newer one through set_categories() without being re-encoded.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._codes = {}
+        self._values = []
+        self._dtype = None  # rebuilt only when codes past its categories are wrapped
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def encode(self, values):
+        """Returns int32 codes for `values`; missing values are coded -1."""
+        # Only the distinct values go through the Python-level lookup
+        positions, uniques = pd.factorize(pd.Series(values, dtype=object))
+        unique_codes = np.empty(len(uniques), dtype=np.int32)
+        with self._lock:
+            for i, value in enumerate(uniques):
+                value = str(value)
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._codes[value] = code
+                    self._values.append(sys.intern(value))
+                unique_codes[i] = code
+        codes = np.full(len(positions), -1, dtype=np.int32)
+        found = positions >= 0
+        codes[found] = unique_codes[positions[found]]
+        return codes
+
+    def decode(self, codes):
+        values = self._values
+        return [values[c] if c >= 0 else None for c in codes]
+
+    def intern(self, value):
+        """Returns the vocabulary's shared copy of `value`, adding it if new."""
+        if not isinstance(value, str):
+            return value
+        code = self._codes.get(value)
+        if code is None:
+            code = self.encode([value])[0]
+        return self._values[code]
+
+    def dtype(self, min_size=0):
+        """Categorical dtype shared by every column coded with it, covering at least `min_size` codes.
+
+        Values interned since the dtype was built don't make a new one until
+        a column actually holds them.
+        """
+        with self._lock:
+            if self._dtype is None or len(self._dtype.categories) < min_size:
+                self._dtype = pd.CategoricalDtype(pd.Index(list(self._values), dtype=object))
+            return self._dtype
+
+    def categorical(self, values):
+        """Codes `values` into a Categorical that stores int codes and decodes on display."""
+        codes = self.encode(values)
+        return pd.Categorical.from_codes(codes, dtype=self.dtype(int(codes.max()) + 1 if len(codes) else 0))
+
+
+VOCABULARIES = {name: Vocabulary(name) for name in set(FIELD_VOCABULARY.values())}
+
+
+def encode_columns(df):
+    """Replaces vocabulary fields of a raw (not yet renamed) variant DataFrame with categoricals."""
+    for field, vocabulary in FIELD_VOCABULARY.items():
+        if field in df.columns:
+            df[field] = VOCABULARIES[vocabulary].categorical(df[field].tolist())
+    return df
+
+
+def intern_records(records):
+    """Points vocabulary fields of a list of variant dicts at shared strings, in place."""
+    if not isinstance(records, list):
+        return records
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        for field, vocabulary in FIELD_VOCABULARY.items():
+            value = record.get(field)
+            if isinstance(value, str):
+                record[field] = VOCABULARIES[vocabulary].intern(value)
+    return records
+
+
+def intern_sample(sample_data):
+    """Interns the vocabulary fields of one genomic sample, in place."""
+    if isinstance(sample_data, dict):
+        for key in ('mutations', 'copy_number_alterations', 'structural_variants'):
+            intern_records(sample_data.get(key))
+        intern_records([sample_data.get('sample_info')])
+    return sample_data
+
+
+def intern_profile(profile):
+    """Interns the vocabulary fields of a patient profile, in place."""
+    if not isinstance(profile, dict):
+        return profile
+    samples = profile.get('genomics', {}).get('samples', {}) if isinstance(profile.get('genomics'), dict) else {}
+    if isinstance(samples, dict):
+        for sample_data in samples.values():
+            intern_sample(sample_data)
+    clinical = profile.get('clinical')
+    if isinstance(clinical, dict):
+        intern_records([clinical.get('biomarkers')])
+    return profile
@@ -1,5 +1,14 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+from utils.prefetch import prefetch_patients, get_aligned_timelines, get_profile_features
+from utils.profile_diff import compare_profiles
+from utils.data_loader import analysis_id
+from utils.search import highlight_snippet
+from utils.ranking import pair_ranking
+from views.deep_dive import timeline_figure, timeline_rows
+from views.filter_panel import pair_filter_mask, filtered_patient_ids
+from views.export_panel import export_popover
 
 def navigate_to_clinical(patient_id):
     st.session_state.deep_dive_patient_id = patient_id
@@ -11,7 +20,40 @@ def navigate_to_genomic(patient_id):
     st.session_state.genomics_patient_select = patient_id
     st.session_state.navigation = "Genomics Deep Dive"
 
-def show(analyses):
+# Pairs listed per page of the selector; labels are only built for the page shown
+PAGE_SIZE = 100
+
+def select_analysis(key):
+    st.session_state.analysis_select = key
+
+def clear_selection():
+    # A new page starts at its first pair
+    st.session_state.pop("analysis_select", None)
+
+def show_search_results(search_index, query, ranking, listed, label):
+    # Pairs hidden by the filters are left out of the results
+    results = [r for r in search_index.search(query, limit=50)
+               if ranking.row_of(r[0]) >= 0 and listed[ranking.row_of(r[0])]][:10]
+    if not results:
+        st.caption(f"No analyses mention “{query}”.")
+        return
+    st.caption(f"Top {len(results)} matching analyses")
+    for key, score in results:
+        row = ranking.row_of(key)
+        field, snippet = highlight_snippet(ranking.items[row], query)
+        col_text, col_open = st.columns([5, 1])
+        with col_text:
+            st.markdown(f"""
+                <div class="search-result">
+                    <span class="search-result-label">{label(row)}</span>
+                    <span class="search-result-field">{field}</span>
+                    <div class="search-result-snippet">{snippet}</div>
+                </div>
+            """, unsafe_allow_html=True)
+        with col_open:
+            st.button("Open", key=f"search_open_{key}", on_click=select_analysis, args=(key,))
+
+def show(analyses, patient_profiles, search_index=None, data_version=0):
     if not analyses:
         st.info("No analyses available.")
         return
@@ -24,27 +66,87 @@ def show(analyses):
         st.markdown("<p>Detailed analysis of molecularly similar patient pairs showing biomarker alignment, treatment comparisons, and clinical decision insights.</p>", unsafe_allow_html=True)
         
     with col_select:
-        # Select Analysis
-        analysis_options = {f"{a['query_patient_id']} ↔ {a['twin_id']} (Rank #{a['rank']})": a for a in analyses}
-        selected_option = st.selectbox("Select Pair:", list(analysis_options.keys()))
-    
-    if selected_option:
-        analysis = analysis_options[selected_option]
-        
-        # --- Custom Styling for Accordions ---
-        st.markdown("""
-            <style>
-                .stExpander > details > summary > div[data-testid="stExpanderToggleIcon"] + div {
-                    font-weight: bold !important;
-                    color: #0C4A6E !important; /* Dark Blue */
-                    font-size: 1.1rem !important;
-                }
-                .stExpander > details > summary:hover {
-                    color: #0284C7 !important;
-                }
-            </style>
-        """, unsafe_allow_html=True)
+        # Any two patients can be compared live, without a precomputed analysis
+        adhoc = st.toggle("Compare any two patients", key="adhoc_compare")
+        if adhoc:
+            # Narrowed by the filter panel; the full sorted list, sorted once, when filtering is off
+            patient_ids = filtered_patient_ids(patient_profiles, "adhoc_filter", data_version)
+            query_id = st.selectbox("Query Patient:", patient_ids, key="adhoc_query")
+            twin_id = st.selectbox("Compare With:", patient_ids, index=1 if len(patient_ids) > 1 else 0,
+                                   key="adhoc_twin")
+        else:
+            # Re-rank every query patient's twins by a custom clinical/genomic weighting
+            rerank = st.toggle("Re-rank by custom weights", key="rerank_enabled")
+            # Only pairs matching the filter panel are listed
+            mask = pair_filter_mask(analyses, patient_profiles, data_version)
+            # Built once per data version; every rerun after that only selects row positions
+            ranking = pair_ranking(analyses, data_version)
+            if rerank:
+                genomic_weight = st.slider("Genomic weight", 0, 100, 50, step=5, format="%d%%",
+                                           key="genomic_weight", help="Clinical match gets the remaining weight.")
+                scores, ranks, rows = ranking.rerank(genomic_weight / 100)
+            else:
+                # List order, without the tombstones of analyses removed by live ingestion
+                rows = np.flatnonzero(ranking.live)
+            if mask is not None:
+                # Pairs ingested after the mask was built are listed from the next rerun
+                rows = rows[rows < len(mask)]
+                rows = rows[mask[rows]]
+            listed = np.zeros(len(ranking), dtype=bool)
+            listed[rows] = True
+
+            def label(row):
+                a = ranking.items[row]
+                rank_text = (f"Rank #{ranks[row]}, was #{a['rank']} · {scores[row]:.1f}%" if rerank
+                             else f"Rank #{a['rank']}")
+                return f"{a['query_patient_id']} ↔ {a['twin_id']} ({rank_text})"
 
+            # A pair picked elsewhere (search, leaderboard) opens on its page
+            pages = max(1, -(-len(rows) // PAGE_SIZE))
+            selected_row = ranking.row_of(st.session_state.get("analysis_select"))
+            if selected_row >= 0 and listed[selected_row]:
+                st.session_state.analysis_page = int(np.flatnonzero(rows == selected_row)[0]) // PAGE_SIZE + 1
+            st.session_state.analysis_page = min(st.session_state.get("analysis_page", 1), pages)
+            page = 1
+            if pages > 1:
+                page = st.number_input(f"Page (of {pages}, {PAGE_SIZE} pairs each)", min_value=1, max_value=pages,
+                                       key="analysis_page", on_change=clear_selection)
+
+            # Select Analysis; options are analysis ids so re-ranking keeps the selection
+            labels_by_id = {}
+            seen_labels = set()
+            for row in rows[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]:
+                a = ranking.items[row]
+                text = label(row)
+                # Conflicting analyses of the same pair must stay distinguishable
+                if text in seen_labels:
+                    text = f"{text} [{a.get('filename', len(seen_labels))}]"
+                seen_labels.add(text)
+                labels_by_id[analysis_id(a)] = text
+            selected_key = st.selectbox("Select Pair:", list(labels_by_id), format_func=labels_by_id.get,
+                                        key="analysis_select")
+            if not labels_by_id:
+                st.info("No pairs match the filters.")
+            export_popover(ranking.select(rows), patient_profiles)
+
+    if adhoc:
+        analysis = None
+        if query_id and twin_id:
+            analysis = compare_profiles(get_profile_features(patient_profiles, query_id),
+                                        get_profile_features(patient_profiles, twin_id))
+    else:
+        # Full-text search over the narratives; "Open" switches the pair selector
+        if search_index is not None:
+            search_text = st.text_input("Search analyses", key="analysis_search",
+                                        placeholder="e.g. EGFR osimertinib progression")
+            if search_text.strip():
+                show_search_results(search_index, search_text, ranking, listed, label)
+        analysis = ranking.items[ranking.row_of(selected_key)] if selected_key else None
+
+    if analysis is not None:
+        # Users usually open a deep dive next, so get both profiles ready in the background
+        prefetch_patients(patient_profiles, [analysis['query_patient_id'], analysis['twin_id']])
+        
         # --- 1. High-Level Summary Banner ---
         match_quality = analysis.get('match_quality', {})
         clinical_pct = analysis.get('clinical_pct', 'N/A')
@@ -68,15 +170,15 @@ def show(analyses):
         
         st.markdown(f"""
             <div class="blue-banner">
-                <div style="display: flex; gap: 2rem;">
+                <div class="blue-banner-group">
                     <div><span class="blue-banner-label">Query:</span> <span class="blue-banner-text">{analysis['query_patient_id']}</span></div>
                     <div><span class="blue-banner-label">Twin:</span> <span class="blue-banner-text">{analysis['twin_id']}</span></div>
                 </div>
-                <div style="display: flex; gap: 2rem;">
+                <div class="blue-banner-group">
                     <div><span class="blue-banner-label">Rank:</span> <span class="blue-banner-text">#{analysis['rank']}</span></div>
                     <div><span class="blue-banner-label">Similarity:</span> <span class="blue-banner-text">{display_score}</span></div>
-                    <div><span class="blue-banner-label">Clinical Match:</span> <span class="blue-banner-text" style="font-weight: 800; color: #2563EB;">{clinical_pct}%</span></div>
-                    <div><span class="blue-banner-label">Genomic Match:</span> <span class="blue-banner-text" style="font-weight: 800; color: #2563EB;">{genomic_pct}%</span></div>
+                    <div><span class="blue-banner-label">Clinical Match:</span> <span class="blue-banner-text highlight">{clinical_pct}%</span></div>
+                    <div><span class="blue-banner-label">Genomic Match:</span> <span class="blue-banner-text highlight">{genomic_pct}%</span></div>
                     <div><span class="blue-banner-label">Shared Biomarkers:</span> <span class="blue-banner-text">{shared_biomarkers_count}</span></div>
                 </div>
             </div>
@@ -246,51 +348,22 @@ def show(analyses):
                 for gap in gaps:
                     st.warning(gap)
 
+            # Loads both profiles, so only on request; the aligned table is cached per pair
+            if st.toggle("Show aligned timelines", key="show_aligned_timelines"):
+                pair_ids = [analysis['query_patient_id'], analysis['twin_id']]
+                events = get_aligned_timelines(patient_profiles, pair_ids)
+                if events.empty:
+                    st.info("No dated events available for this pair.")
+                else:
+                    role = events['patient_id'].map({pair_ids[0]: 'Query', pair_ids[1]: 'Twin'})
+                    rows = role + ' · ' + timeline_rows(events)
+                    st.caption("Day 0 is the start of each patient's first treatment line.")
+                    st.plotly_chart(timeline_figure(events, rows), use_container_width=True)
+
         # --- 6. Actionable Insights ---
         with st.expander("**Actionable Insights**", expanded=False):
             insights = analysis.get('actionable_insights', [])
             if insights:
-                st.markdown("""
-                <style>
-                    .insight-card {
-                        background-color: #FDF4FF;
-                        border-left: 5px solid #D946EF;
-                        padding: 15px;
-                        margin-bottom: 10px;
-                        border-radius: 5px;
-                        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-                    }
-                    .insight-header {
-                        color: #86198F;
-                        font-weight: bold;
-                        display: flex;
-                        align-items: center;
-                        gap: 8px;
-                        margin-bottom: 5px;
-                    }
-                    .insight-body {
-                        color: #4A044E;
-                        font-size: 0.95rem;
-                        margin-bottom: 8px;
-                    }
-                    .insight-evidence {
-                        font-size: 0.85rem;
-                        color: #701A75;
-                        font-style: italic;
-                        margin-bottom: 5px;
-                    }
-                    .insight-action {
-                        background-color: #FAE8FF;
-                        padding: 5px 10px;
-                        border-radius: 4px;
-                        font-size: 0.9rem;
-                        color: #86198F;
-                        font-weight: 600;
-                        display: inline-block;
-                    }
-                </style>
-                """, unsafe_allow_html=True)
-
                 for insight in insights:
                     if isinstance(insight, dict):
                         i_text = insight.get('insight', 'Insight')
@@ -321,10 +394,10 @@ def show(analyses):
                     confidence = rec.get('confidence', '') if isinstance(rec, dict) else ''
                     
                     st.markdown(f"""
-                        <div style="background-color: #F0F9FF; padding: 1rem; border-radius: 8px; border-left: 4px solid #0EA5E9; margin-bottom: 0.5rem;">
-                            <div style="font-weight: 600; color: #0C4A6E;">{r_text}</div>
-                            <div style="font-size: 0.9rem; color: #0369A1; margin-top: 0.25rem;">Evidence: {evidence}</div>
-                            <div style="font-size: 0.8rem; color: #64748B; margin-top: 0.25rem;">Confidence: {confidence}</div>
+                        <div class="recommendation-card">
+                            <div class="recommendation-text">{r_text}</div>
+                            <div class="recommendation-evidence">Evidence: {evidence}</div>
+                            <div class="recommendation-confidence">Confidence: {confidence}</div>
                         </div>
                     """, unsafe_allow_html=True)
             else:
@@ -339,19 +412,19 @@ def show(analyses):
             # --- Card 1: Match Metrics ---
             with c1:
                 st.markdown("""
-                    <div style="background-color: #F8FAFC; padding: 15px; border-radius: 8px; border: 1px solid #E2E8F0; height: 100%;">
-                        <div style="font-weight: 600; color: #0F172A; margin-bottom: 10px;">📊 Match Metrics</div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
-                            <span style="color: #64748B;">Score:</span>
-                            <span style="font-weight: 600;">{score}</span>
+                    <div class="quality-card">
+                        <div class="quality-card-title">📊 Match Metrics</div>
+                        <div class="quality-metric">
+                            <span class="quality-metric-label">Score:</span>
+                            <span class="quality-metric-value">{score}</span>
                         </div>
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
-                            <span style="color: #64748B;">Clinical:</span>
-                            <span style="font-weight: 600;">{clinical}%</span>
+                        <div class="quality-metric">
+                            <span class="quality-metric-label">Clinical:</span>
+                            <span class="quality-metric-value">{clinical}%</span>
                         </div>
-                        <div style="display: flex; justify-content: space-between;">
-                            <span style="color: #64748B;">Genomic:</span>
-                            <span style="font-weight: 600;">{genomic}%</span>
+                        <div class="quality-metric">
+                            <span class="quality-metric-label">Genomic:</span>
+                            <span class="quality-metric-value">{genomic}%</span>
                         </div>
                     </div>
                 """.format(
@@ -364,26 +437,23 @@ def show(analyses):
             with c2:
                 guidance = analysis.get('use_for_treatment_guidance')
                 guidance_text = "Not Specified"
-                guidance_color = "#64748B" # Gray
-                bg_color = "#F1F5F9"
+                guidance_class = ""  # Gray
                 
                 if guidance is not None:
                     if isinstance(guidance, bool):
                         if guidance:
                             guidance_text = "Recommended"
-                            guidance_color = "#166534" # Green
-                            bg_color = "#F0FDF4"
+                            guidance_class = "recommended"  # Green
                         else:
                             guidance_text = "Not Recommended"
-                            guidance_color = "#991B1B" # Red
-                            bg_color = "#FEF2F2"
+                            guidance_class = "not-recommended"  # Red
                     else:
                         guidance_text = str(guidance)
                 
                 st.markdown(f"""
-                    <div style="background-color: {bg_color}; padding: 15px; border-radius: 8px; border: 1px solid {bg_color}; height: 100%; display: flex; flex-direction: column; justify-content: center; align-items: center; text-align: center;">
-                        <div style="font-weight: 600; color: #0F172A; margin-bottom: 5px;">Treatment Guidance</div>
-                        <div style="font-size: 1.1rem; font-weight: 700; color: {guidance_color};">
+                    <div class="quality-card guidance-card {guidance_class}">
+                        <div class="quality-card-title">Treatment Guidance</div>
+                        <div class="guidance-value">
                             {guidance_text}
                         </div>
                     </div>
@@ -393,9 +463,9 @@ def show(analyses):
             with c3:
                 assessment = match_quality.get('overall_assessment', 'No overall assessment provided.')
                 st.markdown(f"""
-                    <div style="background-color: #F8FAFC; padding: 15px; border-radius: 8px; border: 1px solid #E2E8F0; height: 100%;">
-                        <div style="font-weight: 600; color: #0F172A; margin-bottom: 5px;">📝 Overall Assessment</div>
-                        <div style="font-size: 0.9rem; color: #334155; line-height: 1.4;">
+                    <div class="quality-card">
+                        <div class="quality-card-title">📝 Overall Assessment</div>
+                        <div class="quality-card-text">
                             {assessment}
                         </div>
                     </div>
@@ -421,59 +491,14 @@ def show(analyses):
                     st.markdown(f"- {l}")
 
         # --- Deep Dive Navigation ---
-        st.markdown("""
-            <style>
-                /* Clinical - Red (Primary) */
-                div[data-testid="stButton"] button[kind="primary"] {
-                    background-color: #EF4444 !important;
-                    color: white !important;
-                    border-color: #EF4444 !important;
-                }
-                div[data-testid="stButton"] button[kind="primary"]:hover {
-                    background-color: #DC2626 !important;
-                    color: white !important;
-                    border-color: #DC2626 !important;
-                }
-                div[data-testid="stButton"] button[kind="primary"]:focus {
-                    background-color: #EF4444 !important;
-                    color: white !important;
-                    border-color: #EF4444 !important;
-                    box-shadow: none !important;
-                }
-                div[data-testid="stButton"] button[kind="primary"] p {
-                    color: white !important;
-                }
-
-                /* Genomic - Blue (Secondary) */
-                div[data-testid="stButton"] button[kind="secondary"] {
-                    background-color: #3B82F6 !important;
-                    color: white !important;
-                    border-color: #3B82F6 !important;
-                }
-                div[data-testid="stButton"] button[kind="secondary"]:hover {
-                    background-color: #2563EB !important;
-                    color: white !important;
-                    border-color: #2563EB !important;
-                }
-                div[data-testid="stButton"] button[kind="secondary"]:focus {
-                    background-color: #3B82F6 !important;
-                    color: white !important;
-                    border-color: #3B82F6 !important;
-                    box-shadow: none !important;
-                }
-                div[data-testid="stButton"] button[kind="secondary"] p {
-                    color: white !important;
-                }
-            </style>
-        """, unsafe_allow_html=True)
-
         st.markdown("### Deep Dive Analysis")
         
-        col1, col2 = st.columns(2)
+        # Keyed so the stylesheet can color only these buttons (.st-key-deep_dive_nav)
+        col1, col2 = st.container(key="deep_dive_nav").columns(2)
         
         with col1:
             with st.container(border=True):
-                st.markdown(f"<div style='text-align: center; margin-bottom: 8px;'><span style='color: #1E40AF; font-weight: bold; font-size: 1.1rem;'>Query Patient:</span> <span style='font-weight: bold; font-size: 1.1rem;'>{analysis['query_patient_id']}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='patient-heading'><span class='query-label'>Query Patient:</span> <span>{analysis['query_patient_id']}</span></div>", unsafe_allow_html=True)
                 
                 c1, c2 = st.columns(2)
                 with c1:
@@ -493,7 +518,7 @@ def show(analyses):
                 
         with col2:
             with st.container(border=True):
-                st.markdown(f"<div style='text-align: center; margin-bottom: 8px;'><span style='color: #166534; font-weight: bold; font-size: 1.1rem;'>Twin Patient:</span> <span style='font-weight: bold; font-size: 1.1rem;'>{analysis['twin_id']}</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='patient-heading'><span class='twin-label'>Twin Patient:</span> <span>{analysis['twin_id']}</span></div>", unsafe_allow_html=True)
                 
                 c3, c4 = st.columns(2)
                 with c3:
@@ -0,0 +1,60 @@
+import streamlit as st
+import plotly.express as px
+from utils.cna_matrix import cluster_order
+
+METRICS = {"Correlation": "correlation", "Euclidean distance": "euclidean"}
+
+def clustered_heatmap(frame, title, color_scale, zmin, zmax, symmetric=False):
+    # Both axes ordered so similar rows and columns sit together
+    rows = cluster_order(frame.to_numpy())
+    columns = rows if symmetric else cluster_order(frame.to_numpy().T)
+    frame = frame.iloc[rows, columns]
+    fig = px.imshow(frame, color_continuous_scale=color_scale, zmin=zmin, zmax=zmax, aspect='auto', title=title)
+    fig.update_layout(margin={'l': 10, 'r': 10, 't': 40, 'b': 10})
+    return fig
+
+def show(cna_matrix):
+    st.title("CNA Landscape")
+
+    if cna_matrix is None or len(cna_matrix) == 0 or not cna_matrix.genes:
+        st.info("No copy number alterations available.")
+        return
+
+    st.markdown(f"Copy-number profiles of **{len(cna_matrix)}** samples over **{len(cna_matrix.genes)}** genes "
+                f"(GISTIC values, -2 deep deletion to +2 amplification).")
+
+    col_patient, col_sample = st.columns(2)
+    with col_patient:
+        patient_id = st.selectbox("Patient", sorted(cna_matrix.patients), key="cna_patient")
+    with col_sample:
+        sample_id = st.selectbox("Sample", cna_matrix.samples_of(patient_id), key="cna_sample")
+    if not sample_id:
+        return
+    max_k = min(50, len(cna_matrix) - 1)
+    if max_k < 1:
+        st.info("Only one sample is available.")
+        return
+    col_metric, col_k = st.columns(2)
+    with col_metric:
+        metric_label = st.radio("Similarity", list(METRICS), horizontal=True, key="cna_metric")
+    with col_k:
+        k = st.slider("Similar samples", min_value=1, max_value=max_k, value=min(15, max_k),
+                      key="cna_k") if max_k > 1 else 1
+
+    similar = cna_matrix.most_similar(sample_id, k, METRICS[metric_label])
+    st.subheader(f"Samples Most Similar to {sample_id}")
+    st.dataframe(similar, hide_index=True, use_container_width=True)
+
+    sample_ids = [sample_id] + list(similar['sample_id'])
+    genes = cna_matrix.variable_genes(sample_ids)
+    if not genes:
+        st.info("None of these samples have copy number alterations.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(clustered_heatmap(cna_matrix.submatrix(sample_ids, genes), "Copy Number by Gene",
+                                          'RdBu_r', -2, 2), use_container_width=True)
+    with col2:
+        st.plotly_chart(clustered_heatmap(cna_matrix.correlation(sample_ids), "Sample Correlation",
+                                          'RdBu_r', -1, 1, symmetric=True), use_container_width=True)
@@ -1,29 +1,114 @@
-import streamlit as st
 import pandas as pd
+import streamlit as st
+import plotly.graph_objects as go
+from utils.prefetch import get_normalized_profile
+from utils.profile_store import get_clinical_profile
+from views.filter_panel import filtered_patient_ids
+
+EVENT_COLORS = {
+    'treatment': '#3B82F6',
+    'surgery': '#EA580C',
+    'radiation': '#9333EA',
+    'progression': '#DC2626',
+    'tumor_sites': '#16A34A',
+}
+
+def timeline_rows(events):
+    """One chart row per treatment line and per other event type."""
+    rows = events['event_type'].astype(str).str.replace('_', ' ').str.title()
+    is_line = (events['event_type'] == 'treatment') & events['line_number'].notna()
+    return rows.where(~is_line, 'Line ' + events['line_number'].astype('Int64').astype(str))
+
+def timeline_figure(events, rows):
+    """Gantt-style chart of an event table; `rows` gives each event's y-axis label."""
+    fig = go.Figure()
+    for event_type, color in EVENT_COLORS.items():
+        mask = (events['event_type'] == event_type).to_numpy()
+        if not mask.any():
+            continue
+        subset = events[mask]
+        # Point events get a one-day bar so they stay visible
+        fig.add_trace(go.Bar(
+            name=event_type.replace('_', ' ').title(),
+            y=rows[mask].to_numpy(), base=subset['start'], x=(subset['stop'] - subset['start']).clip(lower=1),
+            orientation='h', marker_color=color, text=subset['label'], textposition='inside',
+            hovertemplate='%{text}<br>Day %{base} to %{customdata}<extra></extra>',
+            customdata=subset['stop'],
+        ))
+    fig.update_layout(barmode='overlay', height=max(250, 28 * len(set(rows)) + 120),
+                      xaxis_title="Days", yaxis={'autorange': 'reversed'},
+                      margin={'l': 10, 'r': 10, 't': 30, 'b': 10})
+    return fig
+
+def event_query_anchors(timeline):
+    """(label, event type, column filters) for each thing an event can happen during."""
+    treatments = timeline.events[timeline.select('treatment')]
+    anchors = [(f"Treatment line {int(line)}", 'treatment', {'line_number': line})
+               for line in sorted(treatments['line_number'].dropna().unique())]
+    anchors += [(f"{agent} treatment", 'treatment', {'label': agent})
+                for agent in sorted(treatments['label'].dropna().astype(str).unique())]
+    anchors += [(f"Any {event_type.replace('_', ' ')}", event_type, {})
+                for event_type in EVENT_COLORS if timeline.select(event_type).any()]
+    return anchors
 
-def show(patient_profiles):
+def show_event_query(timeline, key):
+    """Lists the events of one type that overlap a treatment line, an agent or another event type."""
+    event_types = [t for t in EVENT_COLORS if timeline.select(t).any()]
+    anchors = event_query_anchors(timeline)
+    col1, col2 = st.columns(2)
+    event_type = col1.selectbox("Events", event_types, format_func=lambda t: t.replace('_', ' ').title(),
+                                index=event_types.index('progression') if 'progression' in event_types else 0,
+                                key=f"{key}_type")
+    by_label = {label: (with_type, where) for label, with_type, where in anchors}
+    label = col2.selectbox("During", list(by_label), key=f"{key}_during")
+    if label is None:
+        return
+    with_type, where = by_label[label]
+    matches = timeline.concurrent(event_type, with_type, **where)
+    # Not the anchor itself when looking for e.g. treatments during a treatment line
+    if event_type == with_type:
+        matches = matches[~timeline.select(with_type, **where)[matches.index]]
+    if matches.empty:
+        st.info(f"No {event_type.replace('_', ' ')} events during {label.lower()}.")
+    else:
+        st.dataframe(pd.DataFrame({
+            'Event': matches['label'].astype(str),
+            'Start day': matches['start'],
+            'Stop day': matches['stop'],
+            'Line': matches['line_number'].astype('Int64'),
+        }), use_container_width=True, hide_index=True)
+
+def show(patient_profiles, data_version=0):
     st.title("Clinical Deep Dive")
 
     # Patient Selection
-    patient_ids = sorted(list(patient_profiles.keys()))
+    # Narrowed by the filter panel; the full sorted list when filtering is off
+    patient_ids = filtered_patient_ids(patient_profiles, "deep_dive_filter", data_version)
     
     # Initialize session state for patient selection if not present
     if "deep_dive_patient_id" not in st.session_state:
         st.session_state.deep_dive_patient_id = None
+
+    # A patient opened from another data partition isn't listed yet
+    requested_id = st.session_state.deep_dive_patient_id
+    if requested_id and requested_id not in patient_ids and requested_id in patient_profiles:
+        patient_ids = sorted(patient_ids + [requested_id])
         
-    # Use index to set default value if in session state
-    index = 0
-    if st.session_state.deep_dive_patient_id in patient_ids:
-        index = patient_ids.index(st.session_state.deep_dive_patient_id)
+    # The selection is set through the widget's key only, as the buttons that open this page do;
+    # a default index as well would conflict with it
+    if st.session_state.get("deep_dive_patient_select") not in patient_ids:
+        st.session_state.deep_dive_patient_select = (
+            requested_id if requested_id in patient_ids else patient_ids[0] if patient_ids else None)
         
-    selected_patient_id = st.selectbox("Select Patient ID", patient_ids, index=index, key="deep_dive_patient_select")
+    selected_patient_id = st.selectbox("Select Patient ID", patient_ids, key="deep_dive_patient_select")
     
     # Update session state when selection changes
     if selected_patient_id:
         st.session_state.deep_dive_patient_id = selected_patient_id
 
     if selected_patient_id:
-        profile = patient_profiles[selected_patient_id]
+        profile = get_clinical_profile(patient_profiles, selected_patient_id)
+        tables = get_normalized_profile(patient_profiles, selected_patient_id)
         clinical_data = profile.get('clinical', {})
         
         st.header(f"Patient: {selected_patient_id}")
@@ -66,14 +151,8 @@ def show(patient_profiles):
         
         # Treatments
         st.subheader("Treatments")
-        # Try nested structure first (Schema A)
-        treatments = profile.get('treatments', {}).get('drug_therapy', {}).get('lines', [])
-        # Fallback to flat structure (Schema B)
-        if not treatments:
-            treatments = profile.get('treatment', [])
-            
-        if treatments:
-            df_treatments = pd.DataFrame(treatments)
+        df_treatments = tables['treatments']
+        if not df_treatments.empty:
             # Select and rename columns for better display
             display_cols = ['start_date_days', 'stop_date_days', 'agent', 'subtype', 'investigative', 'line_number']
             # Filter to only existing columns
@@ -82,44 +161,46 @@ def show(patient_profiles):
         else:
             st.info("No treatment data available.")
 
+        # Combined timeline of treatment lines and timeline events
+        st.subheader("Patient Timeline")
+        events = tables['events'].events
+        if not events.empty:
+            st.plotly_chart(timeline_figure(events, timeline_rows(events)), use_container_width=True)
+            with st.expander("Events during a treatment line or event"):
+                show_event_query(tables['events'], "deep_dive_event_query")
+        else:
+            st.info("No dated events available.")
+
         # Timeline Events (Surgery, Radiation, etc.)
         st.subheader("Timeline Events")
         
-        # Helper to get timeline events from either nested or flat structure
-        def get_timeline_events(profile, key):
-            # Try nested in 'timeline' first (Schema A)
-            events = profile.get('timeline', {}).get(key, [])
-            # Fallback to top-level (Schema B)
-            if not events:
-                events = profile.get(key, [])
-            return events
-
+        timeline = tables['timeline']
         tabs = st.tabs(["Surgery", "Radiation", "Progression", "Tumor Sites"])
         
         with tabs[0]:
-            surgeries = get_timeline_events(profile, 'surgery')
-            if surgeries:
-                st.dataframe(pd.DataFrame(surgeries), use_container_width=True)
+            surgeries = timeline['surgery']
+            if not surgeries.empty:
+                st.dataframe(surgeries, use_container_width=True)
             else:
                 st.info("No surgery events.")
                 
         with tabs[1]:
-            radiation = get_timeline_events(profile, 'radiation')
-            if radiation:
-                st.dataframe(pd.DataFrame(radiation), use_container_width=True)
+            radiation = timeline['radiation']
+            if not radiation.empty:
+                st.dataframe(radiation, use_container_width=True)
             else:
                 st.info("No radiation events.")
                 
         with tabs[2]:
-            progression = get_timeline_events(profile, 'progression')
-            if progression:
-                st.dataframe(pd.DataFrame(progression), use_container_width=True)
+            progression = timeline['progression']
+            if not progression.empty:
+                st.dataframe(progression, use_container_width=True)
             else:
                 st.info("No progression events.")
                 
         with tabs[3]:
-            tumor_sites = get_timeline_events(profile, 'tumor_sites')
-            if tumor_sites:
-                st.dataframe(pd.DataFrame(tumor_sites), use_container_width=True)
+            tumor_sites = timeline['tumor_sites']
+            if not tumor_sites.empty:
+                st.dataframe(tumor_sites, use_container_width=True)
             else:
                 st.info("No tumor site records.")
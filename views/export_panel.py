@@ -0,0 +1,35 @@
+import os
+import tempfile
+import streamlit as st
+from utils.export import EXPORT_FORMATS, export_pairs, export_variants, involved_patients, parquet_available
+
+FORMAT_LABELS = {'parquet': "Parquet", 'csv': "CSV"}
+MIME_TYPES = {'parquet': "application/vnd.apache.parquet", 'csv': "text/csv"}
+
+def export_file(write, fmt):
+    """Runs `write(path, fmt)` into a temporary file and returns the file opened for the download."""
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        write(path, fmt)
+        return open(path, 'rb')
+    finally:
+        # The open handle keeps the data readable until the download has read it
+        os.remove(path)
+
+def export_popover(analyses, patient_profiles):
+    """Export popover for the pairs listed in the pair selector; files are written only when downloaded."""
+    with st.popover("Export", use_container_width=True):
+        formats = [f for f in EXPORT_FORMATS if f != 'parquet' or parquet_available()]
+        fmt = st.radio("Format", formats, format_func=FORMAT_LABELS.get, horizontal=True, key="export_format")
+        st.caption(f"{len(analyses)} pair(s) listed in the selector. "
+                   f"Use `export_data.py` for exports of millions of rows.")
+        st.download_button("Download pairs", data=lambda: export_file(
+                               lambda path, fmt: export_pairs(analyses, path, fmt), fmt),
+                           file_name=f"twin_pairs.{fmt}", mime=MIME_TYPES[fmt], on_click="ignore",
+                           key="export_pairs", use_container_width=True)
+        st.download_button("Download variants of these patients", data=lambda: export_file(
+                               lambda path, fmt: export_variants(patient_profiles, involved_patients(analyses),
+                                                                 path, fmt), fmt),
+                           file_name=f"twin_variants.{fmt}", mime=MIME_TYPES[fmt], on_click="ignore",
+                           key="export_variants", use_container_width=True)
@@ -0,0 +1,64 @@
+import streamlit as st
+from utils.filters import pair_filter_index, patient_filter_index, sorted_patient_ids, PATIENT_FIELDS
+
+PAIR_RANGES = [("Similarity score", 'similarity_score'), ("Clinical match %", 'clinical_pct'),
+               ("Genomic match %", 'genomic_pct')]
+
+def value_filter(index, field, label, key, filters):
+    values = index.values(field)
+    if not values:
+        return
+    selected = st.multiselect(label, values, format_func=lambda v: f"{v} ({index.count(field, v)})", key=key)
+    if selected:
+        filters[field] = selected
+
+def range_filter(index, field, label, key, filters):
+    bounds = index.range(field)
+    if bounds is None or bounds[0] == bounds[1]:
+        return
+    selected = st.slider(label, bounds[0], bounds[1], bounds, key=key)
+    if tuple(selected) != bounds:
+        filters[field] = selected
+
+def patient_filters(index, key):
+    """Widgets for the patient fields; returns the filter dict for index.mask()."""
+    filters = {}
+    range_filter(index, 'Age', "Age", f"{key}_age", filters)
+    for label, _, field in PATIENT_FIELDS:
+        value_filter(index, label, label, f"{key}_{field}", filters)
+    return filters
+
+def get_patient_index(patient_profiles, data_version):
+    # Reads every clinical profile once per data version
+    with st.spinner("Indexing patients for filtering..."):
+        return patient_filter_index(patient_profiles, data_version)
+
+def pair_filter_mask(analyses, patient_profiles, data_version=0):
+    """Filter panel for the pair selector; returns a boolean mask over `analyses`, or None if off."""
+    if not st.toggle("Filter pairs", key="pair_filter_enabled"):
+        return None
+    index = pair_filter_index(analyses, data_version)
+    with st.expander("Pair filters", expanded=True):
+        filters = {}
+        value_filter(index, 'grade', "Match grade", "pair_filter_grade", filters)
+        value_filter(index, 'shared_gene', "Shared gene", "pair_filter_gene", filters)
+        for label, field in PAIR_RANGES:
+            range_filter(index, field, label, f"pair_filter_{field}", filters)
+        patient_index = query_filters = None
+        if st.checkbox("Filter by query patient", key="pair_filter_by_query"):
+            patient_index = get_patient_index(patient_profiles, data_version)
+            query_filters = patient_filters(patient_index, "pair_filter_query")
+        mask = index.mask(filters, patient_index, query_filters)
+        st.caption(f"{int(mask.sum())} of {int(index.live.sum())} pairs match")
+    return mask
+
+def filtered_patient_ids(patient_profiles, key, data_version=0):
+    """Filter panel for a patient selector; returns the matching patient ids, sorted."""
+    if not st.toggle("Filter patients", key=f"{key}_enabled"):
+        # Sorted once per data version, not on every rerun
+        return sorted_patient_ids(patient_profiles, data_version)
+    index = get_patient_index(patient_profiles, data_version)
+    with st.expander("Patient filters", expanded=True):
+        patient_ids = index.matching(patient_filters(index, key))
+        st.caption(f"{len(patient_ids)} of {len(index)} patients match")
+    return patient_ids
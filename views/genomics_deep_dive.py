@@ -2,32 +2,40 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from utils.prefetch import get_sample_overview, get_sample_tables
+from views.filter_panel import filtered_patient_ids
 
-def show(patient_profiles):
+def show(patient_profiles, data_version=0):
     st.title("Genomics Deep Dive")
     
     # Patient Selection
-    patient_ids = sorted(list(patient_profiles.keys()))
+    # Narrowed by the filter panel; the full sorted list when filtering is off
+    patient_ids = filtered_patient_ids(patient_profiles, "genomics_filter", data_version)
     
     # Initialize session state for patient selection if not present
     if "genomics_patient_id" not in st.session_state:
         st.session_state.genomics_patient_id = None
+
+    # A patient opened from another data partition isn't listed yet
+    requested_id = st.session_state.genomics_patient_id
+    if requested_id and requested_id not in patient_ids and requested_id in patient_profiles:
+        patient_ids = sorted(patient_ids + [requested_id])
         
-    # Use index to set default value if in session state
-    index = 0
-    if st.session_state.genomics_patient_id in patient_ids:
-        index = patient_ids.index(st.session_state.genomics_patient_id)
+    # The selection is set through the widget's key only, as the buttons that open this page do;
+    # a default index as well would conflict with it
+    if st.session_state.get("genomics_patient_select") not in patient_ids:
+        st.session_state.genomics_patient_select = (
+            requested_id if requested_id in patient_ids else patient_ids[0] if patient_ids else None)
         
-    selected_patient_id = st.selectbox("Select Patient ID", patient_ids, index=index, key="genomics_patient_select")
+    selected_patient_id = st.selectbox("Select Patient ID", patient_ids, key="genomics_patient_select")
     
     # Update session state when selection changes
     if selected_patient_id:
         st.session_state.genomics_patient_id = selected_patient_id
     
     if selected_patient_id:
-        profile = patient_profiles[selected_patient_id]
-        genomics = profile.get('genomics', {})
-        samples = genomics.get('samples', {})
+        # Sample info and variant counts only; variants are read per selected sample
+        samples = get_sample_overview(patient_profiles, selected_patient_id)
         
         if not samples:
             st.warning(f"No genomic samples found for patient {selected_patient_id}")
@@ -38,7 +46,8 @@ def show(patient_profiles):
         if len(sample_ids) == 1:
             # Single sample - show directly
             st.subheader(f"Genomic Profile: {sample_ids[0]}")
-            show_sample_data(sample_ids[0], samples[sample_ids[0]])
+            show_sample_data(sample_ids[0], samples[sample_ids[0]],
+                             get_sample_tables(patient_profiles, selected_patient_id, sample_ids[0]))
         else:
             # Multiple samples - show timeline and allow selection
             st.subheader(f"Found {len(sample_ids)} samples for patient {selected_patient_id}")
@@ -57,7 +66,8 @@ def show(patient_profiles):
             
             if selected_sample_id:
                 st.subheader(f"Detailed Genomic Profile: {selected_sample_id}")
-                show_sample_data(selected_sample_id, samples[selected_sample_id])
+                show_sample_data(selected_sample_id, samples[selected_sample_id],
+                                 get_sample_tables(patient_profiles, selected_patient_id, selected_sample_id))
 
 def show_sample_timeline(samples):
     """Display samples in a timeline view with genomic alteration counts."""
@@ -65,18 +75,18 @@ def show_sample_timeline(samples):
     timeline_data = []
     for i, (sample_id, data) in enumerate(samples.items()):
         sample_info = data.get('sample_info', {})
-        mutations = data.get('mutations', [])
-        cnas = data.get('copy_number_alterations', [])
-        svs = data.get('structural_variants', [])
+        mutations = data.get('mutations', 0)
+        cnas = data.get('copy_number_alterations', 0)
+        svs = data.get('structural_variants', 0)
         
         timeline_data.append({
             'Sample': sample_id,
             'Type': sample_info.get('sample_type', 'Unknown'),
             'Cancer Type': sample_info.get('cancer_type_detailed', 'Unknown'),
-            'Mutations': len(mutations),
-            'CNAs': len(cnas),
-            'SVs': len(svs),
-            'Total': len(mutations) + len(cnas) + len(svs)
+            'Mutations': mutations,
+            'CNAs': cnas,
+            'SVs': svs,
+            'Total': mutations + cnas + svs
         })
     
     df_timeline = pd.DataFrame(timeline_data)
@@ -107,47 +117,36 @@ def show_sample_timeline(samples):
     fig.update_layout(barmode='group', xaxis_title='Sample', yaxis_title='Count', height=400)
     st.plotly_chart(fig, use_container_width=True)
 
-def show_sample_data(sample_id, sample_data):
-    """Display detailed genomic data for a specific sample."""
+def show_sample_data(sample_id, sample_data, tables):
+    """Display detailed genomic data for a specific sample.
+
+    `sample_data` is the sample's entry in the sample index (sample_info and
+    variant counts), `tables` its normalized variant DataFrames.
+    """
     
     # Create tabs for different genomic data types
     tab1, tab2, tab3, tab4 = st.tabs(["Mutations", "Copy Number Alterations", "Structural Variants", "Summary"])
     
     with tab1:
-        show_mutations(sample_data.get('mutations', []))
+        show_mutations(tables['mutations'])
     
     with tab2:
-        show_cna(sample_data.get('copy_number_alterations', []))
+        show_cna(tables['cna'])
     
     with tab3:
-        show_sv(sample_data.get('structural_variants', []))
+        show_sv(tables['sv'])
     
     with tab4:
         show_summary(sample_id, sample_data)
 
-def show_mutations(mutations_list):
-    """Display mutation data."""
+def show_mutations(df):
+    """Display mutation data (already renamed by utils.normalize)."""
     st.markdown("### Mutations")
     
-    if not mutations_list:
+    if df.empty:
         st.warning("No mutation data available.")
         return
     
-    # Convert to DataFrame and map columns
-    df = pd.DataFrame(mutations_list)
-    
-    # Rename columns to match expected display format
-    column_map = {
-        'gene': 'hugo_symbol',
-        'protein_change': 'HGVSp_Short',
-        'variant_classification': 'variant_classification',
-        'chromosome': 'chromosome',
-        'position': 'start_position',
-        'ref_allele': 'reference_allele',
-        'alt_allele': 'tumor_seq_allele2'
-    }
-    df = df.rename(columns=column_map)
-    
     # Display key metrics
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Mutations", len(df))
@@ -164,6 +163,8 @@ def show_mutations(mutations_list):
     if 'variant_classification' in df.columns:
         st.markdown("#### Variant Classification Distribution")
         variant_counts = df['variant_classification'].value_counts()
+        # Categorical columns also count vocabulary entries absent from this sample
+        variant_counts = variant_counts[variant_counts > 0]
         fig = px.bar(x=variant_counts.index, y=variant_counts.values,
                      labels={'x': 'Variant Classification', 'y': 'Count'},
                      title='Distribution of Variant Types',
@@ -174,7 +175,8 @@ def show_mutations(mutations_list):
     # Top mutated genes
     if 'hugo_symbol' in df.columns:
         st.markdown("#### Top Mutated Genes")
-        gene_counts = df['hugo_symbol'].value_counts().head(10)
+        gene_counts = df['hugo_symbol'].value_counts()
+        gene_counts = gene_counts[gene_counts > 0].head(10)
         fig = px.bar(x=gene_counts.values, y=gene_counts.index, orientation='h',
                      labels={'x': 'Number of Mutations', 'y': 'Gene'},
                      title='Top 10 Mutated Genes',
@@ -196,24 +198,14 @@ def show_mutations(mutations_list):
     else:
         st.dataframe(df, use_container_width=True, height=400)
 
-def show_cna(cna_list):
-    """Display copy number alteration data."""
+def show_cna(df):
+    """Display copy number alteration data (already renamed by utils.normalize)."""
     st.markdown("### Copy Number Alterations (CNA)")
     
-    if not cna_list:
+    if df.empty:
         st.info("No CNA data available.")
         return
     
-    df = pd.DataFrame(cna_list)
-    
-    # Rename columns
-    column_map = {
-        'gene': 'Hugo_Symbol',
-        'alteration_type': 'Alteration_Type',
-        'gistic_value': 'GISTIC_value'
-    }
-    df = df.rename(columns=column_map)
-    
     # Display key metrics
     col1, col2, col3 = st.columns(3)
     col1.metric("Total CNAs", len(df))
@@ -228,6 +220,7 @@ def show_cna(cna_list):
     if 'Alteration_Type' in df.columns:
         st.markdown("#### CNA Type Distribution")
         cna_counts = df['Alteration_Type'].value_counts()
+        cna_counts = cna_counts[cna_counts > 0]
         fig = px.pie(values=cna_counts.values, names=cna_counts.index,
                      title='Distribution of CNA Types',
                      color_discrete_sequence=px.colors.qualitative.Set3)
@@ -243,26 +236,14 @@ def show_cna(cna_list):
     else:
         st.dataframe(df, use_container_width=True, height=400)
 
-def show_sv(sv_list):
-    """Display structural variant data."""
+def show_sv(df):
+    """Display structural variant data (already renamed by utils.normalize)."""
     st.markdown("### Structural Variants (SV)")
     
-    if not sv_list:
+    if df.empty:
         st.info("No SV data available.")
         return
     
-    df = pd.DataFrame(sv_list)
-    
-    # Rename columns
-    column_map = {
-        'site1_gene': 'SITE1_HUGO_SYMBOL',
-        'site2_gene': 'SITE2_HUGO_SYMBOL',
-        'sv_type': 'SV_STATUS',
-        'site1_chromosome': 'SITE1_CHROMOSOME',
-        'site2_chromosome': 'SITE2_CHROMOSOME'
-    }
-    df = df.rename(columns=column_map)
-    
     # Display key metrics
     col1, col2 = st.columns(2)
     col1.metric("Total SVs", len(df))
@@ -286,21 +267,21 @@ def show_summary(sample_id, sample_data):
     """Display summary of all genomic alterations."""
     st.markdown("### Genomic Summary")
     
-    mutations = sample_data.get('mutations', [])
-    cnas = sample_data.get('copy_number_alterations', [])
-    svs = sample_data.get('structural_variants', [])
+    mutations = sample_data.get('mutations', 0)
+    cnas = sample_data.get('copy_number_alterations', 0)
+    svs = sample_data.get('structural_variants', 0)
     
     # Display summary metrics
     col1, col2, col3 = st.columns(3)
-    col1.metric("Mutations", len(mutations))
-    col2.metric("CNAs", len(cnas))
-    col3.metric("SVs", len(svs))
+    col1.metric("Mutations", mutations)
+    col2.metric("CNAs", cnas)
+    col3.metric("SVs", svs)
     
     # Create summary visualization
     st.markdown("#### Genomic Alteration Overview")
     summary_data = pd.DataFrame({
         'Type': ['Mutations', 'CNAs', 'SVs'],
-        'Count': [len(mutations), len(cnas), len(svs)]
+        'Count': [mutations, cnas, svs]
     })
     
     fig = px.bar(summary_data, x='Type', y='Count',
@@ -0,0 +1,55 @@
+import streamlit as st
+import pandas as pd
+from utils.data_loader import analysis_id
+from utils.ranking import pair_ranking
+
+SORT_OPTIONS = {"Rank": "rank", "Similarity score": "score"}
+
+def open_analysis(key):
+    st.session_state.analysis_select = key
+    st.session_state.navigation = "Analysis Detail"
+
+def show(analyses, data_version=0):
+    st.title("Twin Leaderboard")
+
+    if not analyses:
+        st.info("No analyses available.")
+        return
+
+    ranking = pair_ranking(analyses, data_version)
+    col_patient, col_sort, col_k = st.columns([2, 1, 1])
+    with col_sort:
+        sort_label = st.radio("Sort twins by", list(SORT_OPTIONS), key="leaderboard_sort", horizontal=True)
+    leaderboard = ranking.leaderboard(SORT_OPTIONS[sort_label])
+    with col_patient:
+        query_id = st.selectbox("Query Patient", leaderboard.query_ids, key="leaderboard_query",
+                                format_func=lambda pid: f"{pid} ({leaderboard.twin_count(pid)} twins)")
+    with col_k:
+        top_k = st.number_input("Top twins", min_value=1, max_value=100, value=10, key="leaderboard_k")
+
+    st.markdown(f"Query patients: **{len(leaderboard.query_ids)}** · pairs: **{len(ranking)}**")
+    twins = leaderboard.top_analyses(query_id, int(top_k))
+    if not twins:
+        st.info("No twins for this patient.")
+        return
+
+    table = pd.DataFrame([{
+        'Position': position,
+        'Twin': a.get('twin_id'),
+        'Rank': a.get('rank'),
+        'Similarity': pd.to_numeric(a.get('similarity_score'), errors='coerce'),
+        'Clinical %': pd.to_numeric(a.get('clinical_pct'), errors='coerce'),
+        'Genomic %': pd.to_numeric(a.get('genomic_pct'), errors='coerce'),
+        'Grade': (a.get('match_quality') or {}).get('grade'),
+    } for position, a in enumerate(twins, start=1)])
+    st.dataframe(table, hide_index=True, use_container_width=True)
+
+    # Drill down into the existing detail view
+    st.subheader("Open a Pair")
+    for position, a in enumerate(twins, start=1):
+        col_label, col_open = st.columns([5, 1])
+        with col_label:
+            st.markdown(f"**{position}.** {a['query_patient_id']} ↔ {a['twin_id']} (Rank #{a.get('rank')})")
+        with col_open:
+            key = analysis_id(a)
+            st.button("Open", key=f"leaderboard_open_{key}", on_click=open_analysis, args=(key,))
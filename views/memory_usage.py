@@ -0,0 +1,40 @@
+import resource
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+
+def show(governor):
+    st.title("Memory Usage")
+    st.caption("Estimated footprint of the in-process caches. Set TWIN_MEMORY_BUDGET_MB to change the budget.")
+
+    used = governor.used_bytes
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    cols = st.columns(4)
+    cols[0].metric("Budget", format_bytes(governor.budget_bytes))
+    cols[1].metric("Accounted", format_bytes(used))
+    cols[2].metric("Budget Used", f"{100 * used / governor.budget_bytes:.1f}%")
+    cols[3].metric("Peak RSS", format_bytes(peak_rss))
+
+    usage = governor.usage()
+    if usage.empty:
+        st.info("Nothing cached yet.")
+        return
+
+    st.subheader("By Cache")
+    fig = px.bar(usage, x='bytes', y='cache', orientation='h', labels={'bytes': 'Bytes', 'cache': 'Cache'})
+    fig.update_layout(yaxis={'autorange': 'reversed'}, margin={'l': 10, 'r': 10, 't': 10, 'b': 10}, height=250)
+    st.plotly_chart(fig, use_container_width=True)
+    display = usage.assign(size=usage['bytes'].map(format_bytes), pinned=usage['pinned_bytes'].map(format_bytes))
+    st.dataframe(display[['cache', 'entries', 'size', 'pinned', 'evictions']], use_container_width=True, hide_index=True)
+
+    st.subheader("Largest Entries")
+    largest = pd.DataFrame(governor.largest(), columns=['cache', 'key', 'bytes', 'pinned'])
+    largest['size'] = largest['bytes'].map(format_bytes)
+    st.dataframe(largest[['cache', 'key', 'size', 'pinned']], use_container_width=True, hide_index=True)
@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+import streamlit as st
+from utils.disk_cache import file_digest
+
+# static/ next to app.py is served at app/static/ when server.enableStaticServing is on
+STYLESHEET = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / "static" / "styles.css"
+
+def apply_styles():
+    """Links the app's stylesheet. The browser fetches it once and caches it, so each rerun only sends the link."""
+    if st.get_option("server.enableStaticServing"):
+        # The content hash changes the URL whenever the file does, so a cached copy is never stale
+        version = file_digest(str(STYLESHEET))[:12]
+        st.markdown(f'<link rel="stylesheet" href="app/static/styles.css?v={version}">', unsafe_allow_html=True)
+    else:
+        # Without static serving the whole sheet has to go out with every rerun
+        st.html(STYLESHEET)
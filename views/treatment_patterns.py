@@ -0,0 +1,61 @@
+import streamlit as st
+import plotly.express as px
+
+def matrix_heatmap(matrix, title, x_label, y_label):
+    fig = px.imshow(matrix, text_auto=True, color_continuous_scale='Blues', aspect='auto',
+                    labels={'x': x_label, 'y': y_label, 'color': 'Count'}, title=title)
+    fig.update_layout(margin={'l': 10, 'r': 10, 't': 40, 'b': 10})
+    return fig
+
+def show(treatment_matrices):
+    st.title("Treatment Patterns")
+
+    if treatment_matrices is None or len(treatment_matrices.agents) == 0:
+        st.info("No treatment lines available.")
+        return
+
+    st.markdown(f"Treatment lines of **{treatment_matrices.patient_count}** patients, "
+                f"**{len(treatment_matrices.agents)}** distinct agents.")
+
+    max_agents = len(treatment_matrices.agents)
+    n_agents = st.slider("Agents shown", min_value=1, max_value=max_agents, value=min(15, max_agents),
+                         key="treatment_patterns_agents") if max_agents > 1 else 1
+    agents = treatment_matrices.top_agents(n_agents)
+
+    # Cohort-wide matrices
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(matrix_heatmap(treatment_matrices.cooccurrence.loc[agents, agents],
+                                       "Agent Co-occurrence (patients)", "Agent", "Agent"),
+                        use_container_width=True)
+    with col2:
+        st.plotly_chart(matrix_heatmap(treatment_matrices.transitions.loc[agents, agents],
+                                       "Line Transitions", "Next line", "Line"),
+                        use_container_width=True)
+
+    # Aggregated over one query patient's twins
+    st.subheader("Treatments Received by Twins")
+    query_ids = treatment_matrices.query_patients()
+    if not query_ids:
+        st.info("No twin analyses available.")
+        return
+    query_id = st.selectbox("Query Patient", query_ids, key="treatment_patterns_query")
+    twin_ids = treatment_matrices.twin_ids(query_id)
+    counts = treatment_matrices.twin_summary(query_id)
+    st.caption(f"{len(twin_ids)} twin(s): {', '.join(map(str, twin_ids))}")
+    if counts.empty:
+        st.info("None of this patient's twins have treatment lines.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.bar(x=counts.values, y=counts.index, orientation='h',
+                     labels={'x': 'Twins', 'y': 'Agent'}, title="Agents Across Twins")
+        fig.update_layout(yaxis={'autorange': 'reversed'}, margin={'l': 10, 'r': 10, 't': 40, 'b': 10})
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        _, transitions = treatment_matrices.for_patients(twin_ids)
+        twin_agents = counts.index
+        st.plotly_chart(matrix_heatmap(transitions.loc[twin_agents, twin_agents],
+                                       "Line Transitions Among Twins", "Next line", "Line"),
+                        use_container_width=True)